@@ -0,0 +1,228 @@
+"""Batch chat: many requests through the registered agents at once."""
+
+import argparse
+import asyncio
+import sys
+from typing import AsyncIterator, Iterable
+from pydantic import BaseModel, ValidationError
+from pydantic_ai.messages import ModelMessage
+from app.config import get_settings
+from app.logs import get_logger, configure_logfire
+from app.db.core import new_async_session
+from app.db.replicas import replicas
+from app.agents.chat import ChatRequest, ChatResponse
+from app.agents.concurrency import Overloaded
+from app.agents.idempotency import chat_results
+from app.agents.persistence import save_turns
+from app.agents.registry import AgentRegistry
+from app.agents.write_behind import ThreadKey, TurnWriter, write_behind
+
+logger = get_logger(__name__)
+
+# Attempts for a request rejected by admission control
+OVERLOAD_RETRIES = 5
+
+class BatchRequest(BaseModel):
+    """A batch of chat requests."""
+    requests: list[ChatRequest]
+    concurrency: int | None = None  # Defaults to BATCH_CONCURRENCY
+
+class BatchResult(BaseModel):
+    """The response to one request of a batch, tagged with its index in the batch."""
+    index: int
+    response: ChatResponse
+
+class BatchWriter:
+    """
+    Groups the turns of a batch into shared commits.
+    Turns are buffered and written with one `save_turns` call once enough
+    have piled up, when a thread with buffered turns is read again, or when
+    the batch ends. A failed write doesn't fail the turn that triggered it,
+    it's reported to every turn that was in it through `written`.
+    """
+
+    def __init__(self, batch_size: int):
+        self.batch_size = batch_size
+        self._turns: list[tuple[int, list[ModelMessage]]] = []
+        self._keys: set[ThreadKey] = set()
+        self._lock = asyncio.Lock()
+        # Resolves to None once the buffered turns are written, or to the error
+        self._done: asyncio.Future[str | None] | None = None
+        self._written: dict[ThreadKey, asyncio.Future[str | None]] = {}
+
+    async def put(self, key: ThreadKey, thread_id: int, messages: list[ModelMessage]) -> None:
+        """Buffer a turn, writing the buffer once it's full."""
+        if self._done is None:
+            self._done = asyncio.get_running_loop().create_future()
+        self._turns.append((thread_id, messages))
+        self._keys.add(key)
+        self._written[key] = self._done
+        if len(self._turns) >= self.batch_size:
+            await self.flush()
+
+    def written(self, key: ThreadKey) -> asyncio.Future[str | None] | None:
+        """Take the write of the thread's last buffered turn, None if it has none."""
+        return self._written.pop(key, None)
+
+    async def wait_for(self, key: ThreadKey) -> None:
+        """Write the buffer if it holds turns of the thread, so a database read sees them."""
+        async with self._lock:
+            if key in self._keys:
+                await self._flush()
+
+    async def flush(self) -> None:
+        """Write all buffered turns."""
+        async with self._lock:
+            await self._flush()
+
+    async def _flush(self) -> None:
+        turns, self._turns = self._turns, []
+        keys, self._keys = self._keys, set()
+        done, self._done = self._done, None
+        if not turns:
+            return
+        try:
+            async with new_async_session() as session:
+                await session.run_sync(save_turns, turns)
+                await session.commit()
+        except Exception as e:
+            logger.error("Failed to write batch turns", count=len(turns), error=str(e))
+            done.set_result(str(e))
+            return
+        for user_id, _ in keys:
+            replicas.wrote(user_id=user_id)
+        for thread_id, _ in turns:
+            replicas.wrote(thread_id=thread_id)
+        done.set_result(None)
+        logger.debug("Wrote batch turns", count=len(turns))
+
+async def run_batch(requests: list[ChatRequest], concurrency: int | None = None) -> AsyncIterator[BatchResult]:
+    """
+    Run chat requests with at most `concurrency` in flight, yielding results
+    in completion order. Requests on the same thread run one after another
+    in input order, the others in parallel. With batched writes a result is
+    only yielded once its turn is written, and carries the error if that
+    write failed.
+    """
+    settings = get_settings()
+    concurrency = min(concurrency or settings.BATCH_CONCURRENCY, settings.BATCH_MAX_CONCURRENCY)
+    writer: TurnWriter = write_behind if write_behind.running else BatchWriter(settings.BATCH_WRITE_SIZE)
+
+    threads: dict[ThreadKey, list[int]] = {}
+    for index, request in enumerate(requests):
+        threads.setdefault((request.user_id, request.agent_id), []).append(index)
+
+    slots = asyncio.Semaphore(concurrency)
+    results: asyncio.Queue[BatchResult] = asyncio.Queue()
+
+    def deliver(index: int, response: ChatResponse, written: asyncio.Future[str | None]) -> None:
+        error = written.result()
+        if error is not None:
+            response = response.model_copy(update={"error": f"Failed to save the turn: {error}"})
+        results.put_nowait(BatchResult(index=index, response=response))
+
+    async def run_thread(indexes: list[int]) -> None:
+        for index in indexes:
+            request = requests[index]
+            async with slots:
+                response = await _chat(request, writer)
+            written = writer.written((request.user_id, request.agent_id)) if isinstance(writer, BatchWriter) else None
+            if written is None:
+                await results.put(BatchResult(index=index, response=response))
+            else:
+                written.add_done_callback(lambda done, index=index, response=response: deliver(index, response, done))
+
+    async def flush_after(runners: list[asyncio.Task]) -> None:
+        await asyncio.gather(*runners, return_exceptions=True)
+        await writer.flush()
+
+    tasks = [asyncio.create_task(run_thread(indexes)) for indexes in threads.values()]
+    if isinstance(writer, BatchWriter):
+        # The last turns are written once every thread is done
+        tasks.append(asyncio.create_task(flush_after(list(tasks))))
+    try:
+        for _ in requests:
+            yield await results.get()
+    finally:
+        try:
+            if isinstance(writer, BatchWriter):
+                # Keep the turns that completed before the caller went away
+                await asyncio.shield(writer.flush())
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+async def _chat(request: ChatRequest, writer: TurnWriter) -> ChatResponse:
+    """Run one request, waiting out admission control rejections."""
+    delay = 1.0
+    for attempt in range(OVERLOAD_RETRIES):
+        try:
+            agent = AgentRegistry.get(request.agent_id)
+            return await chat_results.run(request, lambda: agent.chat(request, writer))
+        except Overloaded as e:
+            if attempt == OVERLOAD_RETRIES - 1:
+                return ChatResponse(content="", error=str(e))
+            await asyncio.sleep(max(delay, e.retry_after))
+            delay *= 2
+        except Exception as e:
+            logger.error("Failed to process batch message", error=str(e))
+            return ChatResponse(content="", error=str(e))
+
+def read_requests(lines: Iterable[str]) -> list[ChatRequest | str]:
+    """Parse JSONL chat requests, lines that aren't valid give their error message instead."""
+    entries: list[ChatRequest | str] = []
+    for line in lines:
+        if not line.strip():
+            continue
+        try:
+            entries.append(ChatRequest.model_validate_json(line))
+        except ValidationError as e:
+            entries.append(str(e))
+    return entries
+
+async def main(argv: list[str] | None = None) -> None:
+    """Run a JSONL file of chat requests, writing NDJSON results."""
+    parser = argparse.ArgumentParser(description="Run a JSONL file of chat requests through the agents.")
+    parser.add_argument("input", help="JSONL file of chat requests, - for stdin")
+    parser.add_argument("-o", "--output", help="File to write NDJSON results to, stdout by default")
+    parser.add_argument("-c", "--concurrency", type=int, help="Requests in flight")
+    args = parser.parse_args(argv)
+
+    # Import models first so SQLModel knows what tables to create
+    from app import models  # noqa: F401
+    from app.agents.search import create_search_index
+    from app.db.core import init_engine, dispose_engine, create_db_and_tables, get_engine, schema_lock
+
+    # Console logs would interleave with results written to stdout
+    configure_logfire(console=None if args.output else False)
+    init_engine()
+    with schema_lock(get_engine()):
+        create_db_and_tables()
+        create_search_index(get_engine())
+    AgentRegistry.load_from_config()
+
+    if args.input == "-":
+        entries = read_requests(sys.stdin)
+    else:
+        with open(args.input) as f:
+            entries = read_requests(f)
+    valid = [(index, entry) for index, entry in enumerate(entries) if isinstance(entry, ChatRequest)]
+
+    out = open(args.output, "w") if args.output else sys.stdout
+    try:
+        for index, entry in enumerate(entries):
+            if isinstance(entry, str):
+                out.write(BatchResult(index=index, response=ChatResponse(content="", error=entry)).model_dump_json() + "\n")
+        # Report indexes among all input entries, not just the valid ones
+        async for result in run_batch([request for _, request in valid], args.concurrency):
+            result.index = valid[result.index][0]
+            out.write(result.model_dump_json() + "\n")
+            out.flush()
+    finally:
+        if out is not sys.stdout:
+            out.close()
+        await dispose_engine()
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,25 +1,44 @@
 """Chat agent interface and implementations."""
 
-from typing import Optional, Any
+import asyncio
+from typing import Optional, Any, AsyncIterator
+from contextlib import asynccontextmanager
 from dataclasses import dataclass
 from pydantic import BaseModel
-import logfire
 from sqlmodel import Session, select
-from pydantic_ai.messages import (
-    ModelMessage, ModelRequest, ModelResponse,
-    ModelRequestPart, ModelResponsePart,
-    UserPromptPart, TextPart, ToolCallPart, ToolReturnPart,
-    ArgsDict
-)
-from pydantic_ai.result import RunResult
-from app.models.message import Message, MessagePart, MessageKind
+from sqlmodel.ext.asyncio.session import AsyncSession
+from pydantic_ai.messages import ModelMessage, ModelMessagesTypeAdapter, ToolCallPart, ToolReturnPart
+from pydantic_ai import Agent
+from pydantic_ai.result import RunResult, StreamedRunResult
+from app.logs import get_logger, lazy
 from app.models.thread import Thread
-from app.db.core import get_engine
+from app.db.core import new_async_session
+from app.db.replicas import new_read_session, replicas
+from app.agents.history import get_or_create_thread, get_thread, load_history
+from app.agents.history_cache import history_cache
+from app.agents.persistence import save_messages, save_checkpoint
+from app.agents.write_behind import TurnWriter, write_behind
+from app.agents.sessions import ThreadState, chat_sessions
+from app.agents.context import ContextConfig, ContextWindow, ContextFit, transcript
+from app.agents.telemetry import turn, stage, record_usage, history_messages, instrument_tools
+from app.agents.routing import RoutedModel, RoutingConfig
+from app.agents.response_cache import CachedModel, ResponseCache, ResponseCacheConfig, nondeterministic_tools
+from app.agents.concurrency import (
+    AdmissionLimiter, ConcurrencyConfig, Overloaded, thread_locks, model_limiter, admit
+)
+
+logger = get_logger(__name__)
+
+SUMMARY_PROMPT = (
+    "Summarize the conversation below for the assistant that will continue it. "
+    "Keep facts, names, decisions and open questions, drop small talk. "
+    "Reply with the summary only."
+)
 
 @dataclass
 class AgentDeps:
     """Dependencies for chat agents."""
-    session: Session
+    session: AsyncSession
 
 class ChatResponse(BaseModel):
     """Response from a chat agent."""
@@ -32,130 +51,305 @@ class ChatRequest(BaseModel):
     content: str
     agent_id: str
     user_id: str = "default"
+    idempotency_key: Optional[str] = None  # Retries with the same key get the first response
+
+class ChatEvent(BaseModel):
+    """An incremental event streamed from a chat agent."""
+    event: str  # "text", "tool-call", "tool-return", "done" or "error"
+    content: Optional[str] = None
+    tool_name: Optional[str] = None
+    tool_call_id: Optional[str] = None
+    args: Optional[dict[str, Any]] = None
+    error: Optional[str] = None
+
+# Threads with a checkpoint being written, and the tasks writing them
+_checkpointing: set[int] = set()
+_background_tasks: set[asyncio.Task] = set()
 
 class ChatAgent:
     """Base interface for chat agents."""
     
-    async def chat(self, request: ChatRequest) -> ChatResponse:
-        """Process a chat request and return a response."""
-        engine = get_engine()
-        with Session(engine) as session:
-            deps = AgentDeps(session=session)
-            
-            # Get or create thread
-            statement = select(Thread).where(
-                Thread.user_id == request.user_id,
-                Thread.persona_id == request.agent_id
-            )
-            thread = session.exec(statement).first()
-            
-            if not thread:
-                thread = Thread(
-                    user_id=request.user_id,
-                    persona_id=request.agent_id,
-                    name=f"Chat with {request.agent_id}"
-                )
-                session.add(thread)
-                session.flush()  # Get thread.id
-            
-            # Load previous messages
-            statement = select(Message).where(
-                Message.thread_id == thread.id
-            ).order_by("timestamp")
-            thread_messages = session.exec(statement).all()
-            
-            # Convert all messages to ModelMessage format without filtering parts
-            message_history = []
-            
-            # Add system prompt if it exists
-            statement = select(Message).join(MessagePart).where(
-                Message.thread_id == thread.id,
-                MessagePart.part_kind == "system-prompt"
-            )
-            system_message = session.exec(statement).first()
-            if system_message:
-                data = system_message.to_model_message()
-                logfire.debug("Adding system prompt to history", message_data=data)
-                message_history.append(ModelRequest(parts=[
-                    UserPromptPart(content=data["parts"][0]["content"])
-                ]))
-            
-            # Add rest of message history
-            for msg in thread_messages:
-                if msg.id == system_message.id if system_message else None:
-                    continue  # Skip system message as it's already added
-                data = msg.to_model_message()
-                logfire.debug("Converting message to model format", message_data=data)
-                if data["kind"] == "request":
-                    parts = []
-                    for part in data["parts"]:
-                        logfire.debug("Processing request part", part=part)
-                        if part["part_kind"] == "user-prompt":
-                            parts.append(UserPromptPart(content=part["content"]))
-                        elif part["part_kind"] == "tool-return":
-                            parts.append(ToolReturnPart(
-                                content=part["content"],
-                                tool_name=part["tool_name"],
-                                tool_call_id=part["tool_call_id"]
-                            ))
-                    message_history.append(ModelRequest(parts=parts))
-                else:
-                    parts = []
-                    for part in data["parts"]:
-                        logfire.debug("Processing response part", part=part)
-                        if part["part_kind"] == "text":
-                            parts.append(TextPart(content=part["content"]))
-                        elif part["part_kind"] == "assistant-message":
-                            parts.append(TextPart(content=part["content"]))
-                        elif part["part_kind"] == "tool-call":
-                            args_dict = {"args_json": part["args_json"]} if part["args_json"] else {}
-                            parts.append(ToolCallPart(
-                                tool_name=part["tool_name"],
-                                tool_call_id=part["tool_call_id"],
-                                args=ArgsDict(args_dict=args_dict)
-                            ))
-                    message_history.append(ModelResponse(parts=parts))
-            
-            try:
-                # Process chat with history
-                result = await self._process_chat(request, deps, message_history)
-                logfire.debug("Got result from _process_chat", result=result)
+    # Subclasses exposing their pydantic-ai agent here get streaming for free
+    agent: Agent
+    agent_id: str = ""
+    context_window: ContextWindow | None = None
+    limiter: AdmissionLimiter | None = None
+    
+    def configure(self, config: dict) -> None:
+        """Apply the agent's entry from config/agents.yaml."""
+        self.agent_id = config["id"]
+        if config.get("context"):
+            self.context_window = ContextWindow(ContextConfig(**config["context"]))
+        if config.get("concurrency"):
+            self.limiter = AdmissionLimiter.from_config(self.agent_id, ConcurrencyConfig(**config["concurrency"]))
+        if getattr(self, "agent", None) is not None:
+            if config.get("models"):
+                self.model = self.agent.model = RoutedModel.from_config(self.agent_id, RoutingConfig(**config["models"]))
+            if config.get("response_cache"):
+                self._enable_response_cache(ResponseCacheConfig(**config["response_cache"]))
+            instrument_tools(self.agent, self.agent_id)
+    
+    def _enable_response_cache(self, config: ResponseCacheConfig) -> None:
+        """Answer repeated requests from a cache, unless a tool makes responses nondeterministic."""
+        tools = nondeterministic_tools(self.agent)
+        if tools:
+            logger.info("Response cache disabled, agent has nondeterministic tools", agent=self.agent_id, tools=tools)
+            return
+        self.agent.model = CachedModel(self.agent.model, ResponseCache(self.agent_id, config))
+    
+    def is_overloaded(self) -> bool:
+        """Whether a new model call would be rejected without waiting."""
+        return model_limiter.is_full() or (self.limiter is not None and self.limiter.is_full())
+    
+    async def chat(self, request: ChatRequest, writer: TurnWriter | None = None) -> ChatResponse:
+        """Process a chat request and return a response, `writer` overrides how the turn is saved."""
+        writer = writer or self._default_writer()
+        # Turns on one thread run one at a time, so each sees the previous one's history
+        with turn(request.agent_id, "chat") as labels:
+            async with thread_locks.hold((request.user_id, request.agent_id)), new_async_session() as session:
+                deps = AgentDeps(session=session)
                 
-                # Get new messages from the result
-                new_messages = result.new_messages()
-                logfire.debug("New messages from result", messages=new_messages)
+                # Load thread and history without blocking the event loop
+                thread_id, version, message_history = await self._get_history(session, request, writer)
+                history_messages.observe(len(message_history), agent=request.agent_id)
+                context = self._fit_context(message_history)
                 
-                # Save all new messages
-                for msg in new_messages:
-                    msg_kind = MessageKind.REQUEST if msg.kind == "request" else MessageKind.RESPONSE
-                    msg_data = Message(
-                        thread_id=thread.id,
-                        kind=msg_kind
+                try:
+                    # Process chat with history
+                    async with admit(self.limiter):
+                        with stage(request.agent_id, "model"):
+                            result = await self._process_chat(request, deps, context.messages)
+                    record_usage(request.agent_id, result.usage())
+                    
+                    # Get new messages from the result
+                    new_messages = result.new_messages()
+                    logger.debug(
+                        "New messages from result",
+                        messages=lazy(lambda: ModelMessagesTypeAdapter.dump_python(new_messages, mode="json"))
                     )
-                    session.add(msg_data)
-                    session.flush()
                     
-                    for part in msg.parts:
-                        part_data = MessagePart(
-                            message_id=msg_data.id,
-                            part_kind=part.part_kind,
-                            content=getattr(part, "content", None),
-                            tool_name=getattr(part, "tool_name", None),
-                            tool_call_id=getattr(part, "tool_call_id", None),
-                            args_json=str(part.args) if isinstance(part, ToolCallPart) and part.args else None
-                        )
-                        session.add(part_data)
-                
-                session.commit()
-                return ChatResponse(content=result.data)
+                    # Save all new messages
+                    await self._persist_turn(session, request, thread_id, new_messages, writer)
+                    self._cache_turn(request, thread_id, version + 1, message_history, new_messages)
+                    self._schedule_checkpoint(request, thread_id, version, context)
+                    return ChatResponse(content=result.data)
+                    
+                except Overloaded:
+                    labels["outcome"] = "rejected"
+                    await session.rollback()
+                    raise
+                except Exception as e:
+                    labels["outcome"] = "error"
+                    logger.error("Failed to process message", error=str(e))
+                    await session.rollback()
+                    return ChatResponse(content="", error=str(e))
+    
+    async def chat_stream(self, request: ChatRequest, state: ThreadState | None = None) -> AsyncIterator[ChatEvent]:
+        """Process a chat request, yielding events as the response is generated, `state` is a session's kept history."""
+        writer = self._default_writer()
+        with turn(request.agent_id, "stream") as labels:
+            async with thread_locks.hold((request.user_id, request.agent_id)), new_async_session() as session:
+                deps = AgentDeps(session=session)
+                thread_id, version, message_history = await self._get_history(session, request, writer, state)
+                history_messages.observe(len(message_history), agent=request.agent_id)
+                context = self._fit_context(message_history)
                 
-            except Exception as e:
-                logfire.error("Failed to process message", error=str(e))
-                session.rollback()
-                return ChatResponse(content="", error=str(e))
+                try:
+                    # The model stage covers the whole stream from opening it, including
+                    # time to the first token and time spent sending it
+                    async with admit(self.limiter):
+                        with stage(request.agent_id, "model"):
+                            async with self._process_chat_stream(request, deps, context.messages) as result:
+                                # Tool calls made before the final response are already in the run
+                                for event in self._tool_events(result.new_messages()):
+                                    yield event
+                                
+                                if result.is_structured:
+                                    yield ChatEvent(event="text", content=str(await result.get_data()))
+                                else:
+                                    # Cumulative (not delta) streaming so the final response is recorded in the run
+                                    streamed = ""
+                                    async for text in result.stream_text():
+                                        yield ChatEvent(event="text", content=text[len(streamed):])
+                                        streamed = text
+                    record_usage(request.agent_id, result.usage())
+                    
+                    # Persist the whole turn once the stream is complete
+                    new_messages = result.new_messages()
+                    await self._persist_turn(session, request, thread_id, new_messages, writer)
+                    self._cache_turn(request, thread_id, version + 1, message_history, new_messages)
+                    if state is not None:
+                        chat_sessions.keep(state, thread_id, version + 1, message_history + new_messages)
+                    self._schedule_checkpoint(request, thread_id, version, context)
+                    yield ChatEvent(event="done")
+                    
+                except Overloaded:
+                    labels["outcome"] = "rejected"
+                    await session.rollback()
+                    raise
+                except Exception as e:
+                    labels["outcome"] = "error"
+                    logger.error("Failed to stream message", error=str(e))
+                    await session.rollback()
+                    yield ChatEvent(event="error", error=str(e))
+    
+    async def open_thread(self, state: ThreadState) -> None:
+        """Resolve a session's thread and load its history ahead of the first turn."""
+        user_id, agent_id = state.key
+        request = ChatRequest(content="", agent_id=agent_id, user_id=user_id)
+        async with thread_locks.hold(state.key), new_async_session() as session:
+            thread_id, version, message_history = await self._get_history(session, request, self._default_writer())
+            await session.commit()  # The thread, if it was just created
+        replicas.wrote(user_id=user_id, thread_id=thread_id)
+        chat_sessions.keep(state, thread_id, version, message_history)
+    
+    def _default_writer(self) -> TurnWriter | None:
+        """Get the writer turns go through when the caller doesn't pick one."""
+        return write_behind if write_behind.running else None
+    
+    async def _get_history(
+        self, session: AsyncSession, request: ChatRequest, writer: TurnWriter | None, state: ThreadState | None = None
+    ) -> tuple[int, int, list[ModelMessage]]:
+        """
+        Get the request's thread id and version, and its message history.
+        The session's or the cache's copy is used while the thread's version
+        in the database still matches it, other processes may have written
+        to the thread since.
+        """
+        key = (request.user_id, request.agent_id)
+        with stage(request.agent_id, "history"):
+            if writer is not None:
+                # Queued turns must land before the database is read
+                await writer.wait_for(key)
+            
+            kept = state if state is not None and state.messages is not None else None
+            held = kept or history_cache.get(key)
+            if held is not None:
+                statement = select(Thread.version).where(Thread.id == held.thread_id)
+                if (await session.exec(statement)).first() == held.version:
+                    return held.thread_id, held.version, list(held.messages)
+                if kept is not None:
+                    chat_sessions.stale(state)
+                else:
+                    history_cache.stale(key)
+            
+            if replicas.enabled:
+                # Only an existing thread, creating one is a write
+                async with new_read_session(user_id=request.user_id) as read_session:
+                    thread, message_history = await read_session.run_sync(self._load_history, request, False)
+                if thread is not None:
+                    return thread.id, thread.version, message_history
+            
+            thread, message_history = await session.run_sync(self._load_history, request)
+            if writer is not None:
+                # The thread must be committed before turns referencing it are
+                await session.commit()
+            return thread.id, thread.version, message_history
+    
+    async def _persist_turn(
+        self, session: AsyncSession, request: ChatRequest, thread_id: int,
+        new_messages: list[ModelMessage], writer: TurnWriter | None
+    ) -> None:
+        """Save a turn's new messages, or hand them to the writer."""
+        if writer is not None:
+            with stage(request.agent_id, "persist"):
+                await writer.put((request.user_id, request.agent_id), thread_id, new_messages)
+        else:
+            with stage(request.agent_id, "persist"):
+                await session.run_sync(save_messages, thread_id, new_messages)
+            with stage(request.agent_id, "commit"):
+                await session.commit()
+            replicas.wrote(user_id=request.user_id, thread_id=thread_id)
+    
+    def _cache_turn(
+        self, request: ChatRequest, thread_id: int, version: int,
+        message_history: list[ModelMessage], new_messages: list[ModelMessage]
+    ) -> None:
+        """Write a committed turn through to the history cache, `version` is the thread's once it's saved."""
+        key = (request.user_id, request.agent_id)
+        if not history_cache.append(key, thread_id, version, new_messages):
+            history_cache.put(key, thread_id, version, message_history + new_messages)
+    
+    def _fit_context(self, message_history: list[ModelMessage]) -> ContextFit:
+        """Trim history to the agent's context window, if it has one."""
+        if self.context_window is None:
+            return ContextFit(message_history)
+        return self.context_window.fit(message_history)
+    
+    def _schedule_checkpoint(self, request: ChatRequest, thread_id: int, version: int, context: ContextFit) -> None:
+        """Summarize dropped history into a checkpoint in the background, `version` is the thread's the history was loaded at."""
+        if not context.dropped or thread_id in _checkpointing:
+            return
+        _checkpointing.add(thread_id)
+        task = asyncio.create_task(self._write_checkpoint(request, thread_id, version, context))
+        _background_tasks.add(task)
+        task.add_done_callback(_background_tasks.discard)
+    
+    async def _write_checkpoint(self, request: ChatRequest, thread_id: int, version: int, context: ContextFit) -> None:
+        """Summarize dropped history and store it as the thread's new checkpoint."""
+        try:
+            summarizer = Agent(model=self.agent.model, system_prompt=SUMMARY_PROMPT)
+            result = await summarizer.run(transcript(context.summary, context.dropped))
+            
+            async with new_async_session() as session:
+                checkpoint = await session.run_sync(
+                    save_checkpoint, thread_id, version, len(context.dropped),
+                    context.system_prompt, result.data, context.summary
+                )
+                if checkpoint is not None:
+                    await session.commit()
+            
+            # Next turn reloads from the checkpoint
+            if checkpoint is not None:
+                replicas.wrote(user_id=request.user_id, thread_id=thread_id)
+                history_cache.invalidate((request.user_id, request.agent_id))
+                logger.info("Saved context checkpoint", thread_id=thread_id, messages=len(context.dropped))
+        except Exception as e:
+            logger.error("Failed to save context checkpoint", thread_id=thread_id, error=str(e))
+        finally:
+            _checkpointing.discard(thread_id)
+    
+    def _tool_events(self, messages: list[ModelMessage]) -> list[ChatEvent]:
+        """Get the tool call and tool return events of a run's messages."""
+        events = []
+        for msg in messages:
+            for part in msg.parts:
+                if isinstance(part, ToolCallPart):
+                    events.append(ChatEvent(
+                        event="tool-call",
+                        tool_name=part.tool_name,
+                        tool_call_id=part.tool_call_id,
+                        args=part.args_as_dict()
+                    ))
+                elif isinstance(part, ToolReturnPart):
+                    events.append(ChatEvent(
+                        event="tool-return",
+                        content=part.model_response_str(),
+                        tool_name=part.tool_name,
+                        tool_call_id=part.tool_call_id
+                    ))
+        return events
+    
+    def _load_history(self, session: Session, request: ChatRequest, create: bool = True) -> tuple[Thread | None, list[ModelMessage]]:
+        """Get or create the request's thread and load its message history, None and [] when there's no thread to get."""
+        with stage(request.agent_id, "thread_lookup"):
+            if create:
+                thread = get_or_create_thread(session, request.user_id, request.agent_id)
+            else:
+                thread = get_thread(session, request.user_id, request.agent_id)
+                if thread is None:
+                    return None, []
+        with stage(request.agent_id, "history_decode"):
+            message_history = load_history(session, thread.id)
+        logger.debug("Loaded message history", thread_id=thread.id, count=len(message_history))
+        return thread, message_history
     
     async def _process_chat(self, request: ChatRequest, deps: AgentDeps, message_history: list[ModelMessage]) -> RunResult:
         """Subclasses should implement this to process the chat request."""
         raise NotImplementedError("Chat agents must implement _process_chat()")
     
-    
\ No newline at end of file
+    @asynccontextmanager
+    async def _process_chat_stream(self, request: ChatRequest, deps: AgentDeps, message_history: list[ModelMessage]) -> AsyncIterator[StreamedRunResult]:
+        """Stream the chat request through `self.agent`, subclasses may override this."""
+        async with self.agent.run_stream(request.content, message_history=message_history) as result:
+            yield result
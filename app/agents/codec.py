@@ -0,0 +1,88 @@
+"""Compact serialized storage of whole messages."""
+
+import json
+from typing import Any, Iterable
+from pydantic_ai.messages import ModelMessage, ModelMessagesTypeAdapter
+from app.config import get_settings
+
+# Bumped when the payload layout changes, rows keep the version they were written with
+PAYLOAD_VERSION = 1
+
+# Formats are an encoding, optionally followed by "+zstd"
+ENCODINGS = ("json", "msgpack")
+
+class PayloadError(ValueError):
+    """Raised when a payload can't be written or read."""
+
+def _msgpack():
+    try:
+        import msgpack
+    except ImportError:
+        raise PayloadError("The msgpack payload format needs the msgpack package")
+    return msgpack
+
+def _zstd():
+    try:
+        import zstandard
+    except ImportError:
+        raise PayloadError("zstd-compressed payloads need the zstandard package")
+    return zstandard
+
+def check_format(payload_format: str) -> None:
+    """Fail early on a format that isn't known or whose packages are missing."""
+    encoding, _, compression = payload_format.partition("+")
+    if encoding not in ENCODINGS or compression not in ("", "zstd"):
+        raise PayloadError(f"Unknown payload format: {payload_format}")
+    if encoding == "msgpack":
+        _msgpack()
+    if compression:
+        _zstd()
+
+def encode_message(message: ModelMessage, payload_format: str | None = None) -> tuple[bytes, str]:
+    """Serialize one message, returns the payload and its format."""
+    payload_format = payload_format or get_settings().MESSAGE_PAYLOAD_FORMAT
+    encoding, _, compression = payload_format.partition("+")
+    if encoding == "json":
+        # The adapter serializes lists, so strip the brackets of a list of one
+        payload = ModelMessagesTypeAdapter.dump_json([message])[1:-1]
+    elif encoding == "msgpack":
+        payload = _msgpack().packb(ModelMessagesTypeAdapter.dump_python([message], mode="json")[0])
+    else:
+        raise PayloadError(f"Unknown payload format: {payload_format}")
+    if compression == "zstd":
+        payload = _zstd().ZstdCompressor().compress(payload)
+    return payload, payload_format
+
+def compress(data: bytes) -> bytes:
+    """zstd-compress bytes as one frame, frames appended to a file still decompress as one stream."""
+    return _zstd().ZstdCompressor().compress(data)
+
+def decode_messages(payloads: Iterable[tuple[bytes, str, int]]) -> list[ModelMessage]:
+    """
+    Deserialize (payload, format, version) rows, in order.
+    Payloads are decompressed one by one, then all of them are validated
+    with a single ModelMessagesTypeAdapter call: JSON payloads are joined
+    into one array, msgpack ones into one list of dicts.
+    """
+    raw: list[tuple[str, bytes]] = []
+    zstd = None
+    for payload, payload_format, version in payloads:
+        if version > PAYLOAD_VERSION:
+            raise PayloadError(f"Payload version {version} is newer than this code ({PAYLOAD_VERSION})")
+        encoding, _, compression = payload_format.partition("+")
+        if compression == "zstd":
+            zstd = zstd or _zstd().ZstdDecompressor()
+            payload = zstd.decompress(payload)
+        raw.append((encoding, bytes(payload)))
+
+    if all(encoding == "json" for encoding, _ in raw):
+        return ModelMessagesTypeAdapter.validate_json(b"[" + b",".join(payload for _, payload in raw) + b"]")
+    items: list[Any] = []
+    for encoding, payload in raw:
+        if encoding == "json":
+            items.append(json.loads(payload))
+        elif encoding == "msgpack":
+            items.append(_msgpack().unpackb(payload))
+        else:
+            raise PayloadError(f"Unknown payload encoding: {encoding}")
+    return ModelMessagesTypeAdapter.validate_python(items)
@@ -0,0 +1,190 @@
+"""Per-thread serialization and admission control for model calls."""
+
+import asyncio
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from typing import AsyncIterator, Hashable
+from pydantic import BaseModel
+from app.config import get_settings
+from app.metrics import Counter, Gauge, Histogram
+
+admission_wait = Histogram(
+    "chat_admission_wait_seconds", "Time spent waiting for a model call slot", ["limiter"]
+)
+admission_queue = Gauge(
+    "chat_admission_queue", "Model calls waiting for a slot", ["limiter"]
+)
+admission_in_flight = Gauge(
+    "chat_admission_in_flight", "Model calls holding a slot", ["limiter"]
+)
+admission_rejected = Counter(
+    "chat_admission_rejected_total", "Model calls rejected by admission control", ["limiter", "reason"]
+)
+
+class Overloaded(Exception):
+    """Raised when a model call can't be admitted."""
+
+    def __init__(self, message: str, status_code: int, retry_after: int = 1):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+class KeyedLocks:
+    """
+    One FIFO lock per key, dropped once nobody holds or waits for it.
+    Serializes turns on the same thread within this process only: turns
+    on one thread in different workers or servers still run side by side,
+    and each is saved, but neither sees the other's messages.
+    """
+
+    def __init__(self):
+        self._locks: dict[Hashable, asyncio.Lock] = {}
+        self._users: dict[Hashable, int] = {}
+
+    def __len__(self) -> int:
+        return len(self._locks)
+
+    @asynccontextmanager
+    async def hold(self, key: Hashable) -> AsyncIterator[None]:
+        """Hold the key's lock for the duration of the block."""
+        lock = self._locks.setdefault(key, asyncio.Lock())
+        self._users[key] = self._users.get(key, 0) + 1
+        try:
+            async with lock:
+                yield
+        finally:
+            self._users[key] -= 1
+            if not self._users[key]:
+                del self._users[key]
+                del self._locks[key]
+
+class ConcurrencyConfig(BaseModel):
+    """An agent's concurrency settings from config/agents.yaml."""
+    max_concurrent: int
+    max_queue: int = 100
+    queue_timeout: float = 30
+
+@dataclass
+class LimiterStats:
+    """Counters for an admission limiter."""
+    admitted: int = 0
+    rejected: int = 0
+    timed_out: int = 0
+    wait_seconds: float = 0.0  # Total over admitted calls
+
+class AdmissionLimiter:
+    """
+    Caps concurrent model calls with a bounded FIFO wait queue.
+    Calls beyond `max_concurrent` wait their turn; once `max_queue` calls are
+    already waiting, new ones are rejected straight away (429), and calls
+    waiting longer than `queue_timeout` give up (503).
+    """
+
+    def __init__(self, name: str, max_concurrent: int, max_queue: int, queue_timeout: float):
+        self.name = name
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.in_flight = 0
+        self.stats = LimiterStats()
+        self._waiters: deque[asyncio.Future] = deque()
+
+    @classmethod
+    def from_config(cls, name: str, config: ConcurrencyConfig) -> "AdmissionLimiter":
+        return cls(name, config.max_concurrent, config.max_queue, config.queue_timeout)
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_concurrent > 0
+
+    @property
+    def depth(self) -> int:
+        """Number of calls waiting for a slot."""
+        return len(self._waiters)
+
+    def is_full(self) -> bool:
+        """Whether a new call would be rejected right away."""
+        return self.enabled and self.in_flight >= self.max_concurrent and self.depth >= self.max_queue
+
+    @asynccontextmanager
+    async def admit(self) -> AsyncIterator[None]:
+        """Hold a model call slot for the duration of the block."""
+        if not self.enabled:
+            yield
+            return
+
+        start = time.monotonic()
+        await self._acquire()
+        waited = time.monotonic() - start
+        self.stats.admitted += 1
+        self.stats.wait_seconds += waited
+        admission_wait.observe(waited, limiter=self.name)
+        admission_in_flight.inc(limiter=self.name)
+        try:
+            yield
+        finally:
+            admission_in_flight.dec(limiter=self.name)
+            self._release()
+
+    async def _acquire(self) -> None:
+        if self.in_flight < self.max_concurrent and not self._waiters:
+            self.in_flight += 1
+            return
+        if self.depth >= self.max_queue:
+            self._reject("rejected")
+            raise Overloaded(f"Too many queued requests for {self.name}", status_code=429)
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        admission_queue.inc(limiter=self.name)
+        try:
+            # The slot is handed over by _release, so in_flight is already counted
+            await asyncio.wait_for(waiter, self.queue_timeout)
+        except asyncio.TimeoutError:
+            self._reject("timed_out")
+            raise Overloaded(f"Timed out waiting for {self.name}", status_code=503)
+        except BaseException:
+            if waiter.done() and not waiter.cancelled():
+                self._release()  # Slot handed over as we were cancelled
+            raise
+        finally:
+            admission_queue.dec(limiter=self.name)
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+
+    def _release(self) -> None:
+        # Hand the slot to the next live waiter, or free it
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.in_flight -= 1
+
+    def _reject(self, reason: str) -> None:
+        if reason == "rejected":
+            self.stats.rejected += 1
+        else:
+            self.stats.timed_out += 1
+        admission_rejected.inc(limiter=self.name, reason=reason)
+
+settings = get_settings()
+thread_locks = KeyedLocks()
+model_limiter = AdmissionLimiter(
+    "global",
+    max_concurrent=settings.MODEL_MAX_CONCURRENCY,
+    max_queue=settings.MODEL_MAX_QUEUE,
+    queue_timeout=settings.MODEL_QUEUE_TIMEOUT
+)
+
+@asynccontextmanager
+async def admit(agent_limiter: AdmissionLimiter | None = None) -> AsyncIterator[None]:
+    """Hold the agent's slot, if it has a limiter, and a global slot."""
+    if agent_limiter is None:
+        async with model_limiter.admit():
+            yield
+    else:
+        async with agent_limiter.admit(), model_limiter.admit():
+            yield
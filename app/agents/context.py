@@ -0,0 +1,171 @@
+"""Token-budgeted context window for conversation history."""
+
+from dataclasses import dataclass, field
+from typing import Callable
+from pydantic import BaseModel
+from pydantic_ai.messages import (
+    ModelMessage, ModelRequest,
+    SystemPromptPart, UserPromptPart, ToolReturnPart, RetryPromptPart,
+    TextPart, ToolCallPart
+)
+
+# Marks the system prompt part holding a checkpoint's summary
+SUMMARY_PREFIX = "Summary of the earlier conversation:\n"
+
+Tokenizer = Callable[[str], int]
+
+def _chars_tokenizer(text: str) -> int:
+    """Roughly 4 characters per token for English text."""
+    return (len(text) + 3) // 4
+
+def _words_tokenizer(text: str) -> int:
+    """Roughly 3 tokens per 4 words for English text."""
+    return (len(text.split()) * 4 + 2) // 3
+
+_tokenizers: dict[str, Tokenizer] = {
+    "chars": _chars_tokenizer,
+    "words": _words_tokenizer,
+}
+
+def register_tokenizer(name: str, tokenizer: Tokenizer) -> None:
+    """Register a tokenizer usable from an agent's context config."""
+    _tokenizers[name] = tokenizer
+
+def get_tokenizer(name: str) -> Tokenizer:
+    """Get a tokenizer by name, "tiktoken:<encoding>" uses tiktoken if installed."""
+    if name not in _tokenizers and name.startswith("tiktoken:"):
+        try:
+            import tiktoken
+        except ImportError as e:
+            raise ValueError("Install tiktoken to use tiktoken tokenizers") from e
+        encoding = tiktoken.get_encoding(name.split(":", 1)[1])
+        register_tokenizer(name, lambda text: len(encoding.encode(text)))
+    if name not in _tokenizers:
+        raise ValueError(f"Unknown tokenizer: {name}")
+    return _tokenizers[name]
+
+class TokenEstimator:
+    """Estimates the prompt tokens of model messages."""
+
+    def __init__(self, tokenizer: Tokenizer, message_overhead: int = 4):
+        self.tokenizer = tokenizer
+        self.message_overhead = message_overhead
+
+    def message_tokens(self, message: ModelMessage) -> int:
+        """Estimate the tokens of one message."""
+        return self.message_overhead + sum(self.tokenizer(part_text(part)) for part in message.parts)
+
+    def tokens(self, messages: list[ModelMessage]) -> int:
+        """Estimate the tokens of a list of messages."""
+        return sum(self.message_tokens(msg) for msg in messages)
+
+def part_text(part) -> str:
+    """Get the text a message part contributes to the prompt."""
+    if isinstance(part, ToolCallPart):
+        return f"{part.tool_name} {part.args_as_json_str()}"
+    if isinstance(part, ToolReturnPart):
+        return part.model_response_str()
+    if isinstance(part, RetryPromptPart):
+        return part.model_response()
+    return part.content
+
+class ContextConfig(BaseModel):
+    """An agent's context settings from config/agents.yaml."""
+    max_tokens: int
+    trim_to: int | None = None  # Budget after trimming, defaults to half of max_tokens
+    tokenizer: str = "chars"
+
+@dataclass
+class ContextFit:
+    """History fitted to a context window."""
+    messages: list[ModelMessage]
+    dropped: list[ModelMessage] = field(default_factory=list)
+    system_prompt: str | None = None
+    summary: str | None = None
+
+class ContextWindow:
+    """
+    Trims history to a token budget.
+    Only whole turns are dropped, oldest first: a cut always lands on a
+    request holding a user prompt, so a tool call is never separated from
+    its return. The system prompt and any checkpoint summary are kept.
+    Trimming goes down to `trim_to` rather than `max_tokens` so the
+    dropped turns, and the summary replacing them, come in batches.
+    """
+
+    def __init__(self, config: ContextConfig):
+        self.max_tokens = config.max_tokens
+        self.trim_to = config.trim_to or config.max_tokens // 2
+        self.estimator = TokenEstimator(get_tokenizer(config.tokenizer))
+
+    def fit(self, messages: list[ModelMessage]) -> ContextFit:
+        """Fit history to the window, returning what to send and what was dropped."""
+        head, body = split_head(messages)
+        system_prompt, summary = head_prompts(head)
+        if self.estimator.tokens(messages) <= self.max_tokens:
+            return ContextFit(messages, [], system_prompt, summary)
+
+        # Token count of body[i:] for every i
+        suffix = [0] * (len(body) + 1)
+        for i in range(len(body) - 1, -1, -1):
+            suffix[i] = suffix[i + 1] + self.estimator.message_tokens(body[i])
+
+        budget = self.trim_to - (self.estimator.message_tokens(ModelRequest(parts=head)) if head else 0)
+        cut = len(body)
+        for i, msg in enumerate(body):
+            if is_turn_start(msg) and suffix[i] <= budget:
+                cut = i
+                break
+
+        kept = body[cut:]
+        view = [ModelRequest(parts=head), *kept] if head else kept
+        return ContextFit(view, body[:cut], system_prompt, summary)
+
+def split_head(messages: list[ModelMessage]) -> tuple[list[SystemPromptPart], list[ModelMessage]]:
+    """Split the leading system prompt parts from the rest of the history."""
+    if not messages or not isinstance(messages[0], ModelRequest):
+        return [], messages
+    first = messages[0]
+    head = [p for p in first.parts if isinstance(p, SystemPromptPart)]
+    rest = [p for p in first.parts if not isinstance(p, SystemPromptPart)]
+    if not head:
+        return [], messages
+    if not rest:
+        return head, messages[1:]  # Checkpoint message, not a stored one
+    return head, [ModelRequest(parts=rest), *messages[1:]]
+
+def head_prompts(head: list[SystemPromptPart]) -> tuple[str | None, str | None]:
+    """Get the agent system prompt and checkpoint summary from the head parts."""
+    system_prompt = None
+    summary = None
+    for part in head:
+        if part.content.startswith(SUMMARY_PREFIX):
+            summary = part.content[len(SUMMARY_PREFIX):]
+        elif system_prompt is None:
+            system_prompt = part.content
+    return system_prompt, summary
+
+def is_turn_start(message: ModelMessage) -> bool:
+    """Whether a message starts a user turn."""
+    return isinstance(message, ModelRequest) and any(isinstance(p, UserPromptPart) for p in message.parts)
+
+def checkpoint_message(system_prompt: str | None, summary: str) -> ModelRequest:
+    """Build the request standing in for the history a checkpoint covers."""
+    parts = [SystemPromptPart(content=system_prompt)] if system_prompt else []
+    parts.append(SystemPromptPart(content=SUMMARY_PREFIX + summary))
+    return ModelRequest(parts=parts)
+
+def transcript(summary: str | None, messages: list[ModelMessage]) -> str:
+    """Render a previous summary and dropped messages as text to summarize."""
+    lines = [f"Previous summary: {summary}"] if summary else []
+    for msg in messages:
+        for part in msg.parts:
+            if isinstance(part, UserPromptPart):
+                lines.append(f"User: {part.content}")
+            elif isinstance(part, TextPart):
+                lines.append(f"Assistant: {part.content}")
+            elif isinstance(part, ToolCallPart):
+                lines.append(f"Assistant called {part.tool_name}({part.args_as_json_str()})")
+            elif isinstance(part, ToolReturnPart):
+                lines.append(f"{part.tool_name} returned: {part.model_response_str()}")
+    return "\n".join(lines)
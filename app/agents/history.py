@@ -0,0 +1,255 @@
+"""Loading of thread message history."""
+
+import ast
+from datetime import datetime
+from typing import Any
+from sqlalchemy import tuple_
+from sqlalchemy.exc import IntegrityError
+from sqlmodel import Session, select
+from pydantic_ai.messages import (
+    ModelMessage, ModelRequest, ModelResponse,
+    ModelRequestPart, ModelResponsePart,
+    SystemPromptPart, UserPromptPart, ToolReturnPart, RetryPromptPart,
+    TextPart, ToolCallPart, ArgsDict, ArgsJson
+)
+from app.models.message import Message, MessagePart, MessageKind
+from app.models.thread import Thread
+from app.models.checkpoint import ContextCheckpoint
+from app.agents.context import checkpoint_message
+from app.agents.codec import decode_messages
+
+# Prefixes of the repr() that older rows stored in MessagePart.args_json
+_LEGACY_ARGS_DICT = "ArgsDict(args_dict="
+_LEGACY_ARGS_JSON = "ArgsJson(args_json="
+
+def _thread_statement(user_id: str, persona_id: str):
+    return select(Thread).where(
+        Thread.user_id == user_id,
+        Thread.persona_id == persona_id
+    )
+
+def get_thread(session: Session, user_id: str, persona_id: str) -> Thread | None:
+    """Get the thread between a user and a persona, if there's one."""
+    return session.exec(_thread_statement(user_id, persona_id)).first()
+
+def get_or_create_thread(session: Session, user_id: str, persona_id: str) -> Thread:
+    """Get the thread between a user and a persona, creating it if needed."""
+    statement = _thread_statement(user_id, persona_id)
+    thread = session.exec(statement).first()
+
+    if not thread:
+        thread = Thread(
+            user_id=user_id,
+            persona_id=persona_id,
+            name=f"Chat with {persona_id}"
+        )
+        try:
+            # Savepoint, so losing the race to another worker keeps the transaction usable
+            with session.begin_nested():
+                session.add(thread)
+                session.flush()  # Get thread.id
+        except IntegrityError:
+            thread = session.exec(statement).one()
+
+    return thread
+
+def get_checkpoint(session: Session, thread_id: int) -> ContextCheckpoint | None:
+    """Get a thread's latest context checkpoint."""
+    statement = select(ContextCheckpoint).where(
+        ContextCheckpoint.thread_id == thread_id
+    ).order_by(ContextCheckpoint.id.desc()).limit(1)
+    return session.exec(statement).first()
+
+def load_history(session: Session, thread_id: int) -> list[ModelMessage]:
+    """
+    Load a thread's messages and parts in one ordered query.
+    When the thread has a context checkpoint, its summary stands in for the
+    messages it covers and only later messages are read. Messages stored
+    as payloads have no parts, they are decoded together at the end.
+    """
+    messages: list[ModelMessage] = []
+    checkpoint = get_checkpoint(session, thread_id)
+    if checkpoint:
+        messages.append(checkpoint_message(checkpoint.system_prompt, checkpoint.summary))
+
+    statement = select(
+        Message.id, Message.kind, Message.timestamp,
+        Message.payload, Message.payload_format, Message.payload_version,
+        MessagePart.part_kind, MessagePart.content, MessagePart.timestamp,
+        MessagePart.tool_name, MessagePart.tool_call_id,
+        MessagePart.args_json, MessagePart.error_details
+    ).outerjoin(
+        MessagePart, MessagePart.message_id == Message.id
+    ).where(
+        Message.thread_id == thread_id
+    ).order_by(Message.timestamp, Message.id, MessagePart.id)
+    if checkpoint:
+        statement = statement.where(after_checkpoint(checkpoint))
+
+    current_id = None
+    payloads: list[tuple[int, tuple[bytes, str, int]]] = []  # Index in messages, payload
+    for (message_id, kind, message_ts, payload, payload_format, payload_version,
+         part_kind, content, part_ts,
+         tool_name, tool_call_id, args_json, error_details) in session.exec(statement):
+        if message_id != current_id:
+            current_id = message_id
+            if payload is not None:
+                payloads.append((len(messages), (payload, payload_format, payload_version)))
+            if kind == MessageKind.REQUEST:
+                messages.append(ModelRequest(parts=[]))
+            else:
+                messages.append(ModelResponse(parts=[], timestamp=message_ts))
+
+        if part_kind is None:
+            continue  # Message without parts, or stored as a payload
+        timestamp = part_ts or message_ts
+        if kind == MessageKind.REQUEST:
+            part = _decode_request_part(part_kind, content, timestamp, tool_name, tool_call_id, error_details)
+        else:
+            part = _decode_response_part(part_kind, content, tool_name, tool_call_id, args_json)
+        if part is not None:
+            messages[-1].parts.append(part)
+
+    if payloads:
+        decoded = decode_messages(payload for _, payload in payloads)
+        for (index, _), message in zip(payloads, decoded):
+            messages[index] = message
+    return messages
+
+def list_threads(session: Session, user_id: str | None, before_id: int | None, limit: int) -> list[Thread]:
+    """Get a page of threads, newest first, starting below `before_id`."""
+    statement = select(Thread).order_by(Thread.id.desc()).limit(limit)
+    if user_id is not None:
+        statement = statement.where(Thread.user_id == user_id)
+    if before_id is not None:
+        statement = statement.where(Thread.id < before_id)
+    return list(session.exec(statement))
+
+def after_checkpoint(checkpoint: ContextCheckpoint):
+    """Filter for the messages a checkpoint doesn't cover, in the order history is read."""
+    if checkpoint.through_timestamp is None:
+        return Message.id > checkpoint.through_message_id
+    return tuple_(Message.timestamp, Message.id) > tuple_(checkpoint.through_timestamp, checkpoint.through_message_id)
+
+def load_page(
+    session: Session, thread_id: int, before: tuple[datetime, int] | None, limit: int
+) -> list[tuple[int, datetime, ModelMessage]]:
+    """
+    Get up to `limit` messages of a thread older than the (timestamp, id)
+    key `before`, oldest first, as (id, timestamp, message).
+    Messages are found by seeking the (thread_id, timestamp, id) index, so
+    a page costs the same at any depth. Parts are read in one more query,
+    payloads are decoded in one call. Checkpoints are ignored: pages show
+    the thread as stored.
+    """
+    statement = select(
+        Message.id, Message.kind, Message.timestamp,
+        Message.payload, Message.payload_format, Message.payload_version
+    ).where(
+        Message.thread_id == thread_id
+    ).order_by(Message.timestamp.desc(), Message.id.desc()).limit(limit)
+    if before is not None:
+        statement = statement.where(tuple_(Message.timestamp, Message.id) < tuple_(*before))
+    rows = list(session.exec(statement))
+    rows.reverse()
+    if not rows:
+        return []
+
+    messages = load_messages(session, rows)
+    return [(message_id, message_ts, messages[message_id]) for message_id, _, message_ts, *_ in rows]
+
+def load_messages(session: Session, rows: list[tuple]) -> dict[int, ModelMessage]:
+    """
+    Build messages from rows starting with their (id, kind, timestamp,
+    payload, payload_format, payload_version) columns, by message id.
+    Payloads are decoded in one call, part rows are read in one query.
+    """
+    payloads = [row for row in rows if row[3] is not None]
+    decoded = decode_messages(row[3:6] for row in payloads) if payloads else []
+    messages = {row[0]: message for row, message in zip(payloads, decoded)}
+    messages.update(load_part_messages(session, {
+        row[0]: (row[1], row[2]) for row in rows if row[3] is None
+    }))
+    return messages
+
+def load_part_messages(session: Session, kinds: dict[int, tuple[MessageKind, datetime]]) -> dict[int, ModelMessage]:
+    """Build messages stored as part rows from their parts, read in one query, by message id."""
+    messages: dict[int, ModelMessage] = {}
+    for message_id, (kind, message_ts) in kinds.items():
+        if kind == MessageKind.REQUEST:
+            messages[message_id] = ModelRequest(parts=[])
+        else:
+            messages[message_id] = ModelResponse(parts=[], timestamp=message_ts)
+    if not messages:
+        return messages
+
+    statement = select(
+        MessagePart.message_id, MessagePart.part_kind, MessagePart.content, MessagePart.timestamp,
+        MessagePart.tool_name, MessagePart.tool_call_id,
+        MessagePart.args_json, MessagePart.error_details
+    ).where(
+        MessagePart.message_id.in_(list(messages))
+    ).order_by(MessagePart.message_id, MessagePart.id)
+    for (message_id, part_kind, content, part_ts,
+         tool_name, tool_call_id, args_json, error_details) in session.exec(statement):
+        kind, message_ts = kinds[message_id]
+        if kind == MessageKind.REQUEST:
+            part = _decode_request_part(part_kind, content, part_ts or message_ts, tool_name, tool_call_id, error_details)
+        else:
+            part = _decode_response_part(part_kind, content, tool_name, tool_call_id, args_json)
+        if part is not None:
+            messages[message_id].parts.append(part)
+    return messages
+
+def _decode_request_part(
+    part_kind: str, content: str | None, timestamp: datetime,
+    tool_name: str | None, tool_call_id: str | None, error_details: list[dict] | None
+) -> ModelRequestPart | None:
+    """Build a request part from its stored columns."""
+    if part_kind == "system-prompt":
+        return SystemPromptPart(content=content or "")
+    if part_kind == "user-prompt":
+        return UserPromptPart(content=content or "", timestamp=timestamp)
+    if part_kind == "tool-return":
+        return ToolReturnPart(
+            tool_name=tool_name,
+            content=content,
+            tool_call_id=tool_call_id,
+            timestamp=timestamp
+        )
+    if part_kind == "retry-prompt":
+        return RetryPromptPart(
+            content=error_details if error_details else content or "",
+            tool_name=tool_name,
+            tool_call_id=tool_call_id,
+            timestamp=timestamp
+        )
+    return None
+
+def _decode_response_part(
+    part_kind: str, content: str | None,
+    tool_name: str | None, tool_call_id: str | None, args_json: Any
+) -> ModelResponsePart | None:
+    """Build a response part from its stored columns."""
+    if part_kind in ("text", "assistant-message"):
+        return TextPart(content=content or "")
+    if part_kind == "tool-call":
+        return ToolCallPart(
+            tool_name=tool_name,
+            args=decode_args(args_json),
+            tool_call_id=tool_call_id
+        )
+    return None
+
+def decode_args(value: Any) -> ArgsDict | ArgsJson:
+    """Decode stored tool call arguments."""
+    if isinstance(value, dict):
+        return ArgsDict(args_dict=value)
+    if not value:
+        return ArgsDict(args_dict={})
+    # Older rows stored the repr() of the args object
+    if value.startswith(_LEGACY_ARGS_DICT):
+        return ArgsDict(args_dict=ast.literal_eval(value[len(_LEGACY_ARGS_DICT):-1]))
+    if value.startswith(_LEGACY_ARGS_JSON):
+        return ArgsJson(args_json=ast.literal_eval(value[len(_LEGACY_ARGS_JSON):-1]))
+    return ArgsJson(args_json=value)
@@ -0,0 +1,111 @@
+"""In-memory cache of decoded conversation history per thread."""
+
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from pydantic_ai.messages import ModelMessage
+from app.config import get_settings
+
+# Threads are unique per (user_id, persona_id)
+HistoryKey = tuple[str, str]
+
+@dataclass
+class CachedHistory:
+    """Decoded message history of one thread, as of the thread's `version`."""
+    thread_id: int
+    version: int
+    messages: list[ModelMessage]
+    expires_at: float = 0.0
+
+@dataclass
+class HistoryCacheStats:
+    """Counters for the history cache."""
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    expirations: int = 0
+    stale: int = 0
+
+class HistoryCache:
+    """
+    Bounded LRU cache of thread history with TTL expiry.
+    Entries are only written after a turn is committed (or queued for
+    write-behind), so a cached history never contains messages that won't
+    reach the database. The cache is per process, so callers check an
+    entry's version against the thread's before using it, and drop it with
+    `stale` when another process wrote to the thread since.
+    """
+
+    def __init__(self, max_entries: int, ttl: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.stats = HistoryCacheStats()
+        self._entries: OrderedDict[HistoryKey, CachedHistory] = OrderedDict()
+
+    @property
+    def enabled(self) -> bool:
+        """Whether the cache stores anything at all."""
+        return self.max_entries > 0 and self.ttl > 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: HistoryKey) -> CachedHistory | None:
+        """Get a copy of a thread's cached history, or None on a miss."""
+        entry = self._entries.get(key)
+        if entry is not None and entry.expires_at <= time.monotonic():
+            del self._entries[key]
+            self.stats.expirations += 1
+            entry = None
+        if entry is None:
+            self.stats.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self.stats.hits += 1
+        # Callers get their own list so a run can't mutate the cached one
+        return CachedHistory(entry.thread_id, entry.version, list(entry.messages), entry.expires_at)
+
+    def put(self, key: HistoryKey, thread_id: int, version: int, messages: list[ModelMessage]) -> None:
+        """Store a thread's full history as of `version`."""
+        if not self.enabled:
+            return
+        self._entries[key] = CachedHistory(thread_id, version, list(messages), time.monotonic() + self.ttl)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.stats.evictions += 1
+
+    def append(self, key: HistoryKey, thread_id: int, version: int, messages: list[ModelMessage]) -> bool:
+        """
+        Append a turn's messages to a cached thread, which brings it to
+        `version`. Returns False if the thread isn't cached at the version
+        before.
+        """
+        entry = self._entries.get(key)
+        if entry is None or entry.thread_id != thread_id or entry.version != version - 1:
+            return False
+        entry.version = version
+        entry.messages.extend(messages)
+        entry.expires_at = time.monotonic() + self.ttl
+        self._entries.move_to_end(key)
+        return True
+
+    def stale(self, key: HistoryKey) -> None:
+        """Drop a thread another process wrote to since it was cached."""
+        if self._entries.pop(key, None) is not None:
+            self.stats.stale += 1
+
+    def invalidate(self, key: HistoryKey) -> None:
+        """Drop a thread from the cache."""
+        self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        """Drop all threads from the cache."""
+        self._entries.clear()
+
+settings = get_settings()
+history_cache = HistoryCache(
+    max_entries=settings.HISTORY_CACHE_SIZE,
+    ttl=settings.HISTORY_CACHE_TTL
+)
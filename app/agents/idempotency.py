@@ -0,0 +1,200 @@
+"""Idempotent chat requests: coalescing of duplicates and replay of stored responses."""
+
+import asyncio
+import hashlib
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable
+from sqlalchemy import delete
+from sqlalchemy.exc import IntegrityError
+from sqlmodel import Session, select
+from app.config import get_settings
+from app.db.core import new_async_session
+from app.logs import get_logger
+from app.metrics import Counter, Gauge
+from app.models.chat_result import ChatResult
+from app.agents.chat import ChatRequest, ChatResponse
+
+logger = get_logger(__name__)
+
+# Requests are only coalesced within a thread
+ResultKey = tuple[str, str, str]  # (user_id, agent_id, idempotency_key)
+
+class IdempotencyConflict(Exception):
+    """Raised when an idempotency key is reused for a different request."""
+
+@dataclass
+class ResultCacheStats:
+    """Counters for idempotent requests."""
+    hits: int = 0  # Replayed from memory or the database
+    misses: int = 0  # Ran a new turn
+    coalesced: int = 0  # Attached to an identical request in flight
+
+def fingerprint(request: ChatRequest) -> str:
+    """Hash of what a request asks for, so a reused key can be told apart from a retry."""
+    return hashlib.sha256(request.content.encode()).hexdigest()[:32]
+
+class ChatResults:
+    """
+    Runs chat requests that carry an idempotency key at most once.
+    A duplicate of a request still in flight waits on the same task, and
+    a completed response is kept for `ttl` seconds in a bounded LRU, and
+    in the database with `persist`, so a late retry gets it back without
+    a new turn. Responses with an error aren't kept, so retrying them
+    runs the turn again.
+    """
+
+    def __init__(self, max_entries: int, ttl: float, persist: bool):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.persist = persist
+        self.stats = ResultCacheStats()
+        self._entries: OrderedDict[ResultKey, tuple[str, ChatResponse, float]] = OrderedDict()
+        self._in_flight: dict[ResultKey, tuple[str, asyncio.Task]] = {}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    async def run(self, request: ChatRequest, compute: Callable[[], Awaitable[ChatResponse]]) -> ChatResponse:
+        """Get the request's response, running `compute` only if no identical request did."""
+        if not request.idempotency_key:
+            return await compute()
+        key = (request.user_id, request.agent_id, request.idempotency_key)
+        request_fingerprint = fingerprint(request)
+
+        cached = self._get(key)
+        if cached is not None:
+            self._check(key, request_fingerprint, cached[0])
+            self.stats.hits += 1
+            return cached[1].model_copy()
+
+        in_flight = self._in_flight.get(key)
+        if in_flight is not None:
+            self._check(key, request_fingerprint, in_flight[0])
+            self.stats.coalesced += 1
+            task = in_flight[1]
+        else:
+            # Registered before any await, so duplicates arriving meanwhile attach to it
+            task = asyncio.create_task(self._compute(key, request_fingerprint, compute))
+            self._in_flight[key] = (request_fingerprint, task)
+            task.add_done_callback(lambda done: self._finished(key, done))
+        # A caller going away doesn't cancel the turn the others wait on
+        response = await asyncio.shield(task)
+        return response.model_copy()
+
+    def clear(self) -> None:
+        """Drop all responses kept in memory."""
+        self._entries.clear()
+
+    async def _compute(self, key: ResultKey, request_fingerprint: str, compute: Callable[[], Awaitable[ChatResponse]]) -> ChatResponse:
+        if self.persist:
+            stored = await self._load(key)
+            if stored is not None:
+                self._check(key, request_fingerprint, stored.fingerprint)
+                self.stats.hits += 1
+                response = ChatResponse.model_validate(stored.response)
+                self._put(key, request_fingerprint, response)
+                return response
+
+        self.stats.misses += 1
+        response = await compute()
+        if response.error is None:
+            self._put(key, request_fingerprint, response)
+            if self.persist:
+                await self._store(key, request_fingerprint, response)
+        return response
+
+    def _finished(self, key: ResultKey, task: asyncio.Task) -> None:
+        self._in_flight.pop(key, None)
+        # Retrieve the error, the callers that would have may all be gone
+        if not task.cancelled() and task.exception() is not None:
+            logger.debug("Idempotent request failed", key=key[2], error=str(task.exception()))
+
+    def _check(self, key: ResultKey, request_fingerprint: str, known_fingerprint: str) -> None:
+        if request_fingerprint != known_fingerprint:
+            raise IdempotencyConflict(f"Idempotency key {key[2]} was already used for a different request")
+
+    def _get(self, key: ResultKey) -> tuple[str, ChatResponse] | None:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry[2] <= time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return entry[0], entry[1]
+
+    def _put(self, key: ResultKey, request_fingerprint: str, response: ChatResponse) -> None:
+        if self.max_entries <= 0 or self.ttl <= 0:
+            return
+        self._entries[key] = (request_fingerprint, response, time.monotonic() + self.ttl)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    async def _load(self, key: ResultKey) -> ChatResult | None:
+        try:
+            async with new_async_session() as session:
+                return await session.run_sync(_load_result, key, self.ttl)
+        except Exception as e:
+            logger.error("Failed to load stored chat result", error=str(e))
+            return None
+
+    async def _store(self, key: ResultKey, request_fingerprint: str, response: ChatResponse) -> None:
+        try:
+            async with new_async_session() as session:
+                await session.run_sync(_save_result, key, request_fingerprint, response, self.ttl)
+                await session.commit()
+        except IntegrityError:
+            pass  # Stored by another worker
+        except Exception as e:
+            logger.error("Failed to store chat result", error=str(e))
+
+def _load_result(session: Session, key: ResultKey, ttl: float) -> ChatResult | None:
+    user_id, agent_id, idempotency_key = key
+    statement = select(ChatResult).where(
+        ChatResult.user_id == user_id,
+        ChatResult.agent_id == agent_id,
+        ChatResult.idempotency_key == idempotency_key,
+        ChatResult.created_at >= datetime.utcnow() - timedelta(seconds=ttl)
+    )
+    return session.exec(statement).first()
+
+def _save_result(session: Session, key: ResultKey, request_fingerprint: str, response: ChatResponse, ttl: float) -> None:
+    user_id, agent_id, idempotency_key = key
+    # An expired result would block the key's unique constraint
+    session.execute(delete(ChatResult).where(
+        ChatResult.user_id == user_id,
+        ChatResult.agent_id == agent_id,
+        ChatResult.idempotency_key == idempotency_key,
+        ChatResult.created_at < datetime.utcnow() - timedelta(seconds=ttl)
+    ))
+    session.add(ChatResult(
+        user_id=user_id,
+        agent_id=agent_id,
+        idempotency_key=idempotency_key,
+        fingerprint=request_fingerprint,
+        response=response.model_dump(mode="json")
+    ))
+    session.flush()
+
+settings = get_settings()
+chat_results = ChatResults(
+    max_entries=settings.IDEMPOTENCY_CACHE_SIZE,
+    ttl=settings.IDEMPOTENCY_TTL,
+    persist=settings.IDEMPOTENCY_PERSIST
+)
+Counter(
+    "chat_idempotent_hits_total", "Retried requests answered with a stored response",
+    callback=lambda: chat_results.stats.hits
+)
+Counter(
+    "chat_idempotent_coalesced_total", "Duplicate requests attached to one in flight",
+    callback=lambda: chat_results.stats.coalesced
+)
+Gauge(
+    "chat_idempotent_entries", "Responses kept in memory for retries",
+    callback=lambda: len(chat_results)
+)
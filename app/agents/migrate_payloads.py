@@ -0,0 +1,80 @@
+"""Convert messages stored as part rows to serialized payloads."""
+
+import argparse
+from sqlalchemy import bindparam, delete, update
+from sqlmodel import Session, select
+from app.config import get_settings
+from app.logs import get_logger, configure_logfire
+from app.agents.codec import PAYLOAD_VERSION, check_format, encode_message
+from app.agents.history import load_part_messages
+from app.models.message import Message, MessagePart
+
+logger = get_logger(__name__)
+
+def migrate_batch(session: Session, after_id: int, batch_size: int, payload_format: str, keep_parts: bool) -> list[int]:
+    """Convert the next `batch_size` part-row messages after `after_id`, returns their ids."""
+    statement = select(Message.id, Message.kind, Message.timestamp).where(
+        Message.payload.is_(None), Message.id > after_id
+    ).order_by(Message.id).limit(batch_size)
+    rows = list(session.exec(statement))
+    if not rows:
+        return []
+
+    messages = load_part_messages(session, {message_id: (kind, ts) for message_id, kind, ts in rows})
+    values = []
+    for message_id, message in messages.items():
+        payload, encoded_format = encode_message(message, payload_format)
+        values.append({
+            "message_id": message_id,
+            "payload": payload,
+            "payload_format": encoded_format,
+            "payload_version": PAYLOAD_VERSION
+        })
+    # One executemany for the whole batch
+    session.execute(
+        update(Message.__table__).where(Message.__table__.c.id == bindparam("message_id")).values(
+            payload=bindparam("payload"),
+            payload_format=bindparam("payload_format"),
+            payload_version=bindparam("payload_version")
+        ),
+        values
+    )
+    if not keep_parts:
+        session.execute(delete(MessagePart).where(MessagePart.message_id.in_(list(messages))))
+    return list(messages)
+
+def main(argv: list[str] | None = None) -> None:
+    """Convert all part-row messages to payloads, one committed batch at a time."""
+    parser = argparse.ArgumentParser(description="Convert messages stored as part rows to serialized payloads.")
+    parser.add_argument("--format", default=get_settings().MESSAGE_PAYLOAD_FORMAT, help="Payload format, e.g. json or msgpack+zstd")
+    parser.add_argument("--batch-size", type=int, default=1000, help="Messages per transaction")
+    parser.add_argument("--keep-parts", action="store_true", help="Leave the part rows in place")
+    args = parser.parse_args(argv)
+    check_format(args.format)
+
+    # Import models first so SQLModel knows what tables to create
+    from app import models  # noqa: F401
+    from app.db.core import init_engine, get_engine, create_db_and_tables, schema_lock
+
+    configure_logfire()
+    init_engine()
+    engine = get_engine()
+
+    # Starting servers and other migrations wait until this one is done
+    with schema_lock(engine):
+        create_db_and_tables()  # Adds the payload columns to tables created before them
+        converted = 0
+        last_id = 0
+        while True:
+            with Session(engine) as session:
+                message_ids = migrate_batch(session, last_id, args.batch_size, args.format, args.keep_parts)
+                if not message_ids:
+                    break
+                session.commit()
+            converted += len(message_ids)
+            last_id = message_ids[-1]
+            logger.info("Converted messages", count=converted, through_id=last_id)
+    logger.info("Payload migration done", count=converted, format=args.format)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,190 @@
+"""Persistence of new conversation messages."""
+
+from collections import Counter
+from datetime import datetime, timezone
+from typing import Any
+from sqlalchemy import bindparam, insert, update
+from sqlmodel import Session, select
+from pydantic_ai.messages import (
+    ModelMessage, ModelResponse, ToolCallPart, ToolReturnPart, RetryPromptPart,
+    ArgsDict, error_details_ta
+)
+from app.models.message import Message, MessagePart, MessageKind
+from app.models.checkpoint import ContextCheckpoint
+from app.agents.history import after_checkpoint, get_checkpoint
+from app.agents.codec import PAYLOAD_VERSION, encode_message
+from app.agents.search import search_documents
+from app.models.search import SearchDocument
+from app.models.thread import Thread
+from app.config import get_settings
+
+def save_messages(session: Session, thread_id: int, messages: list[ModelMessage]) -> list[int]:
+    """Insert one thread's new messages and their parts, returns the message ids."""
+    return save_turns(session, [(thread_id, messages)])[0]
+
+def save_turns(session: Session, turns: list[tuple[int, list[ModelMessage]]]) -> list[list[int]]:
+    """
+    Insert the messages of any number of turns and their parts in two statements.
+    Messages go in with one INSERT ... RETURNING id, then all parts with a
+    single executemany. With MESSAGE_STORAGE="payload" each message carries
+    its serialized payload instead and the parts statement is skipped.
+    With SEARCH_INDEX, the text parts also go to the search index in one
+    more executemany, whichever way messages are stored.
+    Each turn bumps its thread's version by one.
+    Nothing is committed, so the caller's transaction still decides whether
+    the turns are kept.
+    """
+    bump_versions(session, Counter(thread_id for thread_id, _ in turns))
+    messages = [(thread_id, msg) for thread_id, turn in turns for msg in turn]
+    if not messages:
+        return [[] for _ in turns]
+    settings = get_settings()
+    as_payload = settings.MESSAGE_STORAGE == "payload"
+
+    # Message order is kept through timestamp, then id, as the history loader
+    # reads them, so a thread's timestamps must not go backwards: a model's
+    # timestamp may be whole seconds, earlier than the prompt it answers
+    now = datetime.utcnow()
+    latest: dict[int, datetime] = {}
+    message_rows = []
+    for thread_id, msg in messages:
+        row = message_row(thread_id, msg, as_payload, now)
+        if thread_id in latest and row["timestamp"] < latest[thread_id]:
+            row["timestamp"] = latest[thread_id]
+        latest[thread_id] = row["timestamp"]
+        message_rows.append(row)
+    statement = insert(Message).returning(Message.id, sort_by_parameter_order=True)
+    message_ids = session.scalars(statement, message_rows).all()
+
+    part_rows = [] if as_payload else [
+        part_row(message_id, part)
+        for message_id, (_, msg) in zip(message_ids, messages)
+        for part in msg.parts
+    ]
+    if part_rows:
+        session.execute(insert(MessagePart), part_rows)
+
+    if settings.SEARCH_INDEX:
+        document_rows = search_documents(
+            (message_id, thread_id, msg)
+            for message_id, (thread_id, msg) in zip(message_ids, messages)
+        )
+        if document_rows:
+            session.execute(insert(SearchDocument), document_rows)
+
+    # Split the ids back per turn
+    turn_ids = []
+    start = 0
+    for _, turn in turns:
+        turn_ids.append(list(message_ids[start:start + len(turn)]))
+        start += len(turn)
+    return turn_ids
+
+def bump_versions(session: Session, increments: dict[int, int]) -> None:
+    """Add to the version of each thread, in one executemany."""
+    if not increments:
+        return
+    table = Thread.__table__
+    session.execute(
+        update(table).where(table.c.id == bindparam("thread_id")).values(
+            version=table.c.version + bindparam("increment")
+        ),
+        [{"thread_id": thread_id, "increment": increment} for thread_id, increment in increments.items()]
+    )
+
+def message_timestamp(msg: ModelMessage, now: datetime) -> datetime:
+    """
+    When a message was made, as naive UTC like the timestamp column: a
+    response's own timestamp, a request's latest part timestamp, or `now`
+    when it has none. Clock skew never puts it after `now`, so the next
+    turn's prompt still comes after it.
+    """
+    if isinstance(msg, ModelResponse):
+        timestamp = msg.timestamp
+    else:
+        timestamp = max((part.timestamp for part in msg.parts if getattr(part, "timestamp", None)), default=None)
+    if timestamp is None:
+        return now
+    if timestamp.tzinfo is not None:
+        timestamp = timestamp.astimezone(timezone.utc).replace(tzinfo=None)
+    return min(timestamp, now)
+
+def bump_version(session: Session, thread_id: int) -> int:
+    """
+    Add one to a thread's version and return it. This also locks the
+    thread's row until the transaction ends, so checkpoint writers on a
+    thread take turns, each seeing the previous one's checkpoint.
+    """
+    bump_versions(session, {thread_id: 1})
+    return session.exec(select(Thread.version).where(Thread.id == thread_id)).one()
+
+def message_row(thread_id: int, msg: ModelMessage, as_payload: bool, now: datetime | None = None) -> dict[str, Any]:
+    """Get the Message columns for a pydantic-ai message, with its payload if asked."""
+    row = {
+        "thread_id": thread_id,
+        "kind": MessageKind.REQUEST if msg.kind == "request" else MessageKind.RESPONSE,
+        "timestamp": message_timestamp(msg, now or datetime.utcnow())
+    }
+    if as_payload:
+        row["payload"], row["payload_format"] = encode_message(msg)
+        row["payload_version"] = PAYLOAD_VERSION
+    return row
+
+def part_row(message_id: int, part: Any) -> dict[str, Any]:
+    """Get the MessagePart columns for a pydantic-ai message part."""
+    row = {
+        "message_id": message_id,
+        "part_kind": part.part_kind,
+        "content": getattr(part, "content", None),
+        "timestamp": getattr(part, "timestamp", None),
+        "tool_name": getattr(part, "tool_name", None),
+        "tool_call_id": getattr(part, "tool_call_id", None),
+        "args_json": None,
+        "error_details": None
+    }
+    if isinstance(part, ToolCallPart):
+        # Dict args are stored as a JSON object, raw JSON args as a string
+        row["args_json"] = part.args.args_dict if isinstance(part.args, ArgsDict) else part.args.args_json
+    elif isinstance(part, ToolReturnPart):
+        row["content"] = part.model_response_str()
+    elif isinstance(part, RetryPromptPart) and not isinstance(part.content, str):
+        row["content"] = None
+        row["error_details"] = error_details_ta.dump_python(part.content, mode="json", exclude={"__all__": {"ctx"}})
+    return row
+
+def save_checkpoint(
+    session: Session, thread_id: int, base_version: int, message_count: int,
+    system_prompt: str | None, summary: str, previous_summary: str | None
+) -> ContextCheckpoint | None:
+    """
+    Add a checkpoint covering the next `message_count` messages after the
+    latest one, for history loaded at the thread's `base_version`. Returns
+    None if the latest checkpoint is no longer the one the summary was
+    built on, e.g. retention wrote one since, in which case the caller
+    should roll back the version bump.
+    """
+    version = bump_version(session, thread_id)
+    previous = get_checkpoint(session, thread_id)
+    if previous is not None and previous.thread_version > base_version:
+        return None
+    if (previous.summary if previous else None) != previous_summary:
+        return None
+
+    statement = select(Message.timestamp, Message.id).where(Message.thread_id == thread_id)
+    if previous:
+        statement = statement.where(after_checkpoint(previous))
+    statement = statement.order_by(Message.timestamp, Message.id).offset(message_count - 1).limit(1)
+    through = session.exec(statement).first()
+    if through is None:
+        return None
+
+    checkpoint = ContextCheckpoint(
+        thread_id=thread_id,
+        through_message_id=through.id,
+        through_timestamp=through.timestamp,
+        system_prompt=system_prompt,
+        summary=summary,
+        thread_version=version
+    )
+    session.add(checkpoint)
+    return checkpoint
@@ -0,0 +1,125 @@
+"""Shared HTTP clients for model providers."""
+
+import asyncio
+import importlib.util
+import os
+from typing import Any
+import httpx
+from groq import AsyncGroq
+from pydantic_ai.models.groq import GroqModel
+from app.config import get_settings
+from app.logs import get_logger
+
+logger = get_logger(__name__)
+
+# Used when GROQ_BASE_URL is empty, and the path every Groq endpoint is under
+GROQ_BASE_URL = "https://api.groq.com"
+GROQ_API_PATH = "/openai/v1"
+
+class ProcessTransport(httpx.AsyncBaseTransport):
+    """
+    An HTTP transport whose connection pool belongs to the process using
+    it. Agents preloaded by app.serve hold their client from before the
+    fork, each worker then opens a pool of its own on its first request
+    instead of sharing the parent's.
+    """
+
+    def __init__(self, **options: Any):
+        self.options = options
+        self._pid: int | None = None
+        self._transport: httpx.AsyncHTTPTransport | None = None
+
+    def _current(self) -> httpx.AsyncHTTPTransport:
+        if self._pid != os.getpid():
+            # Whatever was opened before the fork is the parent's to close
+            self._transport = httpx.AsyncHTTPTransport(**self.options)
+            self._pid = os.getpid()
+        return self._transport
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        return await self._current().handle_async_request(request)
+
+    async def aclose(self) -> None:
+        if self._transport is not None and self._pid == os.getpid():
+            await self._transport.aclose()
+        self._transport = None
+
+class ModelClients:
+    """
+    One keep-alive HTTP client per provider, shared by every agent's model.
+    Agents get their models from here instead of building their own, so
+    they share a connection pool, and warm_up() opens connections at
+    startup so the first turn doesn't pay for DNS, TCP and TLS. Pools are
+    per process, see ProcessTransport.
+    """
+
+    def __init__(self):
+        self._clients: dict[str, httpx.AsyncClient] = {}
+
+    def http_client(self, provider: str) -> httpx.AsyncClient:
+        """Get the provider's shared HTTP client, creating it on first use."""
+        client = self._clients.get(provider)
+        if client is None or client.is_closed:
+            client = self._clients[provider] = self._new_client()
+        return client
+
+    def groq_model(self, model_name: str, base_url: str | None = None) -> GroqModel:
+        """Get a Groq model that sends its requests through the shared client."""
+        settings = get_settings()
+        groq_client = AsyncGroq(
+            api_key=settings.GROQ_API_KEY,
+            base_url=base_url or settings.GROQ_BASE_URL or GROQ_BASE_URL,
+            max_retries=settings.MODEL_MAX_RETRIES,
+            http_client=self.http_client("groq"),
+        )
+        return GroqModel(model_name, groq_client=groq_client)
+
+    async def warm_up(self) -> None:
+        """Open connections to the configured providers, failures are only logged."""
+        settings = get_settings()
+        if not settings.MODEL_WARMUP_CONNECTIONS:
+            return
+        base_url = (settings.GROQ_BASE_URL or GROQ_BASE_URL).rstrip("/")
+        client = self.http_client("groq")
+        # Listing models is cheap, and any response leaves pooled connections behind
+        url = base_url + GROQ_API_PATH + "/models"
+        headers = {"Authorization": f"Bearer {settings.GROQ_API_KEY}"}
+        results = await asyncio.gather(
+            *[client.get(url, headers=headers) for _ in range(settings.MODEL_WARMUP_CONNECTIONS)],
+            return_exceptions=True
+        )
+        failed = [r for r in results if isinstance(r, Exception)]
+        if failed:
+            logger.warn("Failed to warm up model provider", provider="groq", error=str(failed[0]))
+        else:
+            logger.info("Warmed up model provider", provider="groq", connections=len(results))
+
+    async def close(self) -> None:
+        """Close every shared client. Call this at shutdown."""
+        clients, self._clients = list(self._clients.values()), {}
+        for client in clients:
+            await client.aclose()
+
+    def _new_client(self) -> httpx.AsyncClient:
+        settings = get_settings()
+        transport = ProcessTransport(
+            http2=settings.MODEL_HTTP2 and _has_h2(),
+            limits=httpx.Limits(
+                max_connections=settings.MODEL_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.MODEL_MAX_KEEPALIVE,
+                keepalive_expiry=settings.MODEL_KEEPALIVE_EXPIRY,
+            ),
+        )
+        return httpx.AsyncClient(
+            transport=transport,
+            timeout=httpx.Timeout(settings.MODEL_READ_TIMEOUT, connect=settings.MODEL_CONNECT_TIMEOUT),
+        )
+
+def _has_h2() -> bool:
+    """Whether HTTP/2 is available, it needs the optional h2 package (httpx[http2])."""
+    if importlib.util.find_spec("h2") is not None:
+        return True
+    logger.warn("h2 is not installed, model providers are called over HTTP/1.1")
+    return False
+
+model_clients = ModelClients()
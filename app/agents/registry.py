@@ -1,69 +1,245 @@
 """Registry for chat agents."""
 
+import asyncio
+import threading
+import time
 import yaml
 import importlib
-import logfire
+from collections import OrderedDict
 from pathlib import Path
 from typing import Dict, Type
+from app.config import get_settings
+from app.logs import get_logger, lazy
+from app.metrics import Counter, Gauge, Histogram
 from .chat import ChatAgent
 
+logger = get_logger(__name__)
+
+agents_loaded = Gauge("chat_agents_loaded", "Agents currently built in this process")
+agent_loads = Counter("chat_agent_loads_total", "Agent builds, by outcome", ["agent", "outcome"])
+agent_load_seconds = Histogram("chat_agent_load_seconds", "Time spent importing and building an agent", ["agent"])
+
 class AgentRegistry:
-    """Registry for chat agents."""
-    
-    _agents: Dict[str, ChatAgent] = {}
+    """
+    Registry for chat agents.
+    Only the entries of config/agents.yaml are read at startup: an agent is
+    imported and built on its first get(), once even when requests for it
+    race. With AGENTS_MAX_LOADED set, the least recently used idle agents
+    are dropped and rebuilt on their next get(). watch() reloads entries
+    whose config changed while the process runs.
+    """
+
+    _agents: "OrderedDict[str, ChatAgent]" = OrderedDict()
     _metadata: Dict[str, dict] = {}
-    
+    _pinned: set[str] = set()  # Registered instances, which can't be rebuilt
+    _lock = threading.Lock()
+    _build_locks: Dict[str, threading.Lock] = {}
+    _config_path: Path = Path("config/agents.yaml")
+    _config_mtime: int | None = None
+    _watcher: asyncio.Task | None = None
+
     @classmethod
     def register(cls, agent_id: str, agent: ChatAgent) -> None:
         """Register a new agent instance."""
-        cls._agents[agent_id] = agent
-    
+        with cls._lock:
+            cls._agents[agent_id] = agent
+            cls._pinned.add(agent_id)
+            agents_loaded.set(len(cls._agents))
+
     @classmethod
     def get(cls, agent_id: str) -> ChatAgent:
-        """Get an agent by ID."""
-        if agent_id not in cls._agents:
-            raise ValueError(f"Unknown agent: {agent_id}")
-        return cls._agents[agent_id]
-    
+        """Get an agent by ID, building it on first use."""
+        with cls._lock:
+            agent = cls._agents.get(agent_id)
+            if agent is not None:
+                cls._agents.move_to_end(agent_id)
+                return agent
+            if agent_id not in cls._metadata:
+                raise ValueError(f"Unknown agent: {agent_id}")
+            build_lock = cls._build_locks.setdefault(agent_id, threading.Lock())
+
+        # One build per agent, callers racing it wait and get the same instance
+        with build_lock:
+            with cls._lock:
+                agent = cls._agents.get(agent_id)
+                entry = cls._metadata.get(agent_id)
+            if agent is not None:
+                return agent
+            if entry is None:
+                raise ValueError(f"Unknown agent: {agent_id}")
+
+            agent = cls._build(entry)
+            with cls._lock:
+                # Keep it only if the entry wasn't changed or removed while building
+                if cls._metadata.get(agent_id) is entry:
+                    cls._agents[agent_id] = agent
+                    cls._evict()
+                    agents_loaded.set(len(cls._agents))
+            return agent
+
     @classmethod
     def list(cls) -> list[dict]:
-        """List all registered agents."""
+        """List all registered agents, without building them."""
+        with cls._lock:
+            entries = dict(cls._metadata)
+            entries.update({agent_id: {} for agent_id in cls._pinned if agent_id not in entries})
         return [
             {
                 "id": agent_id,
-                "name": agent_id.title(),  # Simple name from ID for now
-                "description": "A chat agent"  # Simple description for now
+                "name": entry.get("name", agent_id.title()),
+                "description": entry.get("description", "A chat agent")
             }
-            for agent_id in cls._agents
+            for agent_id, entry in entries.items()
         ]
-    
+
+    @classmethod
+    def config(cls, agent_id: str) -> dict | None:
+        """Get an agent's config entry without building it."""
+        return cls._metadata.get(agent_id)
+
+    @classmethod
+    def load_from_config(cls, config_path: Path | None = None) -> None:
+        """Read the agent entries of the config file, agents are built on first use."""
+        cls._config_path = Path(config_path or get_settings().AGENTS_CONFIG)
+        try:
+            cls._config_mtime = cls._config_path.stat().st_mtime_ns
+            cls._apply(cls._read_entries(cls._config_path))
+        except Exception as e:
+            logger.error("Failed to load config", path=str(cls._config_path), error=str(e))
+
     @classmethod
-    def load_from_config(cls) -> None:
-        """Load agents from config file."""
-        config_path = Path("config/agents.yaml")
+    def reload(cls) -> bool:
+        """Re-read the config file if it changed, returns whether it was applied."""
         try:
-            with config_path.open() as f:
-                config = yaml.safe_load(f)
-            
-            for entry in config["agents"]:
-                try:
-                    module_path, class_name = entry["package"].rsplit(".", 1)
-                    logfire.info(f"Loading module {module_path}")
-                    module = importlib.import_module(module_path)
-                    logfire.info(f"Getting class {class_name} from module")
-                    agent_class = getattr(module, class_name)
-                    logfire.info(f"Got agent_class: {agent_class} of type {type(agent_class)}")
-                    logfire.info(f"Module dict: {module.__dict__.keys()}")
-                    
-                    # Make sure we got a class and it's a ChatAgent
-                    if not isinstance(agent_class, type):
-                        raise TypeError(f"Expected a class, got {type(agent_class)}")
-                    if not issubclass(agent_class, ChatAgent):
-                        raise TypeError(f"Expected a ChatAgent subclass, got {agent_class}")
-                        
-                    agent = agent_class()
-                    cls.register(entry["id"], agent)
-                except Exception as e:
-                    logfire.error(f"Failed to load agent {entry['id']}: {e}")
+            mtime = cls._config_path.stat().st_mtime_ns
+            if mtime == cls._config_mtime:
+                return False
+            entries = cls._read_entries(cls._config_path)
         except Exception as e:
-            logfire.error(f"Failed to load config {config_path}: {e}") 
\ No newline at end of file
+            # Keep serving the last good config, a half-written file is retried next time
+            logger.error("Failed to reload config", path=str(cls._config_path), error=str(e))
+            return False
+        cls._config_mtime = mtime
+        cls._apply(entries)
+        return True
+
+    @classmethod
+    def preload(cls) -> None:
+        """Build every configured agent now rather than on first use."""
+        for agent_id in list(cls._metadata):
+            try:
+                cls.get(agent_id)
+            except ValueError as e:
+                logger.error(str(e))
+
+    @classmethod
+    async def watch(cls, interval: float) -> None:
+        """Reload the config file whenever it changes, until cancelled."""
+        while True:
+            await asyncio.sleep(interval)
+            cls.reload()
+
+    @classmethod
+    def start_watching(cls) -> None:
+        """Watch the config file in the background, if AGENTS_RELOAD_INTERVAL is set."""
+        interval = get_settings().AGENTS_RELOAD_INTERVAL
+        if interval > 0 and cls._watcher is None:
+            cls._watcher = asyncio.create_task(cls.watch(interval))
+
+    @classmethod
+    async def stop_watching(cls) -> None:
+        """Stop watching the config file."""
+        if cls._watcher is None:
+            return
+        cls._watcher.cancel()
+        try:
+            await cls._watcher
+        except asyncio.CancelledError:
+            pass
+        cls._watcher = None
+
+    @classmethod
+    def _read_entries(cls, config_path: Path) -> Dict[str, dict]:
+        """Parse and check the agent entries of a config file, skipping invalid ones."""
+        with config_path.open() as f:
+            config = yaml.safe_load(f)
+
+        entries = {}
+        for entry in config["agents"]:
+            if not isinstance(entry, dict) or "id" not in entry or "." not in str(entry.get("package", "")):
+                logger.error("Invalid agent entry", entry=entry)
+                continue
+            entries[entry["id"]] = entry
+        return entries
+
+    @classmethod
+    def _apply(cls, entries: Dict[str, dict]) -> None:
+        """Swap in new entries, dropping built agents whose entry changed or went away."""
+        with cls._lock:
+            for agent_id, old in list(cls._metadata.items()):
+                if entries.get(agent_id) != old:
+                    # In-flight requests keep the instance they already got
+                    if agent_id not in cls._pinned:
+                        cls._agents.pop(agent_id, None)
+                    logger.info("Agent config changed", agent=agent_id, removed=agent_id not in entries)
+            for agent_id, entry in entries.items():
+                if cls._metadata.get(agent_id) == entry:
+                    entries[agent_id] = cls._metadata[agent_id]  # Keep identity for racing builds
+                elif agent_id not in cls._metadata:
+                    logger.debug("Agent config added", agent=agent_id)
+            cls._metadata = entries
+            agents_loaded.set(len(cls._agents))
+
+    @classmethod
+    def _build(cls, entry: dict) -> ChatAgent:
+        """Import, build and configure an agent from its config entry."""
+        agent_id = entry["id"]
+        start = time.monotonic()
+        try:
+            module_path, class_name = entry["package"].rsplit(".", 1)
+            logger.debug("Loading module", module=module_path)
+            module = importlib.import_module(module_path)
+            logger.debug("Getting class from module", module=module_path, class_name=class_name)
+            agent_class: Type[ChatAgent] = getattr(module, class_name)
+            logger.debug("Got agent class", agent_class=lazy(lambda: repr(agent_class)))
+            logger.debug("Module dict", keys=lazy(lambda: list(module.__dict__)))
+
+            # Make sure we got a class and it's a ChatAgent
+            if not isinstance(agent_class, type):
+                raise TypeError(f"Expected a class, got {type(agent_class)}")
+            if not issubclass(agent_class, ChatAgent):
+                raise TypeError(f"Expected a ChatAgent subclass, got {agent_class}")
+
+            agent = agent_class()
+            agent.configure(entry)
+        except Exception as e:
+            agent_loads.inc(agent=agent_id, outcome="error")
+            logger.error("Failed to load agent", agent=agent_id, error=str(e))
+            raise ValueError(f"Failed to load agent {agent_id}: {e}") from e
+
+        elapsed = time.monotonic() - start
+        agent_loads.inc(agent=agent_id, outcome="ok")
+        agent_load_seconds.observe(elapsed, agent=agent_id)
+        logger.info("Loaded agent", agent=agent_id, seconds=round(elapsed, 3))
+        return agent
+
+    @classmethod
+    def _evict(cls) -> None:
+        """Drop least recently used idle agents beyond AGENTS_MAX_LOADED, holding `_lock`."""
+        max_loaded = get_settings().AGENTS_MAX_LOADED
+        if max_loaded <= 0:
+            return
+        excess = len(cls._agents) - max_loaded
+        for agent_id in list(cls._agents):
+            if excess <= 0:
+                break
+            if agent_id in cls._pinned or not _is_idle(cls._agents[agent_id]):
+                continue
+            del cls._agents[agent_id]
+            excess -= 1
+            logger.debug("Evicted idle agent", agent=agent_id)
+
+def _is_idle(agent: ChatAgent) -> bool:
+    """Whether an agent has no model calls in flight or queued, as far as its limiter knows."""
+    limiter = agent.limiter
+    return limiter is None or (limiter.in_flight == 0 and limiter.depth == 0)
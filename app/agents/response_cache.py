@@ -0,0 +1,213 @@
+"""Exact-match cache of model responses for deterministic agents."""
+
+import hashlib
+import json
+import time
+from collections import OrderedDict
+from dataclasses import asdict, dataclass
+from datetime import datetime, timedelta
+from typing import Any
+from pydantic import BaseModel
+from pydantic_ai import Agent
+from pydantic_ai.messages import ModelMessage, ModelMessagesTypeAdapter, ModelResponse
+from pydantic_ai.models import AgentModel, Model
+from pydantic_ai.result import Usage
+from sqlalchemy.exc import IntegrityError
+from sqlmodel import Session, select
+from app.db.core import new_async_session
+from app.logs import get_logger
+from app.metrics import Counter, Gauge
+from app.models.response_cache import CachedResponse
+from app.tools import tool_registry
+
+logger = get_logger(__name__)
+
+response_cache_requests = Counter(
+    "response_cache_requests_total", "Model requests looked up in the response cache", ["agent", "result"]
+)
+response_cache_bytes = Gauge(
+    "response_cache_bytes", "Bytes of responses held in memory", ["agent"]
+)
+response_cache_entries = Gauge(
+    "response_cache_entries", "Responses held in memory", ["agent"]
+)
+
+class ResponseCacheConfig(BaseModel):
+    """An agent's response cache settings from config/agents.yaml."""
+    max_entries: int = 1000
+    max_bytes: int = 16 * 1024 * 1024
+    ttl: float = 3600  # Seconds
+    persist: bool = False  # Also keep responses in the database
+
+@dataclass
+class ResponseCacheStats:
+    """Counters for a response cache."""
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+
+def nondeterministic_tools(agent: Agent) -> list[str]:
+    """Names of an agent's tools that aren't registered as pure."""
+    return [
+        name for name in agent._function_tools
+        if name not in tool_registry or not tool_registry.get(name).pure
+    ]
+
+def _normalize(messages: list[ModelMessage]) -> Any:
+    """Messages as JSON without what changes between identical requests."""
+    dumped = ModelMessagesTypeAdapter.dump_python(messages, mode="json")
+    for message in dumped:
+        message.pop("timestamp", None)
+        for part in message["parts"]:
+            part.pop("timestamp", None)
+            if isinstance(part.get("content"), str):
+                part["content"] = part["content"].strip()
+    return dumped
+
+class ResponseCache:
+    """
+    LRU cache of serialized model responses with TTL expiry, capped both
+    in entries and in bytes. With `persist`, misses are looked up in the
+    cachedresponse table and new responses are written there too.
+    """
+
+    def __init__(self, agent_id: str, config: ResponseCacheConfig):
+        self.agent_id = agent_id
+        self.config = config
+        self.stats = ResponseCacheStats()
+        self.bytes = 0
+        self._entries: OrderedDict[str, tuple[bytes, float]] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    async def get(self, key: str) -> ModelResponse | None:
+        """Get a cached response, from memory then the database."""
+        payload = self._get(key)
+        if payload is None and self.config.persist:
+            payload = await self._load(key)
+            if payload is not None:
+                self._put(key, payload)
+        if payload is None:
+            self.stats.misses += 1
+            response_cache_requests.inc(agent=self.agent_id, result="miss")
+            return None
+        self.stats.hits += 1
+        response_cache_requests.inc(agent=self.agent_id, result="hit")
+        response = ModelMessagesTypeAdapter.validate_json(b"[" + payload + b"]")[0]
+        response.timestamp = datetime.now(response.timestamp.tzinfo)
+        return response
+
+    async def put(self, key: str, response: ModelResponse) -> None:
+        """Cache a response."""
+        payload = ModelMessagesTypeAdapter.dump_json([response])[1:-1]
+        self._put(key, payload)
+        if self.config.persist:
+            await self._store(key, payload)
+
+    def _get(self, key: str) -> bytes | None:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry[1] <= time.monotonic():
+            self._drop(key)
+            return None
+        self._entries.move_to_end(key)
+        return entry[0]
+
+    def _put(self, key: str, payload: bytes) -> None:
+        if len(payload) > self.config.max_bytes or self.config.max_entries <= 0:
+            return
+        if key in self._entries:
+            self._drop(key)
+        self._entries[key] = (payload, time.monotonic() + self.config.ttl)
+        self.bytes += len(payload)
+        while len(self._entries) > self.config.max_entries or self.bytes > self.config.max_bytes:
+            self._drop(next(iter(self._entries)))
+            self.stats.evictions += 1
+        response_cache_bytes.set(self.bytes, agent=self.agent_id)
+        response_cache_entries.set(len(self._entries), agent=self.agent_id)
+
+    def _drop(self, key: str) -> None:
+        payload, _ = self._entries.pop(key)
+        self.bytes -= len(payload)
+
+    async def _load(self, key: str) -> bytes | None:
+        try:
+            async with new_async_session() as session:
+                return await session.run_sync(_load_response, key, self.config.ttl)
+        except Exception as e:
+            logger.error("Failed to load cached response", agent=self.agent_id, error=str(e))
+            return None
+
+    async def _store(self, key: str, payload: bytes) -> None:
+        try:
+            async with new_async_session() as session:
+                await session.run_sync(_save_response, key, self.agent_id, payload)
+                await session.commit()
+        except IntegrityError:
+            pass  # Stored by another worker
+        except Exception as e:
+            logger.error("Failed to store cached response", agent=self.agent_id, error=str(e))
+
+def _load_response(session: Session, key: str, ttl: float) -> bytes | None:
+    statement = select(CachedResponse.payload).where(
+        CachedResponse.key == key,
+        CachedResponse.created_at >= datetime.utcnow() - timedelta(seconds=ttl)
+    )
+    return session.exec(statement).first()
+
+def _save_response(session: Session, key: str, agent_id: str, payload: bytes) -> None:
+    # An expired row with the same key is replaced
+    existing = session.get(CachedResponse, key)
+    if existing is not None:
+        existing.payload = payload
+        existing.created_at = datetime.utcnow()
+    else:
+        session.add(CachedResponse(key=key, agent_id=agent_id, payload=payload))
+    session.flush()
+
+class CachedModel(Model):
+    """
+    Wraps an agent's model so identical requests are answered from a
+    ResponseCache. The key hashes the model name, the tool and result
+    definitions and the whole message history, system prompt and new
+    prompt included, with timestamps dropped and text stripped. Streamed
+    requests always go to the model.
+    """
+
+    def __init__(self, model: Model, cache: ResponseCache):
+        self.model = model
+        self.cache = cache
+
+    def name(self) -> str:
+        return self.model.name()
+
+    async def agent_model(self, **kwargs: Any) -> AgentModel:
+        # function_tools, allow_text_result and result_tools
+        tools = {name: [asdict(tool) for tool in value] if isinstance(value, list) else value for name, value in kwargs.items()}
+        return CachedAgentModel(await self.model.agent_model(**kwargs), self, json.dumps(tools, sort_keys=True, default=str))
+
+class CachedAgentModel(AgentModel):
+    """The per-run side of a CachedModel."""
+
+    def __init__(self, agent_model: AgentModel, model: CachedModel, tools: str):
+        self.agent_model = agent_model
+        self.model = model
+        self.tools = tools
+
+    def key(self, messages: list[ModelMessage]) -> str:
+        content = json.dumps([self.model.name(), self.tools, _normalize(messages)], sort_keys=True, default=str)
+        return hashlib.sha256(content.encode()).hexdigest()
+
+    async def request(self, messages: list[ModelMessage], *args: Any, **kwargs: Any) -> tuple[ModelResponse, Usage]:
+        key = self.key(messages)
+        cached = await self.model.cache.get(key)
+        if cached is not None:
+            return cached, Usage()
+        response, usage = await self.agent_model.request(messages, *args, **kwargs)
+        await self.model.cache.put(key, response)
+        return response, usage
+
+    def request_stream(self, *args: Any, **kwargs: Any):
+        return self.agent_model.request_stream(*args, **kwargs)
@@ -0,0 +1,384 @@
+"""
+Retention of thread history: old messages are archived, then deleted.
+
+Each agent's `retention` section in config/agents.yaml says what stays
+hot in its threads:
+
+    retention:
+      keep_messages: 200  # Newest messages of each thread
+      keep_days: 30  # Messages newer than this
+      archive: table  # "table", "file" or "none"
+
+A message is archived only when neither limit keeps it. Cuts land on
+turn starts, so a kept history never begins with a tool return, and a
+checkpoint covering the archived messages is written before anything is
+deleted, carrying the thread's system prompt and latest summary, so
+history loads never see a partly archived thread. The message that
+checkpoint points at stays as an empty row until the next run.
+
+It's safe to run next to the servers: the checkpoint bumps the thread's
+version, so servers reload the history they cached, and a checkpoint a
+server was summarizing from the older history is discarded.
+
+    python -m app.agents.retention --dry-run
+    python -m app.agents.retention --agent full
+"""
+
+import argparse
+import json
+import os
+import time
+from dataclasses import asdict, dataclass
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Literal
+from pydantic import BaseModel
+from pydantic_ai.messages import ModelMessage, ModelMessagesTypeAdapter
+from sqlalchemy import delete, func, insert, tuple_, update
+from sqlmodel import Session, select
+from app.config import get_settings
+from app.logs import get_logger, configure_logfire
+from app.agents.codec import PAYLOAD_VERSION, check_format, compress, encode_message
+from app.agents.context import head_prompts, is_turn_start, split_head
+from app.agents.history import get_checkpoint, load_messages, load_page
+from app.agents.persistence import bump_version
+from app.agents.registry import AgentRegistry
+from app.models.archive import ArchivedMessage
+from app.models.checkpoint import ContextCheckpoint
+from app.models.message import Message, MessagePart
+from app.models.search import SearchDocument
+from app.models.thread import Thread
+
+logger = get_logger(__name__)
+
+# Summary of the checkpoint standing in for archived messages, when there was none yet
+ARCHIVED_SUMMARY = "Earlier messages of this conversation were archived."
+
+# Messages read at a time while looking back for a turn start
+TURN_PAGE = 20
+
+# Threads read at a time
+THREAD_PAGE = 100
+
+# (timestamp, id), the order history is read in
+MessageKey = tuple[datetime, int]
+
+class RetentionConfig(BaseModel):
+    """An agent's retention settings from config/agents.yaml."""
+    keep_messages: int | None = None  # Newest messages kept per thread
+    keep_days: float | None = None  # Messages newer than this are kept
+    archive: Literal["table", "file", "none"] = "table"
+
+@dataclass
+class RetentionReport:
+    """Rows removed from the hot tables, or that would be in a dry run."""
+    threads: int = 0
+    messages: int = 0
+    parts: int = 0
+    documents: int = 0
+    bytes: int = 0  # Stored content and payloads, without row and index overhead
+
+    def add(self, other: "RetentionReport") -> None:
+        self.threads += other.threads
+        self.messages += other.messages
+        self.parts += other.parts
+        self.documents += other.documents
+        self.bytes += other.bytes
+
+def archive_through(session: Session, thread_id: int, config: RetentionConfig, now: datetime) -> MessageKey | None:
+    """The key of the newest message of a thread to archive, None if it has none."""
+    if config.keep_messages is None and config.keep_days is None:
+        return None  # No limits, everything is kept
+    key = (Message.timestamp, Message.id)
+    in_thread = select(*key).where(Message.thread_id == thread_id)
+    kept: list[MessageKey] = []  # First message each limit keeps
+    if config.keep_messages is not None and config.keep_messages > 0:
+        row = session.exec(
+            in_thread.order_by(Message.timestamp.desc(), Message.id.desc()).offset(config.keep_messages - 1).limit(1)
+        ).first()
+        if row is None:
+            return None  # Fewer messages than that
+        kept.append(tuple(row))
+    if config.keep_days is not None:
+        row = session.exec(
+            in_thread.where(Message.timestamp >= now - timedelta(days=config.keep_days))
+            .order_by(Message.timestamp, Message.id).limit(1)
+        ).first()
+        if row is not None:
+            kept.append(tuple(row))
+
+    if not kept:
+        # Every limit lets the whole thread go
+        row = session.exec(in_thread.order_by(Message.timestamp.desc(), Message.id.desc()).limit(1)).first()
+        return tuple(row) if row is not None else None
+
+    # Keep from the turn start at or before the first kept message, the
+    # key just above it takes that message itself in the page
+    first_kept = None
+    before = (min(kept)[0], min(kept)[1] + 1)
+    while first_kept is None:
+        page = load_page(session, thread_id, before, TURN_PAGE)
+        if not page:
+            return None  # No turn start to cut at
+        for message_id, timestamp, message in reversed(page):
+            if is_turn_start(message):
+                first_kept = (timestamp, message_id)
+                break
+        before = (page[0][1], page[0][0])
+    row = session.exec(
+        in_thread.where(tuple_(*key) < tuple_(*first_kept)).order_by(Message.timestamp.desc(), Message.id.desc()).limit(1)
+    ).first()
+    return tuple(row) if row is not None else None
+
+def checkpoint_archived(session: Session, thread_id: int, through: MessageKey) -> ContextCheckpoint:
+    """
+    Make the thread's latest checkpoint cover the messages up to the
+    (timestamp, id) key `through`, the order they're archived and read in,
+    and drop the ones it supersedes, which may point at archived messages.
+    Bumping the thread's version makes servers drop the history they
+    cached from before, and makes a checkpoint a server is summarizing
+    from that history give way to this one.
+    """
+    version = bump_version(session, thread_id)
+    latest = get_checkpoint(session, thread_id)
+    if latest is not None:
+        # Checkpoints from before through_timestamp point at a kept message
+        timestamp = latest.through_timestamp or session.get(Message, latest.through_message_id).timestamp
+    if latest is None or (timestamp, latest.through_message_id) < through:
+        if latest is not None:
+            system_prompt, summary = latest.system_prompt, latest.summary
+        else:
+            system_prompt, summary = _system_prompt(session, thread_id), ARCHIVED_SUMMARY
+        latest = ContextCheckpoint(
+            thread_id=thread_id, through_message_id=through[1], through_timestamp=through[0],
+            system_prompt=system_prompt, summary=summary, thread_version=version
+        )
+        session.add(latest)
+        session.flush()
+    session.execute(delete(ContextCheckpoint).where(
+        ContextCheckpoint.thread_id == thread_id, ContextCheckpoint.id != latest.id
+    ))
+    return latest
+
+def _system_prompt(session: Session, thread_id: int) -> str | None:
+    """The system prompt stored with a thread's first message."""
+    first = session.exec(
+        select(Message.timestamp, Message.id).where(Message.thread_id == thread_id)
+        .order_by(Message.timestamp, Message.id).limit(1)
+    ).first()
+    if first is None:
+        return None
+    page = load_page(session, thread_id, (first[0], first[1] + 1), 1)
+    head, _ = split_head([message for _, _, message in page])
+    return head_prompts(head)[0]
+
+class FileArchive:
+    """
+    Appends archived messages to JSONL files, one per persona and day,
+    zstd-compressed, one frame per batch, when the format ends in "+zstd".
+    Files are synced before the batch's rows are deleted, a batch whose
+    delete then fails is written again by the next run.
+    """
+
+    def __init__(self, directory: str, payload_format: str):
+        self.directory = Path(directory)
+        self.compressed = payload_format.endswith("+zstd")
+
+    def write(self, thread: Thread, messages: list[tuple[int, datetime, ModelMessage]]) -> None:
+        lines = []
+        for (message_id, timestamp, _), dumped in zip(
+            messages, ModelMessagesTypeAdapter.dump_python([m for _, _, m in messages], mode="json")
+        ):
+            lines.append(json.dumps({
+                "id": message_id,
+                "thread_id": thread.id,
+                "user_id": thread.user_id,
+                "persona_id": thread.persona_id,
+                "timestamp": timestamp.isoformat(),
+                "message": dumped
+            }) + "\n")
+        data = "".join(lines).encode()
+        path = self.directory / thread.persona_id / f"{datetime.utcnow():%Y-%m-%d}.jsonl"
+        if self.compressed:
+            data = compress(data)
+            path = path.with_suffix(".jsonl.zst")
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with path.open("ab") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+
+class Retention:
+    """
+    Applies retention policies a thread at a time, in small keyset-ordered
+    batches, each archived and deleted in a transaction of its own. After
+    every batch the job pauses so it spends at most `duty_cycle` of its
+    time in the database, next to live traffic. A dry run only measures.
+    """
+
+    def __init__(self, engine, batch_size: int, duty_cycle: float, archive_dir: str, payload_format: str, dry_run: bool = False):
+        self.engine = engine
+        self.batch_size = batch_size
+        self.duty_cycle = min(1.0, max(0.01, duty_cycle))
+        self.payload_format = payload_format
+        self.files = FileArchive(archive_dir, payload_format)
+        self.dry_run = dry_run
+
+    def run_agent(self, agent_id: str, config: RetentionConfig) -> RetentionReport:
+        """Apply an agent's policy to all of its threads."""
+        now = datetime.utcnow()
+        report = RetentionReport()
+        after_id = 0
+        while True:
+            with Session(self.engine) as session:
+                threads = list(session.exec(
+                    select(Thread).where(Thread.persona_id == agent_id, Thread.id > after_id)
+                    .order_by(Thread.id).limit(THREAD_PAGE)
+                ))
+            if not threads:
+                return report
+            after_id = threads[-1].id
+            for thread in threads:
+                report.add(self.run_thread(thread, config, now))
+
+    def run_thread(self, thread: Thread, config: RetentionConfig, now: datetime) -> RetentionReport:
+        """Archive and delete a thread's messages beyond what its policy keeps."""
+        report = RetentionReport()
+        with Session(self.engine) as session:
+            through = archive_through(session, thread.id, config, now)
+            if through is None:
+                return report
+            if not self.dry_run:
+                checkpoint_archived(session, thread.id, through)
+                session.commit()
+        report.threads = 1
+
+        key = tuple_(Message.timestamp, Message.id)
+        after: MessageKey | None = None
+        while True:
+            started = time.monotonic()
+            with Session(self.engine) as session:
+                statement = select(
+                    Message.id, Message.kind, Message.timestamp,
+                    Message.payload, Message.payload_format, Message.payload_version
+                ).where(
+                    Message.thread_id == thread.id, key <= tuple_(*through)
+                ).order_by(Message.timestamp, Message.id).limit(self.batch_size)
+                if after is not None:
+                    statement = statement.where(key > tuple_(*after))
+                rows = list(session.exec(statement))
+                if not rows:
+                    return report
+                after = (rows[-1].timestamp, rows[-1].id)
+
+                # The message the checkpoint points at is emptied rather than deleted
+                message_ids = [row.id for row in rows]
+                deleted_ids = [message_id for message_id in message_ids if message_id != through[1]]
+                report.add(self._measure(session, rows, message_ids, len(deleted_ids)))
+                if not self.dry_run:
+                    self._archive(session, thread, rows, config.archive)
+                    self._delete(session, message_ids, deleted_ids)
+                    session.commit()
+            self._pause(time.monotonic() - started)
+
+    def _measure(self, session: Session, rows: list, message_ids: list[int], deleted: int) -> RetentionReport:
+        parts, part_bytes = session.exec(
+            select(func.count(), func.coalesce(func.sum(func.length(MessagePart.content)), 0))
+            .where(MessagePart.message_id.in_(message_ids))
+        ).one()
+        documents, document_bytes = session.exec(
+            select(func.count(), func.coalesce(func.sum(func.length(SearchDocument.content)), 0))
+            .where(SearchDocument.message_id.in_(message_ids))
+        ).one()
+        payload_bytes = sum(len(row.payload) for row in rows if row.payload is not None)
+        return RetentionReport(
+            messages=deleted, parts=parts, documents=documents,
+            bytes=payload_bytes + part_bytes + document_bytes
+        )
+
+    def _archive(self, session: Session, thread: Thread, rows: list, mode: str) -> None:
+        if mode == "none":
+            return
+        messages = load_messages(session, rows)
+        # Rows emptied by an earlier run were archived then
+        archived = [(row.id, row.timestamp, messages[row.id]) for row in rows if messages[row.id].parts]
+        if not archived:
+            return
+        if mode == "file":
+            self.files.write(thread, archived)
+            return
+        values = []
+        for message_id, timestamp, message in archived:
+            payload, payload_format = encode_message(message, self.payload_format)
+            values.append({
+                "id": message_id,
+                "thread_id": thread.id,
+                "user_id": thread.user_id,
+                "persona_id": thread.persona_id,
+                "timestamp": timestamp,
+                "payload": payload,
+                "payload_format": payload_format,
+                "payload_version": PAYLOAD_VERSION
+            })
+        session.execute(insert(ArchivedMessage), values)
+
+    def _delete(self, session: Session, message_ids: list[int], deleted_ids: list[int]) -> None:
+        session.execute(delete(SearchDocument).where(SearchDocument.message_id.in_(message_ids)))
+        session.execute(delete(MessagePart).where(MessagePart.message_id.in_(message_ids)))
+        if deleted_ids:
+            session.execute(delete(Message).where(Message.id.in_(deleted_ids)))
+        if len(deleted_ids) < len(message_ids):
+            emptied = set(message_ids) - set(deleted_ids)
+            session.execute(update(Message).where(Message.id.in_(emptied)).values(
+                payload=None, payload_format=None, payload_version=None
+            ))
+
+    def _pause(self, elapsed: float) -> None:
+        """Sleep so batches take `duty_cycle` of the time, slower batches pause longer."""
+        if self.duty_cycle < 1:
+            time.sleep(elapsed * (1 - self.duty_cycle) / self.duty_cycle)
+
+def policies(agent_ids: list[str] | None = None) -> dict[str, RetentionConfig]:
+    """The retention policies of the configured agents, or of the given ones."""
+    result = {}
+    for agent in AgentRegistry.list():
+        entry = AgentRegistry.config(agent["id"]) or {}
+        if entry.get("retention") and (not agent_ids or agent["id"] in agent_ids):
+            result[agent["id"]] = RetentionConfig(**entry["retention"])
+    return result
+
+def main(argv: list[str] | None = None) -> None:
+    """Apply every agent's retention policy, printing a JSON report per agent."""
+    settings = get_settings()
+    parser = argparse.ArgumentParser(description="Archive and delete thread history beyond each agent's retention policy.")
+    parser.add_argument("--dry-run", action="store_true", help="Only report the rows and bytes that would be reclaimed")
+    parser.add_argument("--agent", action="append", help="Only this agent, may be repeated")
+    parser.add_argument("--batch-size", type=int, default=settings.RETENTION_BATCH_SIZE, help="Messages per transaction")
+    args = parser.parse_args(argv)
+
+    from app.db.core import init_engine, get_engine, create_db_and_tables, schema_lock
+
+    configure_logfire()
+    init_engine()
+    engine = get_engine()
+    with schema_lock(engine):
+        create_db_and_tables()
+    AgentRegistry.load_from_config()
+    selected = policies(args.agent)
+    if any(config.archive != "none" for config in selected.values()):
+        check_format(settings.RETENTION_ARCHIVE_FORMAT)
+
+    retention = Retention(
+        engine, args.batch_size, settings.RETENTION_DUTY_CYCLE,
+        settings.RETENTION_ARCHIVE_DIR, settings.RETENTION_ARCHIVE_FORMAT, args.dry_run
+    )
+    total = RetentionReport()
+    for agent_id, config in selected.items():
+        report = retention.run_agent(agent_id, config)
+        total.add(report)
+        logger.info("Applied retention", agent=agent_id, dry_run=args.dry_run, **asdict(report))
+        print(json.dumps({"agent": agent_id, "dry_run": args.dry_run, **asdict(report)}))
+    print(json.dumps({"agent": None, "dry_run": args.dry_run, **asdict(total)}))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,317 @@
+"""Model routing: fallback chains, hedged requests and circuit breakers."""
+
+import asyncio
+import math
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Callable
+from pydantic import BaseModel
+from pydantic_ai.models import AgentModel, Model
+from app.agents.concurrency import Overloaded
+from app.agents.providers import model_clients
+from app.logs import get_logger
+from app.metrics import Counter, Gauge, Histogram
+
+logger = get_logger(__name__)
+
+route_attempts = Counter(
+    "model_route_attempts_total", "Requests sent to each model, by outcome", ["model", "outcome"]
+)
+route_hedges = Counter(
+    "model_route_hedges_total", "Requests hedged to the next model", ["router"]
+)
+route_fallbacks = Counter(
+    "model_route_fallbacks_total", "Requests retried on the next model after an error", ["router"]
+)
+route_first_token = Histogram(
+    "model_first_token_seconds", "Time to a model's response, or first streamed token", ["model"]
+)
+breaker_open = Gauge(
+    "model_breaker_open", "Whether a model's circuit breaker is open", ["agent", "model"]
+)
+
+class RouteConfig(BaseModel):
+    """A model of the chain: "provider:model_name", with an optional base URL."""
+    model: str
+    base_url: str | None = None
+
+class HedgeConfig(BaseModel):
+    """When to send the request to the next model too."""
+    percentile: float = 95  # Of the current model's recent first-token times
+    min_delay: float = 0.25  # Seconds
+    max_delay: float = 10
+    default_delay: float = 2  # Until `min_samples` are known
+    min_samples: int = 20
+
+class BreakerConfig(BaseModel):
+    """When a model is taken out of the chain."""
+    failures: int = 5  # Consecutive failures that open the breaker
+    reset_after: float = 30  # Seconds before a trial request is let through
+
+class RoutingConfig(BaseModel):
+    """An agent's model routing settings from config/agents.yaml."""
+    chain: list[str | RouteConfig]
+    hedge: HedgeConfig | None = None
+    breaker: BreakerConfig = BreakerConfig()
+
+class ModelHealth:
+    """
+    Circuit breaker and recent first-token times of one model of an
+    agent's chain. After `failures` consecutive failures the model is
+    skipped for `reset_after` seconds, then a single trial request decides
+    whether it's closed again or stays open. Full responses and opened
+    streams take different times, so their latencies are kept apart.
+    """
+
+    def __init__(self, agent: str, name: str, config: BreakerConfig, window: int = 200):
+        self.agent = agent
+        self.name = name
+        self.config = config
+        self.failures = 0
+        self.opened_at: float | None = None
+        self.trial = False
+        self.latencies: deque[float] = deque(maxlen=window)
+        self.stream_latencies: deque[float] = deque(maxlen=window)
+
+    @property
+    def is_open(self) -> bool:
+        return self.opened_at is not None
+
+    def retry_in(self) -> float:
+        """Seconds before the breaker lets a trial through."""
+        if self.opened_at is None:
+            return 0
+        return max(0.0, self.opened_at + self.config.reset_after - time.monotonic())
+
+    def allow(self) -> bool:
+        """Whether a request may be sent, taking the trial slot of an expired open breaker."""
+        if self.opened_at is None:
+            return True
+        if self.trial or self.retry_in() > 0:
+            return False
+        self.trial = True
+        return True
+
+    def window(self, streamed: bool) -> deque[float]:
+        """The recent latencies of streamed or full-response requests."""
+        return self.stream_latencies if streamed else self.latencies
+
+    def succeeded(self, seconds: float, streamed: bool = False) -> None:
+        self.window(streamed).append(seconds)
+        self.failures = 0
+        self.trial = False
+        if self.opened_at is not None:
+            self.opened_at = None
+            breaker_open.set(0, agent=self.agent, model=self.name)
+            logger.info("Model breaker closed", agent=self.agent, model=self.name)
+
+    def failed(self) -> None:
+        self.failures += 1
+        self.trial = False
+        if self.opened_at is not None or self.failures >= self.config.failures:
+            if self.opened_at is None:
+                logger.warn("Model breaker opened", agent=self.agent, model=self.name, failures=self.failures)
+            self.opened_at = time.monotonic()
+            breaker_open.set(1, agent=self.agent, model=self.name)
+
+    def released(self) -> None:
+        """Give back a trial slot whose request was cancelled."""
+        self.trial = False
+
+    def percentile(self, percentile: float, streamed: bool = False) -> float | None:
+        """A percentile of recent first-token times, None if none are known."""
+        latencies = self.window(streamed)
+        if not latencies:
+            return None
+        ordered = sorted(latencies)
+        index = min(len(ordered) - 1, max(0, math.ceil(percentile / 100 * len(ordered)) - 1))
+        return ordered[index]
+
+_health: dict[tuple[str, str], ModelHealth] = {}
+
+def get_health(agent: str, name: str, config: BreakerConfig) -> ModelHealth:
+    """
+    Get the health of a model of an agent's chain, kept across rebuilds of
+    the agent. Each agent has its own, so their breaker settings apply.
+    """
+    key = (agent, name)
+    if key not in _health:
+        _health[key] = ModelHealth(agent, name, config)
+    # A reloaded config applies to the breaker as it stands
+    _health[key].config = config
+    return _health[key]
+
+def build_model(route: RouteConfig) -> Model:
+    """Build a chain entry's model, on the shared provider clients."""
+    provider, _, model_name = route.model.partition(":")
+    if provider == "groq" and model_name:
+        return model_clients.groq_model(model_name, base_url=route.base_url)
+    raise ValueError(f"Unknown model: {route.model}")
+
+@dataclass
+class Route:
+    """One model of a chain."""
+    name: str
+    model: Model
+    health: ModelHealth
+
+class _Attempt:
+    """A request in flight to one model of the chain, done when `future` is."""
+
+    def __init__(self, route: Route, task: asyncio.Task, future: asyncio.Future | None = None):
+        self.route = route
+        self.started = time.monotonic()
+        self.task = task
+        self.future = future or task
+
+    async def cancel(self) -> None:
+        """Cancel the request and wait for it to wind down."""
+        self.task.cancel()
+        if not self.future.done():
+            self.future.cancel()
+        await asyncio.gather(self.task, return_exceptions=True)
+
+class RoutedModel(Model):
+    """
+    A pydantic-ai model that sends each request down a chain of models.
+    Models whose breaker is open are skipped, and a failing model falls
+    back to the next one. With hedging, when the current model hasn't
+    answered (or started streaming) within a percentile of its recent
+    first-token times, the next model gets the request too, and whichever
+    answers first wins while the other is cancelled.
+    """
+
+    def __init__(self, name: str, routes: list[Route], hedge: HedgeConfig | None = None):
+        self._name = name
+        self.routes = routes
+        self.hedge = hedge
+
+    @classmethod
+    def from_config(cls, name: str, config: RoutingConfig) -> "RoutedModel":
+        routes = []
+        for entry in config.chain:
+            route = entry if isinstance(entry, RouteConfig) else RouteConfig(model=entry)
+            route_name = f"{route.model}@{route.base_url}" if route.base_url else route.model
+            routes.append(Route(route_name, build_model(route), get_health(name, route_name, config.breaker)))
+        return cls(name, routes, config.hedge)
+
+    def name(self) -> str:
+        return f"routed:{self._name}"
+
+    async def agent_model(self, **kwargs: Any) -> AgentModel:
+        agent_models = await asyncio.gather(*[route.model.agent_model(**kwargs) for route in self.routes])
+        return RoutedAgentModel(self, list(zip(self.routes, agent_models)))
+
+    def hedge_delay(self, route: Route, streamed: bool = False) -> float | None:
+        """How long to wait on a model before hedging to the next, None to never hedge."""
+        if self.hedge is None:
+            return None
+        delay = None
+        if len(route.health.window(streamed)) >= self.hedge.min_samples:
+            delay = route.health.percentile(self.hedge.percentile, streamed)
+        if delay is None:
+            delay = self.hedge.default_delay
+        return min(self.hedge.max_delay, max(self.hedge.min_delay, delay))
+
+    async def race(
+        self, routes: list[tuple[Route, Any]], start: Callable[[Route, Any], _Attempt], streamed: bool = False
+    ) -> tuple[Any, _Attempt]:
+        """
+        Run a request down the chain, returns the first result and the attempt
+        that produced it. `streamed` requests are done once the stream opens.
+        """
+        candidates = [(route, agent_model) for route, agent_model in routes if route.health.allow()]
+        # Open breakers that let this request through as their trial
+        trials = {id(route) for route, _ in candidates if route.health.is_open}
+        if not candidates:
+            retry_after = min(route.health.retry_in() for route, _ in routes)
+            raise Overloaded(
+                f"No healthy model for {self._name}", status_code=503, retry_after=max(1, math.ceil(retry_after))
+            )
+
+        pending: list[_Attempt] = []
+        last_error: BaseException | None = None
+        try:
+            while True:
+                if not pending:
+                    if not candidates:
+                        raise last_error
+                    pending.append(start(*candidates.pop(0)))
+                hedging = self.hedge is not None and candidates and len(pending) == 1
+                timeout = self.hedge_delay(pending[0].route, streamed) if hedging else None
+                done, _ = await asyncio.wait([a.future for a in pending], timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+
+                if not done:
+                    # The current model is slow, race it against the next one
+                    route_hedges.inc(router=self._name)
+                    logger.debug("Hedging model request", router=self._name, slow=pending[0].route.name)
+                    pending.append(start(*candidates.pop(0)))
+                    continue
+
+                for attempt in [a for a in pending if a.future in done]:
+                    pending.remove(attempt)
+                    error = attempt.future.exception()
+                    if error is None:
+                        seconds = time.monotonic() - attempt.started
+                        attempt.route.health.succeeded(seconds, streamed)
+                        route_first_token.observe(seconds, model=attempt.route.name)
+                        route_attempts.inc(model=attempt.route.name, outcome="ok")
+                        return attempt.future.result(), attempt
+                    attempt.route.health.failed()
+                    route_attempts.inc(model=attempt.route.name, outcome="error")
+                    logger.warn("Model request failed", model=attempt.route.name, error=str(error))
+                    last_error = error
+                    if candidates and not pending:
+                        route_fallbacks.inc(router=self._name)
+        finally:
+            # Losers, or everything when the caller is cancelled, and trials never sent
+            for attempt in pending:
+                route_attempts.inc(model=attempt.route.name, outcome="cancelled")
+            for route in [a.route for a in pending] + [route for route, _ in candidates]:
+                if id(route) in trials:
+                    route.health.released()
+            await asyncio.gather(*[attempt.cancel() for attempt in pending], return_exceptions=True)
+
+class RoutedAgentModel(AgentModel):
+    """The per-run side of a RoutedModel, with each model's own agent model."""
+
+    def __init__(self, model: RoutedModel, routes: list[tuple[Route, AgentModel]]):
+        self.model = model
+        self.routes = routes
+
+    async def request(self, *args: Any, **kwargs: Any) -> Any:
+        def start(route: Route, agent_model: AgentModel) -> _Attempt:
+            return _Attempt(route, asyncio.create_task(agent_model.request(*args, **kwargs)))
+
+        result, _ = await self.model.race(self.routes, start)
+        return result
+
+    @asynccontextmanager
+    async def request_stream(self, *args: Any, **kwargs: Any) -> AsyncIterator[Any]:
+        # Each stream is opened and closed by a task of its own, which holds it
+        # open until the winner's caller is done, so losers are simply cancelled
+        release = asyncio.Event()
+
+        def start(route: Route, agent_model: AgentModel) -> _Attempt:
+            opened = asyncio.get_running_loop().create_future()
+
+            async def hold() -> None:
+                try:
+                    async with agent_model.request_stream(*args, **kwargs) as response:
+                        opened.set_result(response)
+                        await release.wait()
+                except Exception as e:
+                    # Failing to open is the attempt's result, errors closing a stream are dropped
+                    if not opened.done():
+                        opened.set_exception(e)
+
+            return _Attempt(route, asyncio.create_task(hold()), opened)
+
+        response, attempt = await self.model.race(self.routes, start, streamed=True)
+        try:
+            yield response
+        finally:
+            release.set()
+            await asyncio.gather(attempt.task, return_exceptions=True)
@@ -0,0 +1,186 @@
+"""Full-text search over conversation history, and its backfill."""
+
+import argparse
+from typing import Any, Iterable
+from sqlalchemy import and_, column, exists, func, insert, literal_column, or_, select as sa_select, table as sa_table, text
+from sqlalchemy.engine import Engine, Row
+from sqlmodel import Session, select
+from pydantic_ai.messages import ModelMessage, ToolReturnPart
+from app.config import get_settings
+from app.logs import get_logger, configure_logfire
+from app.agents.history import load_messages
+from app.models.message import Message
+from app.models.search import SearchDocument
+from app.models.thread import Thread
+
+logger = get_logger(__name__)
+
+# Parts worth finding a conversation by, system prompts are the same in every thread
+SEARCHABLE_PARTS = ("user-prompt", "text", "tool-return")
+
+# SQLite full-text index, an FTS5 table over searchdocument.content
+FTS_TABLE = "searchdocument_fts"
+
+def search_documents(messages: Iterable[tuple[int, int, ModelMessage]]) -> list[dict[str, Any]]:
+    """Get the SearchDocument rows of (message_id, thread_id, message) triples."""
+    rows = []
+    for message_id, thread_id, message in messages:
+        for part in message.parts:
+            if part.part_kind not in SEARCHABLE_PARTS:
+                continue
+            content = part.model_response_str() if isinstance(part, ToolReturnPart) else part.content
+            if isinstance(content, str) and content.strip():
+                rows.append({
+                    "message_id": message_id,
+                    "thread_id": thread_id,
+                    "part_kind": part.part_kind,
+                    "content": content
+                })
+    return rows
+
+def create_search_index(engine: Engine) -> None:
+    """Create the full-text index of the searchdocument table, if it doesn't exist yet."""
+    table = SearchDocument.__table__
+    with engine.begin() as conn:
+        if engine.dialect.name == "postgresql":
+            language = get_settings().SEARCH_LANGUAGE
+            if not language.isidentifier():
+                raise ValueError(f"Invalid search language: {language}")
+            # Computed by Postgres as rows are inserted, so the index never lags the table
+            conn.execute(text(
+                f"ALTER TABLE {table.fullname} ADD COLUMN IF NOT EXISTS search_vector tsvector "
+                f"GENERATED ALWAYS AS (to_tsvector('{language}'::regconfig, content)) STORED"
+            ))
+            conn.execute(text(
+                f"CREATE INDEX IF NOT EXISTS ix_searchdocument_search_vector ON {table.fullname} USING GIN (search_vector)"
+            ))
+        elif engine.dialect.name == "sqlite":
+            conn.execute(text(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+                f"content, content='{table.name}', content_rowid='id', tokenize='porter unicode61')"
+            ))
+            conn.execute(text(
+                f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_insert AFTER INSERT ON {table.name} BEGIN "
+                f"INSERT INTO {FTS_TABLE}(rowid, content) VALUES (new.id, new.content); END"
+            ))
+            conn.execute(text(
+                f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_delete AFTER DELETE ON {table.name} BEGIN "
+                f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, content) VALUES ('delete', old.id, old.content); END"
+            ))
+        else:
+            raise ValueError(f"No full-text search for database backend: {engine.dialect.name}")
+
+def _fts_query(query: str) -> str:
+    """Quote each word, so FTS5 matches all of them rather than parsing its query syntax."""
+    return " ".join('"' + word.replace('"', '""') + '"' for word in query.split())
+
+def search(
+    session: Session, query: str,
+    user_id: str | None, persona_id: str | None, part_kind: str | None,
+    after: tuple[float, int] | None, limit: int
+) -> list[Row]:
+    """
+    Get up to `limit` message parts matching `query`, best first, after the
+    (score, id) key `after`. Rows have the document's id, message_id,
+    thread_id, part_kind and content, the message's timestamp, the
+    thread's user_id and persona_id, and the score.
+    On Postgres the query is parsed by websearch_to_tsquery ("quoted
+    phrases", or, -excluded) and ranked by ts_rank, on SQLite every word
+    must match and rows are ranked by bm25.
+    """
+    table = SearchDocument.__table__
+    if session.bind.dialect.name == "postgresql":
+        vector = literal_column(f"{table.fullname}.search_vector")
+        tsquery = func.websearch_to_tsquery(literal_column(f"'{get_settings().SEARCH_LANGUAGE}'::regconfig"), query)
+        score = func.ts_rank(vector, tsquery)
+        matches = vector.op("@@")(tsquery)
+        source = table
+    else:
+        terms = _fts_query(query)
+        if not terms:
+            return []
+        fts = sa_table(FTS_TABLE, column("rowid"))
+        # bm25 is lower for better matches
+        score = -func.bm25(literal_column(FTS_TABLE))
+        matches = literal_column(FTS_TABLE).op("MATCH")(terms)
+        source = table.join(fts, fts.c.rowid == table.c.id)
+
+    ranked = sa_select(
+        SearchDocument.id, SearchDocument.message_id, SearchDocument.thread_id,
+        SearchDocument.part_kind, SearchDocument.content,
+        Message.timestamp, Thread.user_id, Thread.persona_id,
+        score.label("score")
+    ).select_from(source).join(
+        Message, Message.id == SearchDocument.message_id
+    ).join(
+        Thread, Thread.id == SearchDocument.thread_id
+    ).where(matches)
+    if user_id is not None:
+        ranked = ranked.where(Thread.user_id == user_id)
+    if persona_id is not None:
+        ranked = ranked.where(Thread.persona_id == persona_id)
+    if part_kind is not None:
+        ranked = ranked.where(SearchDocument.part_kind == part_kind)
+
+    ranked = ranked.subquery()
+    statement = sa_select(ranked).order_by(ranked.c.score.desc(), ranked.c.id.desc()).limit(limit)
+    if after is not None:
+        after_score, after_id = after
+        statement = statement.where(or_(
+            ranked.c.score < after_score,
+            and_(ranked.c.score == after_score, ranked.c.id < after_id)
+        ))
+    return list(session.execute(statement))
+
+def backfill_batch(session: Session, after_id: int, batch_size: int) -> list[int]:
+    """Index the next `batch_size` messages after `after_id` that have no documents, returns their ids."""
+    statement = select(
+        Message.id, Message.kind, Message.timestamp,
+        Message.payload, Message.payload_format, Message.payload_version,
+        Message.thread_id
+    ).where(
+        Message.id > after_id,
+        ~exists().where(SearchDocument.message_id == Message.id)
+    ).order_by(Message.id).limit(batch_size)
+    rows = list(session.exec(statement))
+    if not rows:
+        return []
+
+    messages = load_messages(session, rows)
+    documents = search_documents((row.id, row.thread_id, messages[row.id]) for row in rows)
+    if documents:
+        session.execute(insert(SearchDocument), documents)
+    return [row.id for row in rows]
+
+def main(argv: list[str] | None = None) -> None:
+    """Index the messages saved before search, or while SEARCH_INDEX was off, one committed batch at a time."""
+    parser = argparse.ArgumentParser(description="Add existing messages to the full-text search index.")
+    parser.add_argument("--batch-size", type=int, default=1000, help="Messages per transaction")
+    args = parser.parse_args(argv)
+
+    # Import models first so SQLModel knows what tables to create
+    from app import models  # noqa: F401
+    from app.db.core import init_engine, get_engine, create_db_and_tables, schema_lock
+
+    configure_logfire()
+    init_engine()
+    engine = get_engine()
+    with schema_lock(engine):
+        create_db_and_tables()
+        create_search_index(engine)
+
+    indexed = 0
+    last_id = 0
+    while True:
+        with Session(engine) as session:
+            message_ids = backfill_batch(session, last_id, args.batch_size)
+            if not message_ids:
+                break
+            session.commit()
+        indexed += len(message_ids)
+        last_id = message_ids[-1]
+        logger.info("Indexed messages", count=indexed, through_id=last_id)
+    logger.info("Search backfill done", count=indexed)
+
+if __name__ == "__main__":
+    main()
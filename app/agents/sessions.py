@@ -0,0 +1,87 @@
+"""Thread history held in memory by long-lived chat sessions, e.g. WebSockets."""
+
+from dataclasses import dataclass
+from pydantic_ai.messages import ModelMessage
+from app.config import get_settings
+from app.metrics import Counter, Gauge
+from app.agents.context import part_text
+
+# Threads are unique per (user_id, persona_id)
+ThreadKey = tuple[str, str]
+
+# Rough size of a message beyond its text, for the memory cap
+MESSAGE_OVERHEAD = 256
+
+session_history_reloads = Counter(
+    "chat_session_history_reloads_total", "Session turns that had to load history", ["reason"]
+)
+
+def history_size(messages: list[ModelMessage]) -> int:
+    """Rough bytes a decoded history takes in memory."""
+    return sum(MESSAGE_OVERHEAD + sum(len(part_text(part)) for part in message.parts) for message in messages)
+
+@dataclass
+class ThreadState:
+    """
+    A thread's decoded history, kept by a session across its turns so
+    follow-up turns skip loading it. `version` is the thread's version the
+    history is as of, `messages` is None until loaded, and again once it's
+    stale or over the memory cap.
+    """
+    key: ThreadKey
+    thread_id: int | None = None
+    messages: list[ModelMessage] | None = None
+    version: int = 0
+    size: int = 0
+
+class ChatSessions:
+    """
+    Open sessions of this worker, capped at `max_sessions`. Like the
+    history cache, a session's history is only reused while its version
+    matches the thread's, so turns on other connections or workers, and
+    new checkpoints, make the next turn load it again.
+    """
+
+    def __init__(self, max_sessions: int, max_history_bytes: int):
+        self.max_sessions = max_sessions
+        self.max_history_bytes = max_history_bytes
+        self.open = 0
+
+    def opened(self, key: ThreadKey) -> ThreadState | None:
+        """Register a new session on a thread, None when the worker has no room for it."""
+        if self.max_sessions > 0 and self.open >= self.max_sessions:
+            return None
+        self.open += 1
+        return ThreadState(key)
+
+    def closed(self, state: ThreadState) -> None:
+        """Release a session's history."""
+        self.open -= 1
+        state.messages = None
+
+    def stale(self, state: ThreadState) -> None:
+        """Drop a session's history, the thread was written to since it was kept."""
+        session_history_reloads.inc(reason="changed")
+        state.messages = None
+
+    def keep(self, state: ThreadState, thread_id: int, version: int, messages: list[ModelMessage]) -> None:
+        """Keep a thread's history as of `version`, unless it's over the memory cap."""
+        state.thread_id = thread_id
+        state.version = version
+        state.size = history_size(messages)
+        if self.max_history_bytes > 0 and state.size > self.max_history_bytes:
+            # Turns load history as if there were no session, from the cache or the database
+            session_history_reloads.inc(reason="too_large")
+            state.messages = None
+            return
+        state.messages = messages
+
+settings = get_settings()
+chat_sessions = ChatSessions(
+    max_sessions=settings.WS_MAX_CONNECTIONS,
+    max_history_bytes=settings.WS_MAX_HISTORY_BYTES
+)
+Gauge(
+    "chat_sessions_open", "WebSocket chat sessions open on this worker",
+    callback=lambda: chat_sessions.open
+)
@@ -0,0 +1,137 @@
+"""Timing and metrics of chat turns."""
+
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+from inspect import iscoroutinefunction
+from typing import Iterator
+import logfire
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from pydantic_ai import Agent
+from pydantic_ai.result import Usage
+from app.metrics import Counter, Gauge, Histogram
+from app.agents.history_cache import history_cache
+from app.agents.write_behind import write_behind
+
+turn_seconds = Histogram(
+    "chat_turn_seconds", "Duration of chat turns", ["agent", "mode", "outcome"]
+)
+stage_seconds = Histogram(
+    "chat_stage_seconds", "Duration of each stage of a chat turn", ["agent", "stage"]
+)
+tool_seconds = Histogram(
+    "chat_tool_seconds", "Duration of tool calls", ["agent", "tool"]
+)
+history_messages = Histogram(
+    "chat_history_messages", "Messages in the history a turn starts from", ["agent"],
+    buckets=(0, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+)
+db_statements = Histogram(
+    "chat_db_statements", "Database statements executed per chat turn", ["agent"],
+    buckets=(0, 1, 2, 3, 4, 5, 6, 8, 10, 15, 20, 50)
+)
+model_requests = Counter(
+    "chat_model_requests_total", "Requests made to the model", ["agent"]
+)
+model_tokens = Counter(
+    "chat_model_tokens_total", "Tokens reported by the model", ["agent", "kind"]
+)
+Counter(
+    "history_cache_hits_total", "History cache hits",
+    callback=lambda: history_cache.stats.hits
+)
+Counter(
+    "history_cache_misses_total", "History cache misses",
+    callback=lambda: history_cache.stats.misses
+)
+Counter(
+    "history_cache_evictions_total", "History cache entries evicted or expired",
+    callback=lambda: history_cache.stats.evictions + history_cache.stats.expirations
+)
+Counter(
+    "history_cache_stale_total", "History cache entries dropped after another process wrote to the thread",
+    callback=lambda: history_cache.stats.stale
+)
+Gauge(
+    "history_cache_entries", "Threads in the history cache",
+    callback=lambda: len(history_cache)
+)
+Gauge(
+    "write_behind_queue_depth", "Turns waiting to be written",
+    callback=lambda: write_behind.depth()
+)
+
+# Statements executed so far in the current turn, None outside of turns
+_statements: ContextVar[list[int] | None] = ContextVar("chat_statements", default=None)
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _count_statement(conn, cursor, statement, parameters, context, executemany) -> None:
+    count = _statements.get()
+    if count is not None:
+        count[0] += 1
+
+@contextmanager
+def turn(agent_id: str, mode: str) -> Iterator[dict[str, str]]:
+    """Time a chat turn and count its database statements, set "outcome" on the yielded labels."""
+    labels = {"outcome": "ok"}
+    # A fresh counter per turn, background tasks started by the turn keep theirs
+    count = [0]
+    _statements.set(count)
+    start = time.perf_counter()
+    try:
+        yield labels
+    except BaseException:
+        if labels["outcome"] == "ok":
+            labels["outcome"] = "error"
+        raise
+    finally:
+        turn_seconds.observe(time.perf_counter() - start, agent=agent_id, mode=mode, outcome=labels["outcome"])
+        db_statements.observe(count[0], agent=agent_id)
+
+@contextmanager
+def stage(agent_id: str, name: str) -> Iterator[None]:
+    """Time a stage of a chat turn, as a span and in the stage histogram."""
+    start = time.perf_counter()
+    try:
+        with logfire.span("chat {stage}", stage=name, agent_id=agent_id):
+            yield
+    finally:
+        stage_seconds.observe(time.perf_counter() - start, agent=agent_id, stage=name)
+
+def record_usage(agent_id: str, usage: Usage) -> None:
+    """Count a run's model requests and tokens."""
+    model_requests.inc(usage.requests, agent=agent_id)
+    if usage.request_tokens:
+        model_tokens.inc(usage.request_tokens, agent=agent_id, kind="request")
+    if usage.response_tokens:
+        model_tokens.inc(usage.response_tokens, agent=agent_id, kind="response")
+
+def instrument_tools(agent: Agent, agent_id: str) -> None:
+    """Time every tool of a pydantic-ai agent."""
+    # pydantic-ai has no hook around tool calls, so the tool functions are wrapped
+    for name, tool in agent._function_tools.items():
+        if getattr(tool.function, "__instrumented__", False):
+            continue
+        tool.function = _timed_tool(tool.function, agent_id, name)
+
+def _timed_tool(function, agent_id: str, name: str):
+    if iscoroutinefunction(function):
+        @wraps(function)
+        async def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return await function(*args, **kwargs)
+            finally:
+                tool_seconds.observe(time.perf_counter() - start, agent=agent_id, tool=name)
+    else:
+        @wraps(function)
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                tool_seconds.observe(time.perf_counter() - start, agent=agent_id, tool=name)
+    timed.__instrumented__ = True
+    return timed
@@ -0,0 +1,196 @@
+"""Write-behind persistence of chat turns."""
+
+import asyncio
+import json
+import os
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Protocol
+from pydantic_ai.messages import ModelMessage, ModelMessagesTypeAdapter
+from app.config import get_settings
+from app.logs import get_logger
+from app.db.core import new_async_session
+from app.db.replicas import replicas
+from app.agents.persistence import save_turns
+
+logger = get_logger(__name__)
+
+# Threads are unique per (user_id, persona_id)
+ThreadKey = tuple[str, str]
+
+class TurnWriter(Protocol):
+    """Something that persists turns after the response, instead of in the turn's own session."""
+    
+    async def put(self, key: ThreadKey, thread_id: int, messages: list[ModelMessage]) -> None: ...
+    
+    async def wait_for(self, key: ThreadKey) -> None: ...
+
+@dataclass
+class PendingTurn:
+    """A turn's new messages waiting to be written."""
+    seq: int
+    key: ThreadKey
+    thread_id: int
+    messages: list[ModelMessage]
+
+class WriteBehindQueue:
+    """
+    Persists turns in the background so responses don't wait for commits.
+    Turns are appended to a local outbox file before they are queued, and
+    acknowledged there once committed, so turns still in the queue when the
+    process dies are replayed on the next start. A single worker drains the
+    queue in FIFO batches, which keeps turns of the same thread in order.
+    The queue is bounded: when it's full, `put` waits for room.
+    """
+
+    def __init__(self, outbox_path: str, max_size: int, batch_size: int, fsync: bool = True):
+        self.outbox_path = Path(outbox_path)
+        self.max_size = max_size
+        self.batch_size = batch_size
+        self.fsync = fsync
+        self._queue: asyncio.Queue[PendingTurn] | None = None
+        self._worker: asyncio.Task | None = None
+        self._outbox_lock = asyncio.Lock()
+        self._pending: dict[ThreadKey, int] = {}
+        self._flushed = asyncio.Condition()
+        self._seq = 0
+
+    @property
+    def running(self) -> bool:
+        """Whether the worker is accepting turns."""
+        return self._worker is not None
+
+    def depth(self) -> int:
+        """Number of turns waiting to be written."""
+        return self._queue.qsize() if self._queue else 0
+
+    async def start(self) -> None:
+        """Replay turns left in the outbox, then start the worker."""
+        self._queue = asyncio.Queue(maxsize=self.max_size)
+        self.outbox_path.parent.mkdir(parents=True, exist_ok=True)
+        replay, self._seq = await asyncio.to_thread(self._read_outbox)
+        self._worker = asyncio.create_task(self._run())
+        for turn in replay:
+            self._add_pending(turn.key)
+            await self._queue.put(turn)
+        if replay:
+            logger.info("Replaying outbox turns", count=len(replay))
+
+    async def stop(self, timeout: float = 30) -> None:
+        """Flush queued turns and stop the worker, unflushed turns stay in the outbox."""
+        if self._worker is None:
+            return
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout)
+        except asyncio.TimeoutError:
+            logger.error("Stopped with unwritten turns", count=self._queue.qsize())
+        self._worker.cancel()
+        try:
+            await self._worker
+        except asyncio.CancelledError:
+            pass
+        self._worker = None
+
+    async def put(self, key: ThreadKey, thread_id: int, messages: list[ModelMessage]) -> None:
+        """Record a turn in the outbox and queue it for writing."""
+        self._seq += 1
+        turn = PendingTurn(self._seq, key, thread_id, messages)
+        # Counted as pending first so the outbox isn't reset under this record
+        self._add_pending(key)
+        await self._append_outbox({
+            "seq": turn.seq,
+            "key": list(key),
+            "thread_id": thread_id,
+            "messages": json.loads(ModelMessagesTypeAdapter.dump_json(messages))
+        })
+        await self._queue.put(turn)
+
+    async def wait_for(self, key: ThreadKey) -> None:
+        """Wait until a thread has no queued turns, so a database read sees them."""
+        async with self._flushed:
+            await self._flushed.wait_for(lambda: key not in self._pending)
+
+    def _add_pending(self, key: ThreadKey) -> None:
+        self._pending[key] = self._pending.get(key, 0) + 1
+
+    async def _run(self) -> None:
+        """Drain the queue in batches until cancelled."""
+        while True:
+            batch = [await self._queue.get()]
+            while len(batch) < self.batch_size and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+
+            await self._write(batch)
+            await self._append_outbox({"ack": [turn.seq for turn in batch]})
+            async with self._flushed:
+                for turn in batch:
+                    self._pending[turn.key] -= 1
+                    if not self._pending[turn.key]:
+                        del self._pending[turn.key]
+                self._flushed.notify_all()
+
+            # Everything written, start the outbox over
+            if self._queue.empty() and not self._pending:
+                async with self._outbox_lock:
+                    await asyncio.to_thread(self.outbox_path.write_text, "")
+            for _ in batch:
+                self._queue.task_done()
+
+    async def _write(self, batch: list[PendingTurn]) -> None:
+        """Commit a batch, retrying until the database takes it."""
+        delay = 0.5
+        while True:
+            try:
+                async with new_async_session() as session:
+                    await session.run_sync(save_turns, [(turn.thread_id, turn.messages) for turn in batch])
+                    await session.commit()
+                for turn in batch:
+                    replicas.wrote(user_id=turn.key[0], thread_id=turn.thread_id)
+                return
+            except Exception as e:
+                logger.error("Failed to write queued turns", count=len(batch), error=str(e))
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 30)
+
+    async def _append_outbox(self, record: dict) -> None:
+        async with self._outbox_lock:
+            await asyncio.to_thread(self._write_outbox_line, json.dumps(record))
+
+    def _write_outbox_line(self, line: str) -> None:
+        with self.outbox_path.open("a") as f:
+            f.write(line + "\n")
+            f.flush()
+            if self.fsync:
+                os.fsync(f.fileno())
+
+    def _read_outbox(self) -> tuple[list[PendingTurn], int]:
+        """Get the outbox turns that were never acknowledged, in order, and the last sequence number."""
+        if not self.outbox_path.exists():
+            return [], 0
+        turns: dict[int, PendingTurn] = {}
+        acked: set[int] = set()
+        with self.outbox_path.open() as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue  # Torn last line from a crash mid-write
+                if "ack" in record:
+                    acked.update(record["ack"])
+                else:
+                    turns[record["seq"]] = PendingTurn(
+                        seq=record["seq"],
+                        key=tuple(record["key"]),
+                        thread_id=record["thread_id"],
+                        messages=ModelMessagesTypeAdapter.validate_python(record["messages"])
+                    )
+        last_seq = max([*turns, *acked], default=0)
+        return [turns[seq] for seq in sorted(turns) if seq not in acked], last_seq
+
+settings = get_settings()
+write_behind = WriteBehindQueue(
+    outbox_path=settings.WRITE_BEHIND_OUTBOX,
+    max_size=settings.WRITE_BEHIND_QUEUE_SIZE,
+    batch_size=settings.WRITE_BEHIND_BATCH_SIZE,
+    fsync=settings.WRITE_BEHIND_FSYNC
+)
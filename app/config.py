@@ -6,9 +6,109 @@ from pydantic_settings import BaseSettings, SettingsConfigDict
 class Settings(BaseSettings):
     """Application settings."""
     GROQ_API_KEY: str = ""
+    GROQ_BASE_URL: str = ""  # e.g. a local stub server, https://api.groq.com when empty
     DATABASE_URL: str = ""
     LOGFIRE_API_KEY: str = ""
     
+    # Database connection pool (shared by the whole process)
+    DATABASE_ASYNC_URL: str = ""  # Derived from DATABASE_URL when empty
+    DATABASE_POOL_SIZE: int = 5
+    DATABASE_MAX_OVERFLOW: int = 10
+    DATABASE_POOL_PRE_PING: bool = True
+    DATABASE_POOL_RECYCLE: int = 1800  # Seconds, -1 disables recycling
+
+    # Read replicas for history loads, thread listing and search, as
+    # comma-separated URLs (empty reads from the primary). A user's or
+    # thread's reads stay on the primary for a while after it's written
+    DATABASE_REPLICA_URLS: str = ""
+    DATABASE_READ_YOUR_WRITES: float = 10  # Seconds, keep it above the replicas' lag
+    DATABASE_REPLICA_CHECK_INTERVAL: float = 5  # Seconds between health checks, 0 disables
+    DATABASE_REPLICA_MAX_LAG: float = 10  # Seconds a Postgres replica may lag before it's skipped
+    
+    # Per-process cache of decoded thread history (0 disables), entries are
+    # checked against the thread's version in the database before each use
+    HISTORY_CACHE_SIZE: int = 1024  # Threads
+    HISTORY_CACHE_TTL: int = 300  # Seconds
+    
+    # "parts" stores a row per message part, "payload" one serialized row per
+    # message, as "json" or "msgpack", optionally "+zstd" compressed
+    MESSAGE_STORAGE: str = "parts"
+    MESSAGE_PAYLOAD_FORMAT: str = "json"
+    
+    # Full-text search over history (GET /search), indexed as turns are saved,
+    # older messages with python -m app.agents.search
+    SEARCH_INDEX: bool = True
+    SEARCH_LANGUAGE: str = "english"  # Postgres text search configuration
+    
+    # Retention (python -m app.agents.retention), per-agent policies are in
+    # config/agents.yaml
+    RETENTION_BATCH_SIZE: int = 200  # Messages per transaction
+    RETENTION_DUTY_CYCLE: float = 0.5  # Share of the time spent in batches, the rest pausing
+    RETENTION_ARCHIVE_DIR: str = "data/archive"  # For archive: file
+    RETENTION_ARCHIVE_FORMAT: str = "json"  # e.g. "msgpack+zstd", files are JSONL, zstd-compressed with "+zstd"
+    
+    # "sync" commits each turn before responding, "write_behind" queues it
+    PERSISTENCE_MODE: str = "sync"
+    WRITE_BEHIND_OUTBOX: str = "data/outbox.jsonl"
+    WRITE_BEHIND_QUEUE_SIZE: int = 1000  # Turns
+    WRITE_BEHIND_BATCH_SIZE: int = 100  # Turns
+    WRITE_BEHIND_FSYNC: bool = True
+    
+    # Responses to requests with an idempotency key, replayed to retries
+    IDEMPOTENCY_CACHE_SIZE: int = 10000  # Responses, 0 disables
+    IDEMPOTENCY_TTL: int = 86400  # Seconds
+    IDEMPOTENCY_PERSIST: bool = False  # Also keep them in the database
+    
+    # Admission control for model calls across all agents (0 disables)
+    MODEL_MAX_CONCURRENCY: int = 16  # Calls in flight
+    MODEL_MAX_QUEUE: int = 64  # Calls waiting for a slot
+    MODEL_QUEUE_TIMEOUT: float = 30  # Seconds
+    
+    # HTTP client shared by all agents' models, per provider
+    MODEL_HTTP2: bool = True  # Needs the h2 package, HTTP/1.1 otherwise
+    MODEL_MAX_CONNECTIONS: int = 100
+    MODEL_MAX_KEEPALIVE: int = 20  # Idle connections kept open
+    MODEL_KEEPALIVE_EXPIRY: float = 60  # Seconds
+    MODEL_CONNECT_TIMEOUT: float = 5  # Seconds
+    MODEL_READ_TIMEOUT: float = 120  # Seconds
+    MODEL_MAX_RETRIES: int = 2
+    MODEL_WARMUP_CONNECTIONS: int = 2  # Opened at startup, 0 disables
+    
+    # Tool execution, shared by all agents
+    TOOL_THREADS: int = 8  # Threads for sync tools
+    TOOL_TIMEOUT: float = 30  # Seconds per call, 0 disables
+    TOOL_CACHE_SIZE: int = 1024  # Results of pure tools, 0 disables
+    TOOL_CACHE_TTL: int = 300  # Seconds
+    
+    # WebSocket chat sessions (/chat/ws), per worker
+    WS_MAX_CONNECTIONS: int = 1000  # 0 disables the limit
+    WS_MAX_HISTORY_BYTES: int = 4 * 1024 * 1024  # History kept per connection, larger ones are reloaded each turn
+    WS_HEARTBEAT_INTERVAL: float = 20  # Seconds between pings
+    WS_IDLE_TIMEOUT: float = 600  # Seconds without a message before the connection is closed
+    
+    # Batch chat (/chat/batch and python -m app.agents.batch)
+    BATCH_CONCURRENCY: int = 8  # Requests in flight per batch
+    BATCH_MAX_CONCURRENCY: int = 64
+    BATCH_WRITE_SIZE: int = 50  # Turns per grouped write
+    
+    # Agents are built on first use, idle ones beyond the limit are dropped
+    AGENTS_CONFIG: str = "config/agents.yaml"
+    AGENTS_MAX_LOADED: int = 0  # Agents, 0 keeps all of them
+    AGENTS_RELOAD_INTERVAL: float = 2  # Seconds between config checks, 0 disables
+    
+    # Pre-forked serving (python -m app.serve)
+    SERVE_WORKERS: int = 0  # Processes, 0 uses one per core
+    SERVE_PRELOAD_AGENTS: bool = True  # Build agents in the parent, shared with the workers
+    SERVE_DRAIN_TIMEOUT: float = 30  # Seconds for requests in flight after SIGTERM
+    SERVE_HEARTBEAT_INTERVAL: float = 1  # Seconds
+    SERVE_HEARTBEAT_TIMEOUT: float = 30  # Seconds without a heartbeat before a worker is restarted, 0 disables
+    
+    # Logging: "debug", "info", "warn" or "error", overridden per module with
+    # e.g. LOG_LEVELS="app.agents.chat=debug,app.agents.registry=warn"
+    LOG_LEVEL: str = "info"
+    LOG_LEVELS: str = ""
+    TRACE_SAMPLE_RATE: float = 1.0  # Fraction of request traces kept
+    
     model_config = SettingsConfigDict(
         env_file='.env',
         env_file_encoding='utf-8'
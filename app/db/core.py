@@ -1,37 +1,165 @@
 """Database initialization and session management."""
 
-from typing import Any, Generator
+from contextlib import contextmanager
+from typing import Any, AsyncGenerator, Generator, Iterator
 from sqlmodel import SQLModel, Session, create_engine
-from fastapi import Depends
+from sqlmodel.ext.asyncio.session import AsyncSession
 from app.config import Settings
-from sqlalchemy import text
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.schema import CreateColumn
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
 
 settings = Settings()
 SCHEMA_NAME = "aikho_ai"
 
-def get_engine(db_url: str = settings.DATABASE_URL) -> Any:
-    """Get a database engine."""
-    engine = create_engine(db_url, echo=False)
-    return engine
+# Key of the Postgres advisory lock held while creating or altering tables
+SCHEMA_LOCK_ID = 0x61696B686F
+
+# Indexes the models no longer declare, superseded by composite ones
+DROPPED_INDEXES = ("ix_message_thread_id", "ix_messagepart_message_id")
+
+# Async driver used for each backend when deriving the async URL
+ASYNC_DRIVERS = {
+    "postgresql": "asyncpg",
+    "sqlite": "aiosqlite",
+}
+
+# Process-wide engines, created once at startup and disposed at shutdown
+_engine: Engine | None = None
+_async_engine: AsyncEngine | None = None
+
+def engine_options(db_url: str) -> dict[str, Any]:
+    """Connection pool options for the given database URL."""
+    options: dict[str, Any] = {
+        "echo": False,
+        "pool_pre_ping": settings.DATABASE_POOL_PRE_PING,
+        "pool_recycle": settings.DATABASE_POOL_RECYCLE,
+    }
+    # SQLite in-memory databases use a single-connection pool without sizing options
+    if make_url(db_url).get_backend_name() != "sqlite":
+        options["pool_size"] = settings.DATABASE_POOL_SIZE
+        options["max_overflow"] = settings.DATABASE_MAX_OVERFLOW
+    return options
+
+def get_async_url(db_url: str = settings.DATABASE_URL) -> str:
+    """Get the async driver URL for a database URL."""
+    if settings.DATABASE_ASYNC_URL and db_url == settings.DATABASE_URL:
+        return settings.DATABASE_ASYNC_URL
+    url = make_url(db_url)
+    backend = url.get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        raise ValueError(f"No async driver for database backend: {backend}")
+    url = url.set(drivername=f"{backend}+{ASYNC_DRIVERS[backend]}")
+    return url.render_as_string(hide_password=False)
+
+def init_engine(db_url: str = settings.DATABASE_URL) -> None:
+    """Create the process-wide sync and async engines. Call this at startup."""
+    global _engine, _async_engine
+    if _engine is None:
+        _engine = create_engine(db_url, **engine_options(db_url))
+    if _async_engine is None:
+        async_url = get_async_url(db_url)
+        _async_engine = create_async_engine(async_url, **engine_options(async_url))
+
+async def dispose_engine() -> None:
+    """Close all pooled connections. Call this at shutdown."""
+    global _engine, _async_engine
+    if _async_engine is not None:
+        await _async_engine.dispose()
+        _async_engine = None
+    if _engine is not None:
+        _engine.dispose()
+        _engine = None
+
+def get_engine() -> Engine:
+    """Get the process-wide database engine."""
+    if _engine is None:
+        init_engine()
+    return _engine
+
+def get_async_engine() -> AsyncEngine:
+    """Get the process-wide async database engine."""
+    if _async_engine is None:
+        init_engine()
+    return _async_engine
+
+def new_async_session() -> AsyncSession:
+    """Open a session on the process-wide async engine."""
+    # Objects stay usable after commit without an implicit (blocking) refresh
+    return AsyncSession(get_async_engine(), expire_on_commit=False)
 
 def get_session() -> Generator[Session, None, None]:
     """Get a database session."""
-    engine = get_engine()
-    with Session(engine) as session:
+    with Session(get_engine()) as session:
+        yield session
+
+async def get_async_session() -> AsyncGenerator[AsyncSession, None]:
+    """Get an async database session."""
+    async with new_async_session() as session:
         yield session
 
 def create_db_and_tables():
     """Call this at startup to create all tables."""
     engine = get_engine()
-    
-    # Create schema if it doesn't exist
-    with engine.connect() as conn:
-        conn.execute(text(f'CREATE SCHEMA IF NOT EXISTS {SCHEMA_NAME}'))
-        conn.commit()
-    
+
+    # Create schema if it doesn't exist (SQLite has no schemas)
+    if engine.dialect.name != "sqlite":
+        with engine.connect() as conn:
+            conn.execute(text(f'CREATE SCHEMA IF NOT EXISTS {SCHEMA_NAME}'))
+            conn.commit()
+
     # Set schema for all models
     SQLModel.metadata.schema = SCHEMA_NAME
-    
+
     # Create all tables in the schema
     SQLModel.metadata.create_all(engine)
+    add_missing_columns(engine)
+    update_indexes(engine)
+
+def add_missing_columns(engine: Engine) -> list[str]:
+    """
+    Add the model columns missing from tables created before them, returns
+    them as "table.column". create_all leaves existing tables alone, so new
+    columns must be nullable or have a server default for the rows already
+    there.
+    """
+    inspector = inspect(engine)
+    added = []
+    with engine.begin() as conn:
+        for table in SQLModel.metadata.sorted_tables:
+            existing = {column["name"] for column in inspector.get_columns(table.name, schema=table.schema)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                definition = CreateColumn(column).compile(dialect=engine.dialect)
+                conn.execute(text(f"ALTER TABLE {table.fullname} ADD COLUMN {definition}"))
+                added.append(f"{table.name}.{column.name}")
+    return added
 
+def update_indexes(engine: Engine) -> None:
+    """
+    Create the model indexes missing from tables created before them, and
+    drop the ones they no longer declare. create_all only indexes the
+    tables it creates.
+    """
+    for table in SQLModel.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(engine, checkfirst=True)
+    with engine.begin() as conn:
+        for name in DROPPED_INDEXES:
+            conn.execute(text(f"DROP INDEX IF EXISTS {name}"))
+
+@contextmanager
+def schema_lock(engine: Engine) -> Iterator[None]:
+    """Hold a Postgres advisory lock so one process at a time changes the schema, across hosts."""
+    # SQLite has no advisory locks, and its database only has one host
+    if engine.dialect.name != "postgresql":
+        yield
+        return
+    with engine.connect() as conn:
+        conn.execute(text("SELECT pg_advisory_lock(:id)"), {"id": SCHEMA_LOCK_ID})
+        try:
+            yield
+        finally:
+            conn.execute(text("SELECT pg_advisory_unlock(:id)"), {"id": SCHEMA_LOCK_ID})
@@ -0,0 +1,187 @@
+"""Read replicas, and the routing of read-only sessions between them and the primary."""
+
+import asyncio
+import itertools
+import multiprocessing
+import time
+import zlib
+from dataclasses import dataclass
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+from sqlmodel.ext.asyncio.session import AsyncSession
+from app.config import get_settings
+from app.logs import get_logger
+from app.metrics import Counter, Gauge
+from app.db.core import engine_options, get_async_engine, get_async_url
+
+logger = get_logger(__name__)
+
+# Seconds a health check may take before the replica counts as down
+CHECK_TIMEOUT = 2
+
+# Replay lag of a Postgres standby, 0 once it has replayed all it received
+# (an idle primary would otherwise look like a lagging standby), None when
+# the database isn't a standby
+POSTGRES_LAG = text(
+    "SELECT CASE WHEN NOT pg_is_in_recovery() THEN NULL "
+    "WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+    "ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END"
+)
+
+read_sessions = Counter("db_read_sessions_total", "Read-only sessions opened", ["target"])
+
+class RecentWrites:
+    """
+    When each user and thread was last written, in shared memory created
+    at import, so the pre-forked workers of app.serve see each other's
+    writes. Keys hash into a fixed number of slots, a collision only
+    keeps more reads on the primary.
+    """
+
+    def __init__(self, size: int):
+        self.size = size
+        self._times = multiprocessing.RawArray("d", size)
+
+    def _slot(self, key: str) -> int:
+        # Not hash(), which could differ between processes
+        return zlib.crc32(key.encode()) % self.size
+
+    def wrote(self, keys: list[str]) -> None:
+        now = time.monotonic()
+        for key in keys:
+            self._times[self._slot(key)] = now
+
+    def within(self, keys: list[str], window: float) -> bool:
+        """Whether any of the keys was written in the last `window` seconds."""
+        now = time.monotonic()
+        return any(
+            self._times[slot] and now - self._times[slot] < window
+            for slot in map(self._slot, keys)
+        )
+
+def _keys(user_id: str | None, thread_id: int | None) -> list[str]:
+    keys = []
+    if user_id is not None:
+        keys.append(f"user:{user_id}")
+    if thread_id is not None:
+        keys.append(f"thread:{thread_id}")
+    return keys
+
+@dataclass
+class Replica:
+    engine: AsyncEngine
+    healthy: bool = True
+    lag: float | None = None
+
+class ReplicaRouter:
+    """
+    Sends read-only sessions to the healthy replicas in turn, and writes
+    (every other session) to the primary. Reads of a user or thread stay
+    on the primary for `window` seconds after it was written, so users
+    read their own writes. Replicas are checked every `check_interval`
+    seconds, and skipped while they're down or, on Postgres, lagging
+    more than `max_lag` seconds behind.
+    """
+
+    def __init__(self, urls: list[str], window: float, check_interval: float, max_lag: float, slots: int = 65536):
+        self.urls = urls
+        self.window = window
+        self.check_interval = check_interval
+        self.max_lag = max_lag
+        self.recent_writes = RecentWrites(slots)
+        self.replicas: list[Replica] = []
+        self._turns = itertools.count()
+        self._watcher: asyncio.Task | None = None
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.urls)
+
+    def start(self) -> None:
+        """Create the replica engines and start checking them. Call this at startup, in each worker."""
+        if not self.urls or self.replicas:
+            return
+        for url in self.urls:
+            async_url = get_async_url(url)
+            self.replicas.append(Replica(create_async_engine(async_url, **engine_options(async_url))))
+        if self.check_interval > 0:
+            self._watcher = asyncio.create_task(self._watch())
+        logger.info("Read replicas enabled", count=len(self.replicas))
+
+    async def stop(self) -> None:
+        """Stop checking the replicas and close their connections."""
+        if self._watcher is not None:
+            self._watcher.cancel()
+            try:
+                await self._watcher
+            except asyncio.CancelledError:
+                pass
+            self._watcher = None
+        for replica in self.replicas:
+            await replica.engine.dispose()
+        self.replicas = []
+
+    def wrote(self, user_id: str | None = None, thread_id: int | None = None) -> None:
+        """Record a committed write, the user's and thread's reads stay on the primary for a while."""
+        if self.enabled:
+            self.recent_writes.wrote(_keys(user_id, thread_id))
+
+    def engine_for(self, user_id: str | None = None, thread_id: int | None = None) -> AsyncEngine | None:
+        """Get the replica engine to read the user's or thread's data from, None for the primary."""
+        if not self.replicas or self.recent_writes.within(_keys(user_id, thread_id), self.window):
+            return None
+        # Round-robin over the healthy ones, starting where the last read left off
+        start = next(self._turns)
+        for i in range(len(self.replicas)):
+            replica = self.replicas[(start + i) % len(self.replicas)]
+            if replica.healthy:
+                return replica.engine
+        return None
+
+    async def check(self) -> None:
+        """Check every replica, marking the ones that fail or lag as unhealthy."""
+        await asyncio.gather(*(self._check(replica) for replica in self.replicas))
+
+    async def _check(self, replica: Replica) -> None:
+        healthy = True
+        try:
+            async with asyncio.timeout(CHECK_TIMEOUT), replica.engine.connect() as conn:
+                if replica.engine.dialect.name == "postgresql":
+                    replica.lag = (await conn.execute(POSTGRES_LAG)).scalar()
+                    healthy = replica.lag is None or replica.lag <= self.max_lag
+                else:
+                    await conn.execute(text("SELECT 1"))
+        except Exception as e:
+            healthy = False
+            logger.debug("Replica check failed", replica=replica.engine.url.render_as_string(), error=str(e))
+        if healthy != replica.healthy:
+            # Logged on changes only, checks run every few seconds
+            log = logger.info if healthy else logger.warn
+            log("Replica healthy" if healthy else "Replica unhealthy", replica=replica.engine.url.render_as_string(), lag=replica.lag)
+        replica.healthy = healthy
+
+    async def _watch(self) -> None:
+        while True:
+            await asyncio.sleep(self.check_interval)
+            await self.check()
+
+settings = get_settings()
+replicas = ReplicaRouter(
+    urls=[url.strip() for url in settings.DATABASE_REPLICA_URLS.split(",") if url.strip()],
+    window=settings.DATABASE_READ_YOUR_WRITES,
+    check_interval=settings.DATABASE_REPLICA_CHECK_INTERVAL,
+    max_lag=settings.DATABASE_REPLICA_MAX_LAG
+)
+Gauge(
+    "db_replicas_healthy", "Read replicas currently taking reads",
+    callback=lambda: sum(replica.healthy for replica in replicas.replicas)
+)
+
+def new_read_session(user_id: str | None = None, thread_id: int | None = None) -> AsyncSession:
+    """
+    Open a session for read-only queries about a user or thread, on a
+    replica unless either was written within the read-your-writes window.
+    """
+    engine = replicas.engine_for(user_id, thread_id)
+    read_sessions.inc(target="primary" if engine is None else "replica")
+    return AsyncSession(engine or get_async_engine(), expire_on_commit=False)
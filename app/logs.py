@@ -0,0 +1,113 @@
+"""Logging policy: per-module levels, lazy attributes and trace sampling."""
+
+from typing import Any, Callable
+import logfire
+from app.config import get_settings
+
+# logfire's level numbers
+LEVELS = {
+    "trace": 1,
+    "debug": 5,
+    "info": 9,
+    "notice": 10,
+    "warn": 13,
+    "error": 17,
+    "fatal": 21,
+}
+
+class Lazy:
+    """An attribute computed only when the log line is actually emitted."""
+    __slots__ = ("compute",)
+
+    def __init__(self, compute: Callable[[], Any]):
+        self.compute = compute
+
+def lazy(compute: Callable[[], Any]) -> Lazy:
+    """Defer an expensive log attribute, e.g. `messages=lazy(lambda: dump(messages))`."""
+    return Lazy(compute)
+
+def parse_levels(spec: str) -> dict[str, int]:
+    """Parse "module=level,..." into minimum levels per module prefix."""
+    levels = {}
+    for item in spec.split(","):
+        if not item.strip():
+            continue
+        module, _, level = item.partition("=")
+        if level.strip().lower() not in LEVELS:
+            raise ValueError(f"Unknown log level for {module.strip()}: {level.strip()}")
+        levels[module.strip()] = LEVELS[level.strip().lower()]
+    return levels
+
+class Logger:
+    """
+    A module's logger. Calls below the module's level return before
+    anything is formatted, and Lazy attributes are only computed for the
+    lines that go out, so disabled debug logging on hot paths costs one
+    integer comparison.
+    """
+
+    def __init__(self, name: str, level: int):
+        self.name = name
+        self.level = level
+
+    def enabled(self, level: str) -> bool:
+        return LEVELS[level] >= self.level
+
+    def debug(self, msg: str, **attributes: Any) -> None:
+        if LEVELS["debug"] >= self.level:
+            self._emit("debug", msg, attributes)
+
+    def info(self, msg: str, **attributes: Any) -> None:
+        if LEVELS["info"] >= self.level:
+            self._emit("info", msg, attributes)
+
+    def warn(self, msg: str, **attributes: Any) -> None:
+        if LEVELS["warn"] >= self.level:
+            self._emit("warn", msg, attributes)
+
+    def error(self, msg: str, **attributes: Any) -> None:
+        if LEVELS["error"] >= self.level:
+            self._emit("error", msg, attributes)
+
+    def _emit(self, level: str, msg: str, attributes: dict[str, Any]) -> None:
+        for key, value in attributes.items():
+            if isinstance(value, Lazy):
+                attributes[key] = value.compute()
+        logfire.log(level, msg, attributes=attributes)
+
+_loggers: dict[str, Logger] = {}
+_default_level = LEVELS["info"]
+_module_levels: dict[str, int] = {}
+
+def _level_for(name: str) -> int:
+    """Get the level of the longest configured module prefix of `name`."""
+    best = None
+    for module, level in _module_levels.items():
+        if (name == module or name.startswith(module + ".")) and (best is None or len(module) > len(best)):
+            best = module
+    return _module_levels[best] if best is not None else _default_level
+
+def get_logger(name: str) -> Logger:
+    """Get the logger of a module, usually `get_logger(__name__)`."""
+    if name not in _loggers:
+        _loggers[name] = Logger(name, _level_for(name))
+    return _loggers[name]
+
+def set_levels(default: str, modules: str = "") -> None:
+    """Set the default level and per-module levels, applies to existing loggers."""
+    global _default_level, _module_levels
+    if default.lower() not in LEVELS:
+        raise ValueError(f"Unknown log level: {default}")
+    _default_level = LEVELS[default.lower()]
+    _module_levels = parse_levels(modules)
+    for name, logger in _loggers.items():
+        logger.level = _level_for(name)
+
+def configure_logfire(**kwargs: Any) -> None:
+    """Configure logfire with the settings' trace sampling."""
+    # Head-based: the decision is made at the root span (the request), so a
+    # trace is kept or dropped whole
+    logfire.configure(sampling=logfire.SamplingOptions(head=settings.TRACE_SAMPLE_RATE), **kwargs)
+
+settings = get_settings()
+set_levels(settings.LOG_LEVEL, settings.LOG_LEVELS)
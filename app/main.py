@@ -8,43 +8,99 @@ import logfire
 from pathlib import Path
 
 # Import models first so SQLModel knows what tables to create
-from app.models.thread import Thread
-from app.models.message import Message, MessagePart
+from app import models  # noqa: F401
 
-from app.routers import chat
-from app.db.core import create_db_and_tables
+from app import workers
+from app.routers import chat, health, metrics, search, threads
+from app.db.core import init_engine, dispose_engine, create_db_and_tables, get_engine, schema_lock
+from app.db.replicas import replicas
 from app.agents.registry import AgentRegistry
+from app.agents.write_behind import write_behind
+from app.agents.providers import model_clients
+from app.agents.codec import check_format
+from app.agents.search import create_search_index
+from app.tools import tool_registry
+from app.config import get_settings
+from app.logs import get_logger, configure_logfire
+
+logger = get_logger(__name__)
 
 app = FastAPI()
 
 # Configure logging
-logfire.configure()
+configure_logfire()
 logfire.instrument_fastapi(app)
 
 # Get the template directory
 templates_dir = Path(__file__).parent / "templates"
 
+# Set once the tables exist and the agents are registered, by the parent
+# process before forking when served by app.serve
+_prepared = False
+
+def prepare() -> None:
+    """Create the tables and register the agents, once per server rather than per worker."""
+    global _prepared
+    if _prepared:
+        return
+    init_engine()
+    # Other servers sharing the database may be starting too
+    with schema_lock(get_engine()):
+        create_db_and_tables()
+        create_search_index(get_engine())
+    if get_settings().MESSAGE_STORAGE == "payload":
+        check_format(get_settings().MESSAGE_PAYLOAD_FORMAT)
+    logger.info("Database initialized")
+    
+    # Register agents, each is built on its first request
+    AgentRegistry.load_from_config()
+    logger.info("Agents registered")
+    _prepared = True
+
 @app.on_event("startup")
 async def on_startup():
     """Initialize application dependencies."""
     try:
-        # Initialize database
-        create_db_and_tables()
-        logfire.info("Database initialized")
+        init_engine()
+        prepare()
+        replicas.start()
+        
+        # Start background persistence, replaying any turns left from a crash
+        if get_settings().PERSISTENCE_MODE == "write_behind":
+            await write_behind.start()
+            logger.info("Write-behind persistence started")
         
-        # Load and register agents
-        AgentRegistry.load_from_config()
-        logfire.info("Agents loaded")
+        AgentRegistry.start_watching()
+        workers.start_heartbeat()
+        
+        # Open model provider connections before the first turn needs them
+        await model_clients.warm_up()
         
         # Log available agents
         agents = AgentRegistry.list()
-        logfire.info("Available agents", count=len(agents), agents=[a["id"] for a in agents])
+        logger.info("Available agents", count=len(agents), agents=[a["id"] for a in agents])
         
     except Exception as e:
-        logfire.error("Failed to initialize application", error=str(e))
+        logger.error("Failed to initialize application", error=str(e))
         raise
 
+@app.on_event("shutdown")
+async def on_shutdown():
+    """Release application resources."""
+    await workers.stop_heartbeat()
+    await AgentRegistry.stop_watching()
+    await write_behind.stop()
+    await model_clients.close()
+    tool_registry.shutdown()
+    await replicas.stop()
+    await dispose_engine()
+    logger.info("Database connections closed")
+
 app.include_router(chat.router)
+app.include_router(health.router)
+app.include_router(metrics.router)
+app.include_router(search.router)
+app.include_router(threads.router)
 
 @app.get("/", response_class=HTMLResponse)
 async def read_root():
@@ -52,5 +108,6 @@ async def read_root():
     return (templates_dir / "index.html").read_text()
 
 if __name__ == "__main__":
+    # Development server, production runs python -m app.serve
     uvicorn.run("app.main:app", host="0.0.0.0", port=8000, reload=True)
 
@@ -0,0 +1,18 @@
+"""
+Database models. Importing the package registers every table with
+SQLModel, so create_db_and_tables creates all of them whichever entry
+point calls it.
+"""
+
+from app.models.thread import Thread
+from app.models.message import Message, MessagePart, MessageKind
+from app.models.checkpoint import ContextCheckpoint
+from app.models.chat_result import ChatResult
+from app.models.response_cache import CachedResponse
+from app.models.search import SearchDocument
+from app.models.archive import ArchivedMessage
+
+__all__ = [
+    "Thread", "Message", "MessagePart", "MessageKind", "ContextCheckpoint",
+    "ChatResult", "CachedResponse", "SearchDocument", "ArchivedMessage",
+]
@@ -0,0 +1,36 @@
+"""Archive of messages moved out of the hot tables by retention."""
+
+from datetime import datetime
+from sqlalchemy import LargeBinary
+from sqlmodel import SQLModel, Field, Column
+
+class ArchivedMessage(SQLModel, table=True):
+    """
+    A message archived by app.agents.retention, serialized whole.
+    It keeps the id it had in the message table, and the thread's user
+    and persona, so it can be found after the thread has moved on.
+    """
+    id: int = Field(primary_key=True)  # The message's id
+    thread_id: int = Field(index=True)
+    user_id: str = Field(index=True)
+    persona_id: str
+    timestamp: datetime
+    payload: bytes = Field(sa_column=Column(LargeBinary, nullable=False))
+    payload_format: str  # e.g. "json" or "msgpack+zstd"
+    payload_version: int
+    archived_at: datetime = Field(default_factory=datetime.utcnow)
+
+    class Config:
+        json_schema_extra = {
+            "example": {
+                "id": 1,
+                "thread_id": 1,
+                "user_id": "default",
+                "persona_id": "basic",
+                "timestamp": "2024-02-20T12:00:00",
+                "payload": "{\"parts\":[{\"content\":\"Roll a dice for me\",\"part_kind\":\"user-prompt\"}],\"kind\":\"request\"}",
+                "payload_format": "json",
+                "payload_version": 1,
+                "archived_at": "2024-05-20T03:00:00"
+            }
+        }
@@ -0,0 +1,35 @@
+"""Stored chat responses, replayed for retried requests."""
+
+from datetime import datetime
+from sqlmodel import SQLModel, Field, Column, JSON
+from sqlalchemy import UniqueConstraint
+
+class ChatResult(SQLModel, table=True):
+    """
+    The response to a chat request that carried an idempotency key.
+    A retry with the same key gets this response instead of a new turn.
+    """
+    id: int = Field(default=None, primary_key=True)
+    user_id: str
+    agent_id: str
+    idempotency_key: str
+    fingerprint: str  # Hash of the request content, a reused key must match it
+    response: dict = Field(sa_column=Column(JSON))
+    created_at: datetime = Field(default_factory=datetime.utcnow, index=True)
+
+    __table_args__ = (
+        UniqueConstraint('user_id', 'agent_id', 'idempotency_key', name='unique_chat_result_key'),
+    )
+
+    class Config:
+        json_schema_extra = {
+            "example": {
+                "id": 1,
+                "user_id": "default",
+                "agent_id": "full",
+                "idempotency_key": "5f0c8a5e-2a4b-4f7e-9d0c-1b2a3c4d5e6f",
+                "fingerprint": "9b74c9897bac770ffc029102a200c5de",
+                "response": {"content": "You rolled a 4", "error": None, "parts": []},
+                "created_at": "2024-02-20T12:00:00"
+            }
+        }
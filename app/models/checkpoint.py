@@ -0,0 +1,37 @@
+"""Context checkpoint model for summarized thread history."""
+
+from datetime import datetime
+from sqlmodel import SQLModel, Field
+
+class ContextCheckpoint(SQLModel, table=True):
+    """
+    Rolling summary of a thread's history up to and including a message.
+    History loads start from the latest checkpoint, so messages it covers
+    are no longer read or sent to the model.
+    """
+    id: int = Field(default=None, primary_key=True)
+    thread_id: int = Field(foreign_key="thread.id", index=True)
+    through_message_id: int = Field(foreign_key="message.id")
+    # That message's timestamp, history is cut at its (timestamp, id) key
+    # as it's ordered by. None on checkpoints written before, cut by id
+    through_timestamp: datetime | None = None
+    system_prompt: str | None = None
+    summary: str
+    # The thread's version with the checkpoint written, turns loaded at an
+    # earlier version didn't see it
+    thread_version: int = Field(default=0, sa_column_kwargs={"server_default": "0"})
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+
+    class Config:
+        json_schema_extra = {
+            "example": {
+                "id": 1,
+                "thread_id": 1,
+                "through_message_id": 42,
+                "through_timestamp": "2024-02-20T11:58:00",
+                "system_prompt": "You are a helpful assistant.",
+                "summary": "The user asked for a d20 roll and got 17.",
+                "thread_version": 12,
+                "created_at": "2024-02-20T12:00:00"
+            }
+        }
@@ -2,6 +2,7 @@
 
 from datetime import datetime
 from enum import Enum
+from sqlalchemy import Index, LargeBinary
 from sqlmodel import SQLModel, Field, Column, JSON, Relationship
 
 class MessageKind(str, Enum):
@@ -12,7 +13,7 @@ class MessageKind(str, Enum):
 class MessagePart(SQLModel, table=True):
     """Base class for all message parts."""
     id: int = Field(default=None, primary_key=True)
-    message_id: int = Field(foreign_key="message.id", index=True)
+    message_id: int = Field(foreign_key="message.id")
     part_kind: str = Field(index=True)  # Discriminator field
     content: str | None = None
     timestamp: datetime | None = Field(default=None)
@@ -28,6 +29,11 @@ class MessagePart(SQLModel, table=True):
     # Relationship
     message: "Message" = Relationship(back_populates="parts")
 
+    # Parts of a page of messages are read in bulk, in order
+    __table_args__ = (
+        Index("ix_messagepart_message_id_id", "message_id", "id"),
+    )
+
     class Config:
         json_schema_extra = {
             "example": {
@@ -46,13 +52,23 @@ class MessagePart(SQLModel, table=True):
 class Message(SQLModel, table=True):
     """A message in a conversation (request or response)."""
     id: int = Field(default=None, primary_key=True)
-    thread_id: int = Field(foreign_key="thread.id", index=True)
+    thread_id: int = Field(foreign_key="thread.id")
     kind: MessageKind = Field(index=True)
     timestamp: datetime = Field(default_factory=datetime.utcnow)
     
+    # The whole message serialized, with MESSAGE_STORAGE="payload" it has no parts
+    payload: bytes | None = Field(default=None, sa_column=Column(LargeBinary))
+    payload_format: str | None = None  # e.g. "json" or "msgpack+zstd"
+    payload_version: int | None = None
+    
     # Relationships
     parts: list[MessagePart] = Relationship(back_populates="message")
 
+    # History loads and pages seek on (thread_id, timestamp, id) in index order
+    __table_args__ = (
+        Index("ix_message_thread_id_timestamp_id", "thread_id", "timestamp", "id"),
+    )
+
     def to_model_message(self) -> dict:
         """Convert to pydantic-ai ModelMessage format."""
         return {
@@ -0,0 +1,25 @@
+"""Model responses cached for deterministic agents."""
+
+from datetime import datetime
+from sqlalchemy import LargeBinary
+from sqlmodel import SQLModel, Field, Column
+
+class CachedResponse(SQLModel, table=True):
+    """
+    A model response keyed on a hash of everything the model was sent.
+    Rows older than the agent's cache TTL are ignored and replaced.
+    """
+    key: str = Field(primary_key=True)  # sha256 hex of the request
+    agent_id: str = Field(index=True)
+    payload: bytes = Field(sa_column=Column(LargeBinary, nullable=False))  # ModelResponse as JSON
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+
+    class Config:
+        json_schema_extra = {
+            "example": {
+                "key": "3f79bb7b435b05321651daefd374cdc681dc06faa65e374e38337b88ca046dea",
+                "agent_id": "basic",
+                "payload": "{\"parts\":[{\"content\":\"Hi! How can I help?\",\"part_kind\":\"text\"}],\"kind\":\"response\"}",
+                "created_at": "2024-02-20T12:00:00"
+            }
+        }
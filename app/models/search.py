@@ -0,0 +1,27 @@
+"""Full-text search documents of conversation history."""
+
+from sqlmodel import SQLModel, Field
+
+class SearchDocument(SQLModel, table=True):
+    """
+    The text of one message part, as indexed for search.
+    On Postgres the table also has a generated tsvector column with a GIN
+    index, on SQLite an FTS5 table kept in sync by triggers, both created
+    by app.agents.search.create_search_index.
+    """
+    id: int = Field(default=None, primary_key=True)
+    message_id: int = Field(foreign_key="message.id", index=True)
+    thread_id: int = Field(foreign_key="thread.id", index=True)
+    part_kind: str  # "user-prompt", "text" or "tool-return"
+    content: str
+
+    class Config:
+        json_schema_extra = {
+            "example": {
+                "id": 1,
+                "message_id": 1,
+                "thread_id": 1,
+                "part_kind": "user-prompt",
+                "content": "Roll a dice for me"
+            }
+        }
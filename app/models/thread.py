@@ -2,7 +2,7 @@
 
 from sqlmodel import SQLModel, Field
 from datetime import datetime
-from sqlalchemy import UniqueConstraint
+from sqlalchemy import Index, UniqueConstraint
 
 class Thread(SQLModel, table=True):
     """
@@ -15,9 +15,13 @@ class Thread(SQLModel, table=True):
     name: str
     created_at: datetime = Field(default_factory=datetime.utcnow)
     updated_at: datetime = Field(default_factory=datetime.utcnow)
+    # Bumped by every write that changes the history a load returns, so
+    # processes holding a decoded copy can tell whether it's still current
+    version: int = Field(default=0, sa_column_kwargs={"server_default": "0"})
 
     __table_args__ = (
         UniqueConstraint('user_id', 'persona_id', name='unique_user_persona'),
+        Index('ix_thread_user_id_id', 'user_id', 'id'),  # A user's threads, newest first
     )
 
     class Config:
@@ -28,6 +32,7 @@ class Thread(SQLModel, table=True):
                 "persona_id": "basic",
                 "name": "Chat with basic",
                 "created_at": "2024-02-20T12:00:00",
-                "updated_at": "2024-02-20T12:00:00"
+                "updated_at": "2024-02-20T12:00:00",
+                "version": 0
             }
         } 
\ No newline at end of file
@@ -1,26 +1,148 @@
 """Chat endpoints."""
 
-from fastapi import APIRouter
-import logfire
+import asyncio
+import time
+from contextlib import aclosing
+from typing import AsyncIterator
+from fastapi import APIRouter, Header, HTTPException, WebSocket, WebSocketDisconnect, status
+from fastapi.responses import StreamingResponse
+from app.config import get_settings
+from app.logs import get_logger
 from app.agents.registry import AgentRegistry
-from app.agents.chat import ChatRequest, ChatResponse
+from app.agents.chat import ChatRequest, ChatResponse, ChatEvent
+from app.agents.concurrency import Overloaded
+from app.agents.batch import BatchRequest, run_batch
+from app.agents.idempotency import IdempotencyConflict, chat_results
+from app.agents.sessions import chat_sessions
+
+logger = get_logger(__name__)
 
 router = APIRouter(prefix="/chat")
 
 @router.post("/message")
-async def send_message(request: ChatRequest) -> dict:
-    """Send a message to an agent."""
+async def send_message(request: ChatRequest, idempotency_key: str | None = Header(None)) -> dict:
+    """Send a message to an agent, retries with the same Idempotency-Key header run it once."""
+    request.idempotency_key = request.idempotency_key or idempotency_key
     try:
         agent = AgentRegistry.get(request.agent_id)
-        response = await agent.chat(request)
+        response = await chat_results.run(request, lambda: agent.chat(request))
         return {"response": response}
+    except Overloaded as e:
+        raise _overloaded(e)
+    except IdempotencyConflict as e:
+        raise HTTPException(status_code=422, detail=str(e))
     except Exception as e:
-        logfire.error("Failed to process message", error=str(e))
+        logger.error("Failed to process message", error=str(e))
         return {"response": ChatResponse(
             content="Sorry, I encountered an error.",
             error=str(e)
         )}
 
+@router.post("/stream")
+async def stream_message(request: ChatRequest) -> StreamingResponse:
+    """Send a message to an agent and stream the reply as NDJSON events."""
+    # Reject before the response starts, so the client gets a real status code
+    if _is_overloaded(request.agent_id):
+        raise _overloaded(Overloaded(f"Too many queued requests for {request.agent_id}", status_code=429))
+    
+    async def events() -> AsyncIterator[str]:
+        try:
+            agent = AgentRegistry.get(request.agent_id)
+            async for event in agent.chat_stream(request):
+                yield event.model_dump_json(exclude_none=True) + "\n"
+        except Exception as e:
+            logger.error("Failed to stream message", error=str(e))
+            event = ChatEvent(event="error", content="Sorry, I encountered an error.", error=str(e))
+            yield event.model_dump_json(exclude_none=True) + "\n"
+    
+    return StreamingResponse(events(), media_type="application/x-ndjson")
+
+@router.websocket("/ws")
+async def chat_socket(websocket: WebSocket, agent_id: str, user_id: str = "default"):
+    """
+    Chat with one agent over a WebSocket. The thread and its history are
+    loaded once and kept for the connection, so follow-up turns skip
+    loading them. Each {"content": ...} message gets the events of
+    /chat/stream, ending with "done" or "error". The server sends
+    {"event": "ping"} when the client is quiet, and closes the connection
+    once it has been idle for WS_IDLE_TIMEOUT.
+    """
+    try:
+        agent = AgentRegistry.get(agent_id)
+    except ValueError as e:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION, reason=str(e))
+        return
+    state = chat_sessions.opened((user_id, agent_id))
+    if state is None:
+        await websocket.close(code=status.WS_1013_TRY_AGAIN_LATER, reason="Too many connections")
+        return
+    
+    settings = get_settings()
+    try:
+        await websocket.accept()
+        await agent.open_thread(state)
+        await websocket.send_json({"event": "ready", "thread_id": state.thread_id})
+        last_seen = time.monotonic()
+        while True:
+            try:
+                message = await asyncio.wait_for(websocket.receive_json(), settings.WS_HEARTBEAT_INTERVAL)
+            except asyncio.TimeoutError:
+                if time.monotonic() - last_seen >= settings.WS_IDLE_TIMEOUT:
+                    await websocket.close(code=status.WS_1000_NORMAL_CLOSURE, reason="Idle")
+                    return
+                await websocket.send_json({"event": "ping"})
+                continue
+            except ValueError:
+                message = None  # Not JSON
+            
+            last_seen = time.monotonic()
+            if isinstance(message, dict) and message.get("event") == "pong":
+                continue
+            content = message.get("content") if isinstance(message, dict) else None
+            if not isinstance(content, str) or not content.strip():
+                await websocket.send_text(ChatEvent(event="error", error="Expected {\"content\": \"...\"}").model_dump_json(exclude_none=True))
+                continue
+            
+            request = ChatRequest(content=content, agent_id=agent_id, user_id=user_id)
+            try:
+                # Closed on a disconnect mid-turn, which drops the turn like a failed one
+                async with aclosing(agent.chat_stream(request, state)) as events:
+                    async for event in events:
+                        await websocket.send_text(event.model_dump_json(exclude_none=True))
+            except Overloaded as e:
+                logger.warn("Rejected message", error=str(e), status_code=e.status_code)
+                event = ChatEvent(event="error", content="Too many requests, try again shortly.", error=str(e))
+                await websocket.send_text(event.model_dump_json(exclude_none=True))
+            last_seen = time.monotonic()
+    except WebSocketDisconnect:
+        pass
+    except Exception as e:
+        logger.error("Chat session failed", agent=agent_id, error=str(e))
+        await websocket.close(code=status.WS_1011_INTERNAL_ERROR)
+    finally:
+        chat_sessions.closed(state)
+
+@router.post("/batch")
+async def batch_messages(request: BatchRequest) -> StreamingResponse:
+    """Send many messages and stream their replies as NDJSON, in completion order."""
+    async def results() -> AsyncIterator[str]:
+        async for result in run_batch(request.requests, request.concurrency):
+            yield result.model_dump_json() + "\n"
+    
+    return StreamingResponse(results(), media_type="application/x-ndjson")
+
+def _is_overloaded(agent_id: str) -> bool:
+    """Whether a new model call for the agent would be rejected right away."""
+    try:
+        return AgentRegistry.get(agent_id).is_overloaded()
+    except ValueError:
+        return False  # Unknown agents are reported in the stream
+
+def _overloaded(e: Overloaded) -> HTTPException:
+    """Get the HTTP error for a rejected model call."""
+    logger.warn("Rejected message", error=str(e), status_code=e.status_code)
+    return HTTPException(status_code=e.status_code, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+
 @router.get("/agents")
 async def list_agents() -> list[dict]:
     """List available agents."""
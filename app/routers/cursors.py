@@ -0,0 +1,20 @@
+"""Opaque cursors of keyset-paginated endpoints."""
+
+import base64
+import json
+from typing import Any, Callable
+from fastapi import HTTPException
+
+def encode_cursor(*key: Any) -> str:
+    """Get an opaque cursor for a keyset position."""
+    return base64.urlsafe_b64encode(json.dumps(key).encode()).decode()
+
+def decode_cursor(cursor: str, *types: Callable[[Any], Any]) -> list[Any]:
+    """Get the keyset position of a cursor, converting each value, 400 if it isn't one of ours."""
+    try:
+        key = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        if not isinstance(key, list) or len(key) != len(types):
+            raise ValueError("Wrong cursor length")
+        return [convert(value) for convert, value in zip(types, key)]
+    except (TypeError, ValueError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
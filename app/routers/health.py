@@ -0,0 +1,32 @@
+"""Health endpoint."""
+
+import os
+import time
+from typing import Any
+from fastapi import APIRouter
+from app import workers
+from app.agents.write_behind import write_behind
+
+router = APIRouter()
+
+_started = time.time()
+
+@router.on_event("startup")
+async def on_startup():
+    # Set again in each worker, the module is imported before forking
+    global _started
+    _started = time.time()
+
+@router.get("/health")
+async def get_health() -> dict[str, Any]:
+    """Get the health of the worker that served the request, and of its siblings when pre-forked."""
+    health: dict[str, Any] = {
+        "status": "ok",
+        "pid": os.getpid(),
+        "worker": workers.worker_slot,
+        "uptime": round(time.time() - _started, 3),
+        "write_behind_depth": write_behind.depth()
+    }
+    if workers.worker_table is not None:
+        health["workers"] = workers.worker_table.snapshot()
+    return health
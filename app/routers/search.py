@@ -0,0 +1,56 @@
+"""Full-text search endpoint."""
+
+from datetime import datetime
+from typing import Literal
+from fastapi import APIRouter, Query
+from pydantic import BaseModel
+from app.db.replicas import new_read_session
+from app.agents.search import search
+from app.routers.cursors import decode_cursor, encode_cursor
+
+router = APIRouter()
+
+class SearchHit(BaseModel):
+    """A message part matching the query, with the thread it's in."""
+    message_id: int
+    thread_id: int
+    user_id: str
+    persona_id: str
+    part_kind: str
+    content: str
+    timestamp: datetime
+    score: float
+
+class SearchPage(BaseModel):
+    """A page of search hits, best first."""
+    hits: list[SearchHit]
+    next_cursor: str | None = None
+
+@router.get("/search")
+async def search_messages(
+    q: str = Query(min_length=1, max_length=500),
+    user_id: str | None = None,
+    persona_id: str | None = None,
+    part_kind: Literal["user-prompt", "text", "tool-return"] | None = None,
+    cursor: str | None = None,
+    limit: int = Query(20, ge=1, le=100)
+) -> SearchPage:
+    """Find message parts by content, ranked by relevance."""
+    after = tuple(decode_cursor(cursor, float, int)) if cursor else None
+    async with new_read_session(user_id=user_id) as session:
+        rows = await session.run_sync(search, q, user_id, persona_id, part_kind, after, limit)
+
+    hits = [
+        SearchHit(
+            message_id=row.message_id,
+            thread_id=row.thread_id,
+            user_id=row.user_id,
+            persona_id=row.persona_id,
+            part_kind=row.part_kind,
+            content=row.content,
+            timestamp=row.timestamp,
+            score=row.score
+        ) for row in rows
+    ]
+    next_cursor = encode_cursor(rows[-1].score, rows[-1].id) if len(rows) == limit else None
+    return SearchPage(hits=hits, next_cursor=next_cursor)
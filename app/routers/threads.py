@@ -0,0 +1,61 @@
+"""Thread history endpoints."""
+
+from datetime import datetime
+from typing import Any
+from fastapi import APIRouter, HTTPException, Query
+from pydantic import BaseModel
+from pydantic_ai.messages import ModelMessagesTypeAdapter
+from app.db.replicas import new_read_session
+from app.agents.history import list_threads, load_page
+from app.models.thread import Thread
+from app.routers.cursors import decode_cursor, encode_cursor
+
+router = APIRouter(prefix="/threads")
+
+class ThreadPage(BaseModel):
+    """A page of threads, newest first."""
+    threads: list[Thread]
+    next_cursor: str | None = None
+
+class MessagePage(BaseModel):
+    """A page of a thread's messages, oldest first, `next_cursor` leads to older ones."""
+    messages: list[dict[str, Any]]
+    next_cursor: str | None = None
+
+@router.get("")
+async def get_threads(
+    user_id: str | None = None,
+    cursor: str | None = None,
+    limit: int = Query(50, ge=1, le=200)
+) -> ThreadPage:
+    """List threads, newest first."""
+    before_id = decode_cursor(cursor, int)[0] if cursor else None
+    async with new_read_session(user_id=user_id) as session:
+        threads = await session.run_sync(list_threads, user_id, before_id, limit)
+    # A full page may have more after it, the last page is the first short one
+    next_cursor = encode_cursor(threads[-1].id) if len(threads) == limit else None
+    return ThreadPage(threads=threads, next_cursor=next_cursor)
+
+@router.get("/{thread_id}/messages")
+async def get_messages(
+    thread_id: int,
+    cursor: str | None = None,
+    limit: int = Query(50, ge=1, le=200)
+) -> MessagePage:
+    """Page backwards through a thread's messages, starting from the latest."""
+    before = tuple(decode_cursor(cursor, datetime.fromisoformat, int)) if cursor else None
+    async with new_read_session(thread_id=thread_id) as session:
+        if await session.get(Thread, thread_id) is None:
+            raise HTTPException(status_code=404, detail=f"Unknown thread: {thread_id}")
+        rows = await session.run_sync(load_page, thread_id, before, limit)
+
+    dumped = ModelMessagesTypeAdapter.dump_python([message for _, _, message in rows], mode="json")
+    messages = [
+        {**message, "id": message_id, "timestamp": timestamp.isoformat()}
+        for (message_id, timestamp, _), message in zip(rows, dumped)
+    ]
+    next_cursor = None
+    if len(rows) == limit:
+        oldest_id, oldest_ts, _ = rows[0]
+        next_cursor = encode_cursor(oldest_ts.isoformat(), oldest_id)
+    return MessagePage(messages=messages, next_cursor=next_cursor)
@@ -0,0 +1,196 @@
+"""
+Production server: pre-forked uvicorn workers sharing one listening socket.
+
+The parent imports the application, creates the tables under the schema
+lock and registers (and by default builds) the agents once, then forks
+the workers, so they share that memory copy-on-write instead of each
+importing and loading it again. The parent restarts workers that exit
+or stop sending heartbeats, and on SIGTERM or SIGINT lets every worker
+drain its requests in flight before exiting.
+
+Each worker keeps its own history cache, WebSocket sessions and thread
+locks. Cached history is checked against the thread's version in the
+database before every use, so a thread's requests may land on any
+worker, but turns on one thread only wait for each other within a
+worker. Model provider clients built before the fork open their
+connection pools in each worker, on first use.
+
+Metrics are per worker too, they aren't aggregated: a scrape of
+/metrics reaches whichever worker accepts it and shows only that
+worker's share of the traffic, and its counters restart with it.
+
+    python -m app.serve --host 0.0.0.0 --port 80 --workers 4
+"""
+
+import argparse
+import asyncio
+import gc
+import os
+import signal
+import socket
+import time
+from pathlib import Path
+import uvicorn
+from app import workers
+from app.config import get_settings
+from app.logs import get_logger
+
+logger = get_logger(__name__)
+
+# Seconds between checks of the workers, and before a crashed one is forked again
+POLL_INTERVAL = 0.5
+RESTART_DELAY = 1
+
+def worker_outbox(path: Path, slot: int) -> Path:
+    """The write-behind outbox of a worker slot, replayed by the slot's next worker after a crash."""
+    return path.with_name(f"{path.stem}.{slot}{path.suffix}")
+
+class Supervisor:
+    """Forks the workers, restarts those that die or hang, and drains them on shutdown."""
+
+    def __init__(self, config: uvicorn.Config, sock: socket.socket, table: workers.WorkerTable):
+        settings = get_settings()
+        self.config = config
+        self.sock = sock
+        self.table = table
+        self.drain_timeout = settings.SERVE_DRAIN_TIMEOUT
+        self.heartbeat_timeout = settings.SERVE_HEARTBEAT_TIMEOUT
+        self.stopping = False
+        self._pids: dict[int, int] = {}  # pid -> slot
+        self._restarts: dict[int, float] = {}  # slot -> when to fork it again
+
+    def run(self) -> None:
+        """Fork every worker and supervise them until asked to stop."""
+        signal.signal(signal.SIGTERM, self._stop)
+        signal.signal(signal.SIGINT, self._stop)
+        for slot in range(self.table.size):
+            self._spawn(slot)
+        logger.info("Serving", workers=self.table.size, pid=os.getpid())
+        while not self.stopping:
+            self._reap()
+            self._restart()
+            self._check_heartbeats()
+            time.sleep(POLL_INTERVAL)
+        self._drain()
+
+    def _stop(self, signum: int, frame) -> None:
+        self.stopping = True
+
+    def _spawn(self, slot: int) -> None:
+        pid = os.fork()
+        if pid == 0:
+            code = 1
+            try:
+                self._serve(slot)
+                code = 0
+            except BaseException as e:
+                logger.error("Worker failed", worker=slot, error=str(e))
+            finally:
+                os._exit(code)
+        self._pids[pid] = slot
+        self.table.started(slot, pid)
+
+    def _serve(self, slot: int) -> None:
+        """Run one worker, in the forked child."""
+        # uvicorn installs its own handlers, which drain on SIGTERM
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        signal.signal(signal.SIGINT, signal.SIG_DFL)
+        workers.worker_slot = slot
+        from app.agents.write_behind import write_behind
+        write_behind.outbox_path = worker_outbox(write_behind.outbox_path, slot)
+        uvicorn.Server(self.config).run(sockets=[self.sock])
+
+    def _reap(self) -> None:
+        """Collect workers that exited and schedule their restart."""
+        while self._pids:
+            pid, status = os.waitpid(-1, os.WNOHANG)
+            if pid == 0:
+                return
+            slot = self._pids.pop(pid, None)
+            if slot is None:
+                continue
+            if not self.stopping:
+                logger.warn("Worker exited", worker=slot, pid=pid, status=os.waitstatus_to_exitcode(status))
+                # Delayed, so a worker failing at startup doesn't fork in a tight loop
+                self._restarts[slot] = time.monotonic() + RESTART_DELAY
+
+    def _restart(self) -> None:
+        now = time.monotonic()
+        for slot, at in list(self._restarts.items()):
+            if at <= now:
+                del self._restarts[slot]
+                self._spawn(slot)
+
+    def _check_heartbeats(self) -> None:
+        """Kill workers whose event loop stopped responding, they are restarted once reaped."""
+        if self.heartbeat_timeout <= 0:
+            return
+        for pid, slot in self._pids.items():
+            silent_for = self.table.silent_for(slot)
+            if silent_for > self.heartbeat_timeout:
+                logger.error("Worker stopped responding", worker=slot, pid=pid, silent_for=round(silent_for, 1))
+                self._kill(pid, signal.SIGKILL)
+
+    def _drain(self) -> None:
+        """Let the workers finish their requests in flight, then kill the stragglers."""
+        logger.info("Draining workers", workers=len(self._pids))
+        for pid in self._pids:
+            self._kill(pid, signal.SIGTERM)
+        # uvicorn's own drain timeout, then time for the shutdown hooks to flush
+        deadline = time.monotonic() + self.drain_timeout + 10
+        while self._pids and time.monotonic() < deadline:
+            self._reap()
+            time.sleep(0.1)
+        for pid in self._pids:
+            logger.error("Worker didn't drain in time", worker=self._pids[pid], pid=pid)
+            self._kill(pid, signal.SIGKILL)
+        while self._pids:
+            pid, _ = os.waitpid(-1, 0)
+            self._pids.pop(pid, None)
+        logger.info("Workers stopped")
+
+    def _kill(self, pid: int, signum: int) -> None:
+        try:
+            os.kill(pid, signum)
+        except ProcessLookupError:
+            pass
+
+def main(argv: list[str] | None = None) -> None:
+    """Prepare the application once, then serve it from pre-forked workers."""
+    settings = get_settings()
+    parser = argparse.ArgumentParser(description="Serve the application from pre-forked workers.")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=settings.SERVE_WORKERS, help="Processes, 0 uses one per core")
+    args = parser.parse_args(argv)
+    size = args.workers or os.cpu_count() or 1
+
+    # Imports, logging, tables and agent metadata, once for every worker
+    from app.main import app, prepare
+    from app.agents.registry import AgentRegistry
+    from app.db.core import dispose_engine
+    prepare()
+    if settings.SERVE_PRELOAD_AGENTS:
+        AgentRegistry.preload()
+    # Workers open their own connections, a pooled one can't be shared across fork
+    asyncio.run(dispose_engine())
+
+    config = uvicorn.Config(
+        app,
+        host=args.host,
+        port=args.port,
+        timeout_graceful_shutdown=settings.SERVE_DRAIN_TIMEOUT,
+        proxy_headers=True,
+        forwarded_allow_ips="*"
+    )
+    sock = config.bind_socket()
+    workers.worker_table = workers.WorkerTable(size)
+
+    # Objects loaded so far are never collected, so the collector doesn't
+    # touch, and copy, the pages they share with the workers
+    gc.collect()
+    gc.freeze()
+    Supervisor(config, sock, workers.worker_table).run()
+
+if __name__ == "__main__":
+    main()
@@ -1 +1,6 @@
-"""Tools module for PydanticAI agent tools.""" 
\ No newline at end of file
+"""Tools module for PydanticAI agent tools."""
+
+from app.tools.cache import ToolCache, ToolCacheStats
+from app.tools.registry import ToolRegistry, ToolSpec, tool, tool_registry
+
+__all__ = ["ToolCache", "ToolCacheStats", "ToolRegistry", "ToolSpec", "tool", "tool_registry"]
@@ -0,0 +1,72 @@
+"""Memo cache of pure tool results."""
+
+import json
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Hashable
+
+@dataclass
+class ToolCacheStats:
+    """Counters for the tool cache."""
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    expirations: int = 0
+
+def cache_key(tool_name: str, args: tuple, kwargs: dict[str, Any]) -> Hashable | None:
+    """Key a call on its tool and arguments, None when they can't be serialized."""
+    try:
+        return tool_name, json.dumps([args, kwargs], sort_keys=True, separators=(",", ":"))
+    except (TypeError, ValueError):
+        return None
+
+class ToolCache:
+    """
+    Bounded LRU cache of tool results with TTL expiry, shared by all
+    agents in the process. Only tools declared pure and cacheable are
+    stored, so a hit returns what running the tool again would.
+    """
+
+    def __init__(self, max_entries: int, ttl: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.stats = ToolCacheStats()
+        self._entries: OrderedDict[Hashable, tuple[Any, float]] = OrderedDict()
+
+    @property
+    def enabled(self) -> bool:
+        """Whether the cache stores anything at all."""
+        return self.max_entries > 0 and self.ttl > 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Hashable) -> tuple[bool, Any]:
+        """Get (found, result) for a call."""
+        entry = self._entries.get(key)
+        if entry is not None and entry[1] <= time.monotonic():
+            del self._entries[key]
+            self.stats.expirations += 1
+            entry = None
+        if entry is None:
+            self.stats.misses += 1
+            return False, None
+
+        self._entries.move_to_end(key)
+        self.stats.hits += 1
+        return True, entry[0]
+
+    def put(self, key: Hashable, result: Any) -> None:
+        """Store a call's result."""
+        if not self.enabled:
+            return
+        self._entries[key] = (result, time.monotonic() + self.ttl)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.stats.evictions += 1
+
+    def clear(self) -> None:
+        """Drop all results from the cache."""
+        self._entries.clear()
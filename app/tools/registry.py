@@ -0,0 +1,170 @@
+"""Tool registry and execution: thread pool, timeouts and memoization."""
+
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from functools import partial, wraps
+from inspect import iscoroutinefunction
+from typing import Any, Callable, Iterable
+from pydantic_ai import ModelRetry, RunContext, Tool
+from app.config import get_settings
+from app.logs import get_logger
+from app.metrics import Counter, Gauge, Histogram
+from app.tools.cache import ToolCache, cache_key
+
+logger = get_logger(__name__)
+
+tool_calls = Counter(
+    "tool_calls_total", "Tool calls, by outcome", ["tool", "outcome"]
+)
+tool_run_seconds = Histogram(
+    "tool_run_seconds", "Duration of tool executions, cache hits excluded", ["tool"]
+)
+
+@dataclass
+class ToolSpec:
+    """A registered tool and how it may be run."""
+    name: str
+    function: Callable[..., Any]
+    pure: bool = False  # Same arguments, same result, no side effects
+    cacheable: bool = True  # Whether a pure tool's results are memoized
+    blocking: bool = True  # Whether a sync tool runs in the thread pool rather than inline
+    timeout: float | None = None  # Seconds, TOOL_TIMEOUT when None
+    max_retries: int | None = None
+
+    @property
+    def memoized(self) -> bool:
+        return self.pure and self.cacheable
+
+class ToolRegistry:
+    """
+    Tools by name, handed to agents as pydantic-ai tools.
+    pydantic-ai already runs the tool calls of one model response
+    concurrently, as tasks, so each call here only has to stay off the
+    event loop: sync tools run in a shared thread pool, every call is
+    bounded by its timeout, and results of pure tools are memoized.
+    """
+
+    def __init__(self, cache: ToolCache, threads: int, timeout: float):
+        self.cache = cache
+        self.threads = threads
+        self.timeout = timeout
+        self._specs: dict[str, ToolSpec] = {}
+        self._executor: ThreadPoolExecutor | None = None
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._specs
+
+    def register(self, spec: ToolSpec) -> None:
+        """Register a tool, replacing any tool of the same name."""
+        self._specs[spec.name] = spec
+
+    def get(self, name: str) -> ToolSpec:
+        """Get a tool by name."""
+        if name not in self._specs:
+            raise ValueError(f"Unknown tool: {name}")
+        return self._specs[name]
+
+    def tools(self, names: Iterable[str]) -> list[Tool]:
+        """Get pydantic-ai tools for `Agent(tools=...)` that run through this registry."""
+        tools = []
+        for name in names:
+            spec = self.get(name)
+            tools.append(Tool(self._wrap(spec), name=spec.name, max_retries=spec.max_retries))
+        return tools
+
+    def shutdown(self) -> None:
+        """Stop the thread pool, waiting for running tools. Call this at shutdown."""
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+
+    async def call(self, spec: ToolSpec, args: tuple, kwargs: dict[str, Any]) -> Any:
+        """Run a tool call, from the cache when the tool is pure."""
+        key = None
+        if spec.memoized:
+            # The run context isn't part of a pure tool's input
+            key = cache_key(spec.name, tuple(a for a in args if not isinstance(a, RunContext)), kwargs)
+            if key is not None:
+                found, result = self.cache.get(key)
+                if found:
+                    tool_calls.inc(tool=spec.name, outcome="cached")
+                    return result
+
+        timeout = spec.timeout if spec.timeout is not None else self.timeout
+        start = time.perf_counter()
+        try:
+            result = await asyncio.wait_for(self._run(spec, args, kwargs), timeout or None)
+        except asyncio.TimeoutError:
+            # A sync tool keeps its thread until it returns, its result is dropped
+            tool_calls.inc(tool=spec.name, outcome="timeout")
+            logger.warn("Tool timed out", tool=spec.name, timeout=timeout)
+            raise ModelRetry(f"Tool {spec.name} timed out after {timeout} seconds")
+        except Exception:
+            tool_calls.inc(tool=spec.name, outcome="error")
+            raise
+        finally:
+            tool_run_seconds.observe(time.perf_counter() - start, tool=spec.name)
+
+        tool_calls.inc(tool=spec.name, outcome="ok")
+        if key is not None:
+            self.cache.put(key, result)
+        return result
+
+    async def _run(self, spec: ToolSpec, args: tuple, kwargs: dict[str, Any]) -> Any:
+        if iscoroutinefunction(spec.function):
+            return await spec.function(*args, **kwargs)
+        if not spec.blocking:
+            return spec.function(*args, **kwargs)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._get_executor(), partial(spec.function, *args, **kwargs))
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.threads, thread_name_prefix="tool")
+        return self._executor
+
+    def _wrap(self, spec: ToolSpec) -> Callable[..., Any]:
+        # pydantic-ai reads the schema through __wrapped__, and awaits async tools itself
+        @wraps(spec.function)
+        async def run(*args, **kwargs):
+            return await self.call(spec, args, kwargs)
+        return run
+
+settings = get_settings()
+tool_registry = ToolRegistry(
+    cache=ToolCache(max_entries=settings.TOOL_CACHE_SIZE, ttl=settings.TOOL_CACHE_TTL),
+    threads=settings.TOOL_THREADS,
+    timeout=settings.TOOL_TIMEOUT
+)
+Counter(
+    "tool_cache_hits_total", "Tool cache hits",
+    callback=lambda: tool_registry.cache.stats.hits
+)
+Counter(
+    "tool_cache_misses_total", "Tool cache misses",
+    callback=lambda: tool_registry.cache.stats.misses
+)
+Gauge(
+    "tool_cache_entries", "Results in the tool cache",
+    callback=lambda: len(tool_registry.cache)
+)
+
+def tool(
+    name: str | None = None, *, pure: bool = False, cacheable: bool = True, blocking: bool = True,
+    timeout: float | None = None, max_retries: int | None = None
+) -> Callable[[Callable[..., Any]], Callable[..., Any]]:
+    """Register a function as a tool, the function itself is returned unchanged."""
+    def register(function: Callable[..., Any]) -> Callable[..., Any]:
+        tool_registry.register(ToolSpec(
+            name=name or function.__name__,
+            function=function,
+            pure=pure,
+            cacheable=cacheable,
+            blocking=blocking,
+            timeout=timeout,
+            max_retries=max_retries
+        ))
+        return function
+    return register
@@ -0,0 +1,81 @@
+"""State shared between the pre-forked workers of app.serve and their parent."""
+
+import asyncio
+import multiprocessing
+import os
+import time
+from app.config import get_settings
+from app.logs import get_logger
+
+logger = get_logger(__name__)
+
+class WorkerTable:
+    """
+    Pid, start time and last heartbeat of each worker slot, in shared
+    memory the parent creates before forking, so the parent and every
+    worker see all of them. A slot's pid and start time are written by
+    the parent when it forks the worker, its heartbeat by the worker.
+    """
+    FIELDS = 3  # pid, started, heartbeat
+
+    def __init__(self, size: int):
+        self.size = size
+        self._values = multiprocessing.RawArray("d", size * self.FIELDS)
+
+    def started(self, slot: int, pid: int) -> None:
+        """Record a newly forked worker, its heartbeat counts from now."""
+        now = time.time()
+        offset = slot * self.FIELDS
+        self._values[offset:offset + self.FIELDS] = [pid, now, now]
+
+    def beat(self, slot: int) -> None:
+        self._values[slot * self.FIELDS + 2] = time.time()
+
+    def silent_for(self, slot: int) -> float:
+        """Seconds since the worker's last heartbeat."""
+        return time.time() - self._values[slot * self.FIELDS + 2]
+
+    def snapshot(self) -> list[dict]:
+        """Every slot's worker, as reported by /health."""
+        now = time.time()
+        workers = []
+        for slot in range(self.size):
+            pid, started, heartbeat = self._values[slot * self.FIELDS:(slot + 1) * self.FIELDS]
+            workers.append({
+                "worker": slot,
+                "pid": int(pid),
+                "uptime": round(now - started, 3) if started else 0,
+                "heartbeat_age": round(now - heartbeat, 3) if heartbeat else None
+            })
+        return workers
+
+# Set by app.serve: the table before forking, the slot in each worker
+worker_table: WorkerTable | None = None
+worker_slot: int | None = None
+
+_heartbeat: asyncio.Task | None = None
+
+async def heartbeat(interval: float) -> None:
+    """Report the event loop as responsive every `interval` seconds, until cancelled."""
+    while True:
+        worker_table.beat(worker_slot)
+        await asyncio.sleep(interval)
+
+def start_heartbeat() -> None:
+    """Start reporting to the parent, when running as a pre-forked worker."""
+    global _heartbeat
+    if worker_table is not None and worker_slot is not None and _heartbeat is None:
+        _heartbeat = asyncio.create_task(heartbeat(get_settings().SERVE_HEARTBEAT_INTERVAL))
+        logger.info("Worker started", worker=worker_slot, pid=os.getpid())
+
+async def stop_heartbeat() -> None:
+    """Stop reporting to the parent."""
+    global _heartbeat
+    if _heartbeat is None:
+        return
+    _heartbeat.cancel()
+    try:
+        await _heartbeat
+    except asyncio.CancelledError:
+        pass
+    _heartbeat = None
@@ -0,0 +1,275 @@
+"""
+End-to-end chat benchmark with a fake model, no network needed.
+
+Seeds threads of the requested lengths, then runs chat turns through
+`ChatAgent.chat` (or POST /chat/message over httpx's ASGI transport) at each
+concurrency level. The model is a pydantic-ai FunctionModel with artificial
+latency that can call the roll_dice tool. Per-stage latencies (history
+load, model call, persistence) and throughput are written as JSON.
+
+    python -m bench.chat --lengths 10 1000 10000 --concurrency 1 8 32 -o bench.json
+"""
+
+import os
+
+# Keep benchmark runs local and quiet, before logfire is configured on import
+os.environ.setdefault("LOGFIRE_SEND_TO_LOGFIRE", "false")
+os.environ.setdefault("LOGFIRE_CONSOLE", "false")
+
+import argparse
+import asyncio
+import json
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from datetime import datetime, timezone
+from functools import wraps
+import httpx
+from sqlalchemy.engine import make_url
+from sqlmodel import Session
+from pydantic_ai.messages import (
+    ModelMessage, ModelRequest, ModelResponse,
+    SystemPromptPart, UserPromptPart, ToolCallPart
+)
+from pydantic_ai.models.function import FunctionModel, AgentInfo
+from app.main import app
+from app.db.core import init_engine, dispose_engine, create_db_and_tables, get_engine
+from app.agents.chat import ChatAgent, ChatRequest
+from app.agents.history import get_or_create_thread
+from app.agents.history_cache import history_cache
+from app.agents.persistence import save_turns
+from app.agents.registry import AgentRegistry
+from impl.full.agent import FullAgent
+
+AGENT_ID = "full"
+STAGES = {
+    "history_load": "_get_history",
+    "model_call": "_process_chat",
+    "persistence": "_persist_turn",
+}
+SEED_CHUNK = 1000  # Messages per seeding insert
+
+class FakeModel:
+    """FunctionModel behaviour: replies after a delay, calling roll_dice on every `tool_every`th turn."""
+
+    def __init__(self, latency_ms: float, jitter_ms: float, tool_every: int, response_chars: int):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.tool_every = tool_every
+        self.response_chars = response_chars
+        self.turns = 0
+
+    async def respond(self, messages: list[ModelMessage], info: AgentInfo) -> ModelResponse:
+        delay = self.latency_ms + random.uniform(-self.jitter_ms, self.jitter_ms)
+        await asyncio.sleep(max(delay, 0) / 1000)
+
+        last_part = messages[-1].parts[-1]
+        if isinstance(last_part, UserPromptPart):
+            self.turns += 1
+            if self.tool_every and self.turns % self.tool_every == 0:
+                return ModelResponse(parts=[ToolCallPart.from_raw_args("roll_dice", {"dice_type": "d6"})])
+        return ModelResponse.from_text("x" * self.response_chars)
+
+class StageTimer:
+    """Records how long each instrumented ChatAgent method takes."""
+
+    def __init__(self):
+        self.samples: dict[str, list[float]] = defaultdict(list)
+
+    def wrap(self, agent: ChatAgent) -> None:
+        """Time the agent's stage methods on this instance."""
+        for stage, method_name in STAGES.items():
+            setattr(agent, method_name, self._timed(stage, getattr(agent, method_name)))
+
+    def _timed(self, stage: str, method):
+        @wraps(method)
+        async def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return await method(*args, **kwargs)
+            finally:
+                self.samples[stage].append(time.perf_counter() - start)
+        return timed
+
+    def reset(self) -> None:
+        """Drop the samples of the previous scenario."""
+        self.samples.clear()
+
+def summarize(samples: list[float]) -> dict[str, float] | None:
+    """Latency percentiles of a list of durations in seconds, in milliseconds."""
+    if not samples:
+        return None
+    ms = sorted(s * 1000 for s in samples)
+    if len(ms) == 1:
+        p50 = p95 = p99 = ms[0]
+    else:
+        cuts = statistics.quantiles(ms, n=100, method="inclusive")
+        p50, p95, p99 = cuts[49], cuts[94], cuts[98]
+    return {
+        "count": len(ms),
+        "mean": round(statistics.fmean(ms), 3),
+        "p50": round(p50, 3),
+        "p95": round(p95, 3),
+        "p99": round(p99, 3),
+        "max": round(ms[-1], 3),
+    }
+
+def seed_thread(session: Session, user_id: str, length: int) -> None:
+    """Give a user's thread `length` messages of alternating prompts and replies."""
+    thread = get_or_create_thread(session, user_id, AGENT_ID)
+    messages: list[ModelMessage] = []
+    for i in range(length):
+        if i % 2:
+            messages.append(ModelResponse.from_text(f"Reply {i // 2}"))
+        else:
+            parts = [UserPromptPart(content=f"Prompt {i // 2}")]
+            if i == 0:
+                parts.insert(0, SystemPromptPart(content="You are a helpful assistant."))
+            messages.append(ModelRequest(parts=parts))
+    for start in range(0, length, SEED_CHUNK):
+        save_turns(session, [(thread.id, messages[start:start + SEED_CHUNK])])
+    session.commit()
+
+async def run_scenario(
+    mode: str, client: httpx.AsyncClient, agent: ChatAgent, timer: StageTimer,
+    users: list[str], requests: int, concurrency: int
+) -> dict:
+    """Send `requests` turns over the users' threads with `concurrency` in flight."""
+    latencies: list[float] = []
+    errors: list[str] = []
+    next_request = iter(range(requests))
+
+    async def send(request: ChatRequest) -> str | None:
+        if mode == "http":
+            response = await client.post("/chat/message", json=request.model_dump())
+            if response.status_code != 200:
+                return f"HTTP {response.status_code}"
+            return response.json()["response"]["error"]
+        return (await agent.chat(request)).error
+
+    async def worker() -> None:
+        for i in next_request:
+            request = ChatRequest(content=f"Benchmark turn {i}", agent_id=AGENT_ID, user_id=users[i % len(users)])
+            start = time.perf_counter()
+            error = await send(request)
+            latencies.append(time.perf_counter() - start)
+            if error:
+                errors.append(error)
+
+    timer.reset()
+    start = time.perf_counter()
+    await asyncio.gather(*[worker() for _ in range(concurrency)])
+    wall = time.perf_counter() - start
+
+    return {
+        "requests": requests,
+        "errors": len(errors),
+        "error_messages": sorted(set(errors))[:5],
+        "wall_seconds": round(wall, 3),
+        "throughput_rps": round(requests / wall, 2),
+        "latency_ms": {
+            "total": summarize(latencies),
+            **{stage: summarize(timer.samples[stage]) for stage in STAGES},
+        },
+    }
+
+def git_commit() -> str | None:
+    """Get the commit being benchmarked."""
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+async def main(argv: list[str] | None = None) -> None:
+    """Run the benchmark matrix and write the results as JSON."""
+    parser = argparse.ArgumentParser(description="Offline end-to-end chat benchmark.")
+    parser.add_argument("--database-url", help="Database to run against, a fresh SQLite file by default")
+    parser.add_argument("--mode", choices=["agent", "http", "both"], default="both",
+                        help="Call ChatAgent.chat directly, go through the FastAPI app, or both")
+    parser.add_argument("--lengths", type=int, nargs="+", default=[10, 100, 1000, 10000],
+                        help="Thread lengths in messages")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--requests", type=int, default=50, help="Turns per scenario")
+    parser.add_argument("--latency-ms", type=float, default=50, help="Fake model latency per call")
+    parser.add_argument("--jitter-ms", type=float, default=10)
+    parser.add_argument("--tool-every", type=int, default=5, help="Call roll_dice every Nth turn, 0 never")
+    parser.add_argument("--response-chars", type=int, default=200)
+    parser.add_argument("--history-cache", action="store_true",
+                        help="Keep the history cache on, so history load is measured warm")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("-o", "--output", help="File to write JSON results to, stdout by default")
+    args = parser.parse_args(argv)
+
+    random.seed(args.seed)
+    tmpdir = None
+    database_url = args.database_url
+    if database_url is None:
+        tmpdir = tempfile.TemporaryDirectory()
+        database_url = f"sqlite:///{tmpdir.name}/bench.db"
+
+    init_engine(database_url)
+    create_db_and_tables()
+    if not args.history_cache:
+        history_cache.max_entries = 0
+    history_cache.clear()
+
+    # The full agent with no context window, so thread lengths stay as seeded
+    fake = FakeModel(args.latency_ms, args.jitter_ms, args.tool_every, args.response_chars)
+    agent = FullAgent()
+    agent.configure({"id": AGENT_ID})
+    agent.agent.model = FunctionModel(fake.respond)
+    timer = StageTimer()
+    timer.wrap(agent)
+    AgentRegistry.register(AGENT_ID, agent)
+
+    run_id = datetime.now(timezone.utc).strftime("%Y%m%d%H%M%S")
+    modes = ["agent", "http"] if args.mode == "both" else [args.mode]
+    scenarios = []
+    try:
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+            for length in args.lengths:
+                for concurrency in args.concurrency:
+                    for mode in modes:
+                        # One thread per worker, seeded fresh for each scenario
+                        users = [f"bench-{run_id}-{mode}-{length}-{concurrency}-{i}" for i in range(concurrency)]
+                        with Session(get_engine()) as session:
+                            for user_id in users:
+                                seed_thread(session, user_id, length)
+                        result = await run_scenario(mode, client, agent, timer, users, args.requests, concurrency)
+                        scenarios.append({"mode": mode, "thread_length": length, "concurrency": concurrency, **result})
+                        print(
+                            f"{mode:5} length={length:<6} concurrency={concurrency:<4} "
+                            f"{result['throughput_rps']:>8} req/s  p95={result['latency_ms']['total']['p95']} ms  errors={result['errors']}",
+                            file=sys.stderr
+                        )
+    finally:
+        await dispose_engine()
+        if tmpdir is not None:
+            tmpdir.cleanup()
+
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "started_at": run_id,
+            "python": platform.python_version(),
+            "database": make_url(database_url).get_backend_name(),
+            "options": {k: v for k, v in vars(args).items() if k not in ("output", "database_url")},
+        },
+        "scenarios": scenarios,
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+if __name__ == "__main__":
+    asyncio.run(main())
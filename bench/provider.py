@@ -0,0 +1,145 @@
+"""
+Stub model provider speaking the OpenAI/Groq chat-completions protocol.
+
+Replies with a fixed text after a configurable delay, streamed or not, and
+counts the client connections it has seen at GET /stats, so connection
+reuse of the shared model client can be checked without network access.
+Injected failures (500s) and slow replies make it a stand-in for an
+unhealthy upstream, e.g. behind one model of an agent's routing chain.
+
+    python -m bench.provider --port 8001 --latency-ms 200
+    python -m bench.provider --port 8002 --failure-rate 0.3 --slow-rate 0.1 --slow-ms 5000
+    GROQ_BASE_URL=http://127.0.0.1:8001 uvicorn app.main:app
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import time
+import uuid
+from typing import AsyncIterator
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+import uvicorn
+
+API_PATH = "/openai/v1"
+
+class StubProvider:
+    """Settings and counters of the stub server."""
+
+    def __init__(
+        self, latency_ms: float = 0, reply: str = "Hello from the stub provider.",
+        failure_rate: float = 0, slow_rate: float = 0, slow_ms: float = 0
+    ):
+        self.latency_ms = latency_ms
+        self.reply = reply
+        self.failure_rate = failure_rate
+        self.slow_rate = slow_rate
+        self.slow_ms = slow_ms
+        self.requests = 0
+        self.failures = 0
+        self.peers: set[tuple[str, int]] = set()
+
+    def seen(self, request: Request) -> None:
+        self.requests += 1
+        if request.client is not None:
+            self.peers.add((request.client.host, request.client.port))
+
+    def usage(self, messages: list[dict]) -> dict:
+        # Whitespace-separated words are close enough to tokens for a stub
+        prompt = sum(len(str(m.get("content") or "").split()) for m in messages)
+        completion = len(self.reply.split())
+        return {"prompt_tokens": prompt, "completion_tokens": completion, "total_tokens": prompt + completion}
+
+def create_app(stub: StubProvider) -> FastAPI:
+    """Build the stub server's app."""
+    app = FastAPI()
+
+    @app.get(API_PATH + "/models")
+    async def list_models(request: Request) -> dict:
+        stub.seen(request)
+        return {"object": "list", "data": [{"id": "stub", "object": "model", "created": 0, "owned_by": "stub"}]}
+
+    @app.post(API_PATH + "/chat/completions")
+    async def chat_completions(request: Request):
+        stub.seen(request)
+        body = await request.json()
+        slow = random.random() < stub.slow_rate
+        await asyncio.sleep((stub.slow_ms if slow else stub.latency_ms) / 1000)
+        if random.random() < stub.failure_rate:
+            stub.failures += 1
+            return JSONResponse(
+                {"error": {"message": "Injected failure", "type": "internal_server_error"}}, status_code=500
+            )
+        completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+        created = int(time.time())
+        model = body.get("model", "stub")
+        usage = stub.usage(body.get("messages", []))
+
+        if not body.get("stream"):
+            return {
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": created,
+                "model": model,
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": stub.reply},
+                    "finish_reason": "stop",
+                }],
+                "usage": usage,
+            }
+
+        async def chunks() -> AsyncIterator[str]:
+            words = stub.reply.split(" ")
+            for index, word in enumerate(words):
+                chunk = {
+                    "id": completion_id,
+                    "object": "chat.completion.chunk",
+                    "created": created,
+                    "model": model,
+                    "choices": [{
+                        "index": 0,
+                        "delta": {"role": "assistant", "content": word if index == 0 else " " + word},
+                        "finish_reason": None,
+                    }],
+                }
+                yield f"data: {json.dumps(chunk)}\n\n"
+            # Groq reports usage on the last chunk
+            last = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}],
+                "x_groq": {"id": completion_id, "usage": usage},
+            }
+            yield f"data: {json.dumps(last)}\n\n"
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(chunks(), media_type="text/event-stream")
+
+    @app.get("/stats")
+    async def stats() -> dict:
+        return {"requests": stub.requests, "failures": stub.failures, "connections": len(stub.peers)}
+
+    return app
+
+def main(argv: list[str] | None = None) -> None:
+    """Serve the stub provider."""
+    parser = argparse.ArgumentParser(description="Serve a stub OpenAI/Groq chat-completions API.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--latency-ms", type=float, default=0, help="Delay before each reply")
+    parser.add_argument("--reply", default="Hello from the stub provider.", help="Text of every reply")
+    parser.add_argument("--failure-rate", type=float, default=0, help="Fraction of chat requests answered with a 500")
+    parser.add_argument("--slow-rate", type=float, default=0, help="Fraction of chat requests delayed by --slow-ms instead")
+    parser.add_argument("--slow-ms", type=float, default=0, help="Delay of slow replies")
+    args = parser.parse_args(argv)
+
+    stub = StubProvider(args.latency_ms, args.reply, args.failure_rate, args.slow_rate, args.slow_ms)
+    uvicorn.run(create_app(stub), host=args.host, port=args.port)
+
+if __name__ == "__main__":
+    main()
@@ -1,30 +1,64 @@
 """Basic chat agent implementation."""
 
-import logfire
+from typing import AsyncIterator
 from pydantic_ai import Agent
-from pydantic_ai.models.groq import GroqModel
-from app.agents.chat import ChatAgent, ChatRequest, ChatResponse
-from app.config import get_settings
+from app.agents.chat import ChatAgent, ChatRequest, ChatResponse, ChatEvent
+from app.agents.concurrency import Overloaded, admit
+from app.agents.sessions import ThreadState
+from app.agents.telemetry import turn, stage, record_usage
+from app.agents.write_behind import TurnWriter
+from app.agents.providers import model_clients
+from app.logs import get_logger
+
+logger = get_logger(__name__)
 
 class BasicAgent(ChatAgent):
-    """A basic chat agent."""
+    """A basic chat agent, each message is answered on its own, without history."""
     
     def __init__(self):
-        settings = get_settings()
-        self.model = GroqModel(
-            model_name="llama-3.3-70b-versatile",
-            api_key=settings.GROQ_API_KEY
-        )
+        self.model = model_clients.groq_model("llama-3.3-70b-versatile")
         self.agent = Agent(
             model=self.model,
             system_prompt="You are a helpful assistant."
         )
     
-    async def chat(self, request: ChatRequest) -> ChatResponse:
-        """Process a chat request."""
-        try:
-            response = await self.agent.run(request.content)
-            return ChatResponse(content=response.data)
-        except Exception as e:
-            logfire.error("Failed to process message", error=str(e))
-            return ChatResponse(content="", error=str(e)) 
\ No newline at end of file
+    async def chat(self, request: ChatRequest, writer: TurnWriter | None = None) -> ChatResponse:
+        """Process a chat request, nothing is saved so `writer` is unused."""
+        with turn(request.agent_id, "chat") as labels:
+            try:
+                async with admit(self.limiter):
+                    with stage(request.agent_id, "model"):
+                        response = await self.agent.run(request.content)
+                record_usage(request.agent_id, response.usage())
+                return ChatResponse(content=response.data)
+            except Overloaded:
+                labels["outcome"] = "rejected"
+                raise
+            except Exception as e:
+                labels["outcome"] = "error"
+                logger.error("Failed to process message", error=str(e))
+                return ChatResponse(content="", error=str(e))
+    
+    async def chat_stream(self, request: ChatRequest, state: ThreadState | None = None) -> AsyncIterator[ChatEvent]:
+        """Process a chat request as a stream, like `chat` nothing is loaded or saved, so `state` is unused."""
+        with turn(request.agent_id, "stream") as labels:
+            try:
+                async with admit(self.limiter):
+                    with stage(request.agent_id, "model"):
+                        async with self.agent.run_stream(request.content) as result:
+                            streamed = ""
+                            async for text in result.stream_text():
+                                yield ChatEvent(event="text", content=text[len(streamed):])
+                                streamed = text
+                record_usage(request.agent_id, result.usage())
+                yield ChatEvent(event="done")
+            except Overloaded:
+                labels["outcome"] = "rejected"
+                raise
+            except Exception as e:
+                labels["outcome"] = "error"
+                logger.error("Failed to stream message", error=str(e))
+                yield ChatEvent(event="error", error=str(e))
+    
+    async def open_thread(self, state: ThreadState) -> None:
+        """Nothing to load, sessions with this agent have no thread."""
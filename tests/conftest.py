@@ -0,0 +1,77 @@
+import asyncio
+import pytest
+from pydantic_ai.messages import ModelResponse, UserPromptPart
+from pydantic_ai.models.function import FunctionModel
+from sqlmodel import Session, SQLModel, create_engine
+from app import models  # noqa: F401
+from app.db.core import create_db_and_tables, dispose_engine, get_async_engine, get_engine, init_engine
+from app.models.thread import Thread
+from app.agents.history_cache import history_cache
+from app.agents.idempotency import chat_results
+from app.agents.registry import AgentRegistry
+from impl.full.agent import FullAgent
+
+@pytest.fixture
+def session(tmp_path):
+    """A session on a fresh SQLite database holding one thread."""
+    engine = create_engine(f"sqlite:///{tmp_path / 'test.db'}")
+    SQLModel.metadata.create_all(engine)
+    with Session(engine) as session:
+        session.add(Thread(user_id="user", persona_id="full", name="Test"))
+        session.commit()
+        yield session
+    engine.dispose()
+
+@pytest.fixture
+def database(tmp_path):
+    """The process-wide engines on a fresh SQLite database."""
+    init_engine(f"sqlite:///{tmp_path / 'app.db'}")
+    create_db_and_tables()
+    yield get_engine()
+    history_cache.clear()
+    chat_results.clear()
+    asyncio.run(dispose_engine())
+
+@pytest.fixture
+def run(database):
+    """Run a coroutine on a new event loop, closing the async connections it opened."""
+    def run(coro):
+        async def main():
+            try:
+                return await coro
+            finally:
+                await get_async_engine().dispose()
+        return asyncio.run(main())
+    return run
+
+def last_prompt(messages) -> str:
+    return [part.content for message in messages for part in message.parts if isinstance(part, UserPromptPart)][-1]
+
+async def echo(messages, info) -> ModelResponse:
+    return ModelResponse.from_text(f"echo: {last_prompt(messages)}")
+
+@pytest.fixture
+def agent(database):
+    """The full agent on a FunctionModel echoing the last prompt, registered as "full"."""
+    agent = FullAgent()
+    agent.configure({"id": "full"})
+    agent.agent.model = FunctionModel(echo)
+    AgentRegistry.register("full", agent)
+    yield agent
+    AgentRegistry._agents.pop("full", None)
+    AgentRegistry._pinned.discard("full")
+
+@pytest.fixture
+def client(agent):
+    """A test client of the API routers, without the app's startup."""
+    from fastapi import FastAPI
+    from fastapi.testclient import TestClient
+    from app.routers import chat, metrics, search, threads
+
+    app = FastAPI()
+    for module in (chat, metrics, search, threads):
+        app.include_router(module.router)
+    with TestClient(app) as client:
+        yield client
+        # Connections belong to the client's event loop
+        client.portal.call(get_async_engine().dispose)
@@ -0,0 +1,94 @@
+import asyncio
+from pydantic_ai.messages import ModelResponse
+from pydantic_ai.models.function import FunctionModel
+from sqlmodel import Session, select
+from app.config import get_settings
+from app.agents import batch
+from app.agents.batch import run_batch, read_requests
+from app.agents.chat import ChatRequest
+from app.agents.history import load_history
+from app.models.thread import Thread
+from conftest import last_prompt
+
+def request(user_id: str, content: str) -> ChatRequest:
+    return ChatRequest(content=content, agent_id="full", user_id=user_id)
+
+def history(engine, user_id: str) -> list[str]:
+    with Session(engine) as session:
+        thread = session.exec(select(Thread).where(Thread.user_id == user_id)).one()
+        return [part.content for message in load_history(session, thread.id) for part in message.parts]
+
+async def collect(requests, concurrency=None):
+    return [result async for result in run_batch(requests, concurrency)]
+
+def test_thread_order(agent, database, run, monkeypatch):
+    monkeypatch.setattr(get_settings(), "BATCH_WRITE_SIZE", 100)
+    seen = []
+
+    async def respond(messages, info):
+        seen.append((last_prompt(messages), len(messages)))
+        await asyncio.sleep(0.01)
+        return ModelResponse.from_text(f"answer to {last_prompt(messages)}")
+
+    agent.agent.model = FunctionModel(respond)
+    requests = [request("ann", "a1"), request("bob", "b1"), request("ann", "a2"), request("ann", "a3")]
+    results = run(collect(requests, concurrency=4))
+
+    assert sorted(result.index for result in results) == [0, 1, 2, 3]
+    assert all(result.response.error is None for result in results)
+    ann = [result.index for result in results if requests[result.index].user_id == "ann"]
+    assert ann == [0, 2, 3]
+    # Each turn of a thread saw the ones before it
+    assert [count for prompt, count in seen if prompt.startswith("a")] == [1, 3, 5]
+    assert history(database, "ann")[-2:] == ["a3", "answer to a3"]
+
+def test_turns_written_in_shared_commits(agent, database, run, monkeypatch):
+    monkeypatch.setattr(get_settings(), "BATCH_WRITE_SIZE", 2)
+    calls = []
+    save_turns = batch.save_turns
+    monkeypatch.setattr(batch, "save_turns", lambda session, turns: calls.append(len(turns)) or save_turns(session, turns))
+
+    results = run(collect([request(f"user-{i}", "hi") for i in range(5)]))
+    assert len(results) == 5
+    # Turns that arrive while a write is in flight join the next one
+    assert sum(calls) == 5
+    assert len(calls) < 5 and calls[0] >= 2
+    for i in range(5):
+        assert history(database, f"user-{i}")[-2:] == ["hi", "echo: hi"]
+
+def test_failed_write_reported_to_its_turns(agent, run, monkeypatch):
+    monkeypatch.setattr(get_settings(), "BATCH_WRITE_SIZE", 100)
+
+    def fail(session, turns):
+        raise RuntimeError("disk full")
+
+    monkeypatch.setattr(batch, "save_turns", fail)
+    results = run(collect([request("ann", "a1"), request("bob", "b1")]))
+    assert [result.response.error for result in results] == ["Failed to save the turn: disk full"] * 2
+    assert all(result.response.content.startswith("echo:") for result in results)
+
+def test_close_flushes_completed_turns(agent, database, run, monkeypatch):
+    monkeypatch.setattr(get_settings(), "BATCH_WRITE_SIZE", 100)
+
+    async def respond(messages, info):
+        if last_prompt(messages) == "slow":
+            await asyncio.sleep(10)
+        return ModelResponse.from_text("ok")
+
+    agent.agent.model = FunctionModel(respond)
+
+    async def main():
+        results = run_batch([request("ann", "a1"), request("bob", "slow"), request("ann", "a2")], concurrency=3)
+        # a2 reads ann's thread, which writes a1 and releases its result
+        first = await anext(results)
+        await asyncio.sleep(0.05)
+        await results.aclose()
+        return first
+
+    assert run(main()).index == 0
+    assert history(database, "ann")[-2:] == ["a2", "ok"]
+
+def test_read_requests():
+    entries = read_requests(['{"content": "hi", "agent_id": "full"}', "", "not json"])
+    assert isinstance(entries[0], ChatRequest)
+    assert isinstance(entries[1], str)
@@ -0,0 +1,65 @@
+from importlib.util import find_spec
+import pytest
+from pydantic_ai.messages import (
+    ModelRequest, ModelResponse, SystemPromptPart, TextPart, ToolCallPart, ToolReturnPart, UserPromptPart
+)
+from sqlmodel import select
+from app.agents.codec import PAYLOAD_VERSION, PayloadError, check_format, decode_messages, encode_message
+from app.agents.history import load_history
+from app.agents.migrate_payloads import migrate_batch
+from app.agents.persistence import save_turns
+from app.models.message import Message, MessagePart
+
+MESSAGES = [
+    ModelRequest(parts=[SystemPromptPart(content="You are a game master."), UserPromptPart(content="Roll a d20")]),
+    ModelResponse(parts=[ToolCallPart.from_raw_args("roll_dice", {"dice_type": "d20"}, "call-1")]),
+    ModelRequest(parts=[ToolReturnPart(tool_name="roll_dice", content="You rolled a 17", tool_call_id="call-1")]),
+    ModelResponse(parts=[TextPart(content="You rolled a 17. ✨")]),
+]
+
+def needs(*modules: str):
+    return pytest.mark.skipif(not all(map(find_spec, modules)), reason=f"needs {' and '.join(modules)}")
+
+FORMATS = [
+    "json",
+    pytest.param("json+zstd", marks=needs("zstandard")),
+    pytest.param("msgpack", marks=needs("msgpack")),
+    pytest.param("msgpack+zstd", marks=needs("msgpack", "zstandard")),
+]
+
+@pytest.mark.parametrize("payload_format", FORMATS)
+def test_round_trip(payload_format):
+    check_format(payload_format)
+    payloads = [encode_message(message, payload_format) for message in MESSAGES]
+    assert all(encoded_format == payload_format for _, encoded_format in payloads)
+    decoded = decode_messages((payload, encoded_format, PAYLOAD_VERSION) for payload, encoded_format in payloads)
+    assert decoded == MESSAGES
+
+def test_mixed_formats():
+    pytest.importorskip("msgpack")
+    payloads = [encode_message(message, "json" if i % 2 else "msgpack") for i, message in enumerate(MESSAGES)]
+    assert decode_messages((payload, encoded_format, PAYLOAD_VERSION) for payload, encoded_format in payloads) == MESSAGES
+
+def test_rejects_unknown_and_newer():
+    with pytest.raises(PayloadError):
+        check_format("xml")
+    with pytest.raises(PayloadError):
+        check_format("json+gzip")
+    payload, payload_format = encode_message(MESSAGES[0], "json")
+    with pytest.raises(PayloadError):
+        decode_messages([(payload, payload_format, PAYLOAD_VERSION + 1)])
+
+@pytest.mark.parametrize("keep_parts", [False, True])
+def test_migrate_part_rows(session, keep_parts):
+    save_turns(session, [(1, MESSAGES)])
+    session.commit()
+    before = load_history(session, 1)
+
+    assert migrate_batch(session, 0, 3, "json", keep_parts) == [1, 2, 3]
+    assert migrate_batch(session, 3, 3, "json", keep_parts) == [4]
+    assert migrate_batch(session, 4, 3, "json", keep_parts) == []
+    session.commit()
+
+    assert all(row.payload is not None for row in session.exec(select(Message)))
+    assert bool(session.exec(select(MessagePart)).all()) == keep_parts
+    assert load_history(session, 1) == before
@@ -0,0 +1,83 @@
+import asyncio
+import pytest
+from app.agents.concurrency import AdmissionLimiter, KeyedLocks, Overloaded
+
+def test_keyed_locks():
+    async def main():
+        locks = KeyedLocks()
+        order = []
+
+        async def hold(key, name):
+            async with locks.hold(key):
+                order.append(f"{name} in")
+                await asyncio.sleep(0.01)
+                order.append(f"{name} out")
+
+        await asyncio.gather(hold("a", "first"), hold("a", "second"), hold("b", "other"))
+        # One key's turns don't overlap, other keys don't wait for them
+        assert order.index("first out") < order.index("second in")
+        assert order.index("other in") < order.index("first out")
+        assert len(locks) == 0
+    asyncio.run(main())
+
+def test_admission():
+    async def main():
+        limiter = AdmissionLimiter("test", max_concurrent=1, max_queue=1, queue_timeout=5)
+        release = asyncio.Event()
+        order = []
+
+        async def call(name):
+            async with limiter.admit():
+                order.append(name)
+                await release.wait()
+
+        first = asyncio.create_task(call("first"))
+        second = asyncio.create_task(call("second"))
+        await asyncio.sleep(0)
+        assert limiter.in_flight == 1 and limiter.depth == 1
+        assert limiter.is_full()
+
+        with pytest.raises(Overloaded) as rejected:
+            await call("third")
+        assert rejected.value.status_code == 429
+
+        release.set()
+        await asyncio.gather(first, second)
+        assert order == ["first", "second"]
+        assert limiter.in_flight == 0
+        assert limiter.stats.admitted == 2 and limiter.stats.rejected == 1
+    asyncio.run(main())
+
+def test_queue_timeout():
+    async def main():
+        limiter = AdmissionLimiter("test", max_concurrent=1, max_queue=5, queue_timeout=0.05)
+        release = asyncio.Event()
+
+        async def hold():
+            async with limiter.admit():
+                await release.wait()
+
+        holder = asyncio.create_task(hold())
+        await asyncio.sleep(0)
+        with pytest.raises(Overloaded) as timed_out:
+            async with limiter.admit():
+                pass
+        assert timed_out.value.status_code == 503
+
+        # A cancelled waiter gives its place up without taking the slot
+        waiter = asyncio.create_task(hold())
+        await asyncio.sleep(0)
+        waiter.cancel()
+        release.set()
+        await holder
+        assert limiter.in_flight == 0 and limiter.depth == 0
+    asyncio.run(main())
+
+def test_rejected_over_http(agent, client):
+    agent.limiter = AdmissionLimiter("full", max_concurrent=1, max_queue=0, queue_timeout=1)
+    agent.limiter.in_flight = 1  # A call already holds the only slot
+    request = {"content": "hi", "agent_id": "full", "user_id": "busy"}
+    for path in ("/chat/message", "/chat/stream"):
+        response = client.post(path, json=request)
+        assert response.status_code == 429
+        assert response.headers["retry-after"] == "1"
@@ -0,0 +1,66 @@
+from pydantic_ai.messages import (
+    ModelRequest, ModelResponse, SystemPromptPart, TextPart, ToolCallPart, ToolReturnPart, UserPromptPart
+)
+from app.agents.context import (
+    ContextConfig, ContextWindow, checkpoint_message, is_turn_start
+)
+
+def turn(i: int, tool: bool = False) -> list:
+    """A user turn of about 25 tokens, or 50 with a tool call."""
+    messages = [ModelRequest(parts=[UserPromptPart(content=f"question {i} " + "x" * 60)])]
+    if tool:
+        messages += [
+            ModelResponse(parts=[ToolCallPart.from_raw_args("roll_dice", {"sides": 20}, f"call-{i}")]),
+            ModelRequest(parts=[ToolReturnPart(tool_name="roll_dice", content="x" * 60, tool_call_id=f"call-{i}")]),
+        ]
+    return messages + [ModelResponse(parts=[TextPart(content=f"answer {i} " + "x" * 60)])]
+
+def history(turns: int, system_prompt: str | None = "You are a game master.") -> list:
+    messages = [message for i in range(turns) for message in turn(i, tool=i % 2 == 0)]
+    if system_prompt:
+        messages[0] = ModelRequest(parts=[SystemPromptPart(content=system_prompt), *messages[0].parts])
+    return messages
+
+def test_under_budget_unchanged():
+    messages = history(2)
+    fit = ContextWindow(ContextConfig(max_tokens=10_000)).fit(messages)
+    assert fit.messages == messages
+    assert fit.dropped == []
+    assert fit.system_prompt == "You are a game master."
+
+def test_trims_whole_turns():
+    window = ContextWindow(ContextConfig(max_tokens=300, trim_to=200))
+    messages = history(10)
+    fit = window.fit(messages)
+    assert fit.dropped
+    # The system prompt leads, and the kept history starts on a user turn
+    assert fit.messages[0].parts == [SystemPromptPart(content="You are a game master.")]
+    assert is_turn_start(fit.messages[1])
+    assert is_turn_start(fit.dropped[0])
+    assert window.estimator.tokens(fit.messages) <= 200
+    assert len(fit.dropped) + len(fit.messages) - 1 == len(messages)
+
+def test_never_splits_tool_call():
+    window = ContextWindow(ContextConfig(max_tokens=100, trim_to=60))
+    for size in range(60, 200, 5):
+        window.trim_to = size
+        fit = window.fit(history(6, system_prompt=None))
+        kept = fit.messages
+        assert not kept or is_turn_start(kept[0])
+        for i, message in enumerate(kept):
+            if any(isinstance(part, ToolCallPart) for part in message.parts):
+                assert isinstance(kept[i + 1].parts[0], ToolReturnPart)
+
+def test_keeps_checkpoint_summary():
+    messages = [checkpoint_message("You are a game master.", "They rolled a 17."), *history(10, system_prompt=None)]
+    fit = ContextWindow(ContextConfig(max_tokens=300)).fit(messages)
+    assert fit.messages[0] == messages[0]
+    assert fit.summary == "They rolled a 17."
+    assert fit.system_prompt == "You are a game master."
+    assert is_turn_start(fit.messages[1])
+
+def test_last_turn_over_budget():
+    fit = ContextWindow(ContextConfig(max_tokens=10)).fit(history(2))
+    # Nothing fits, every turn is dropped but the head stays
+    assert len(fit.messages) == 1
+    assert is_turn_start(fit.dropped[0])
@@ -0,0 +1,75 @@
+from pydantic_ai.messages import ModelRequest, ModelResponse, TextPart, UserPromptPart
+from pydantic_ai.models.function import FunctionModel
+from sqlmodel import Session
+from app.agents.history import get_thread
+from app.agents.history_cache import HistoryCache, history_cache
+from app.agents.persistence import save_messages
+from conftest import echo
+
+def turn(prompt: str) -> list:
+    return [ModelRequest(parts=[UserPromptPart(content=prompt)]), ModelResponse(parts=[TextPart(content="ok")])]
+
+def test_lru_and_ttl(monkeypatch):
+    cache = HistoryCache(max_entries=2, ttl=10)
+    now = [100.0]
+    monkeypatch.setattr("app.agents.history_cache.time.monotonic", lambda: now[0])
+    cache.put(("a", "full"), 1, 1, turn("one"))
+    cache.put(("b", "full"), 2, 1, turn("two"))
+    assert cache.get(("a", "full")) is not None
+    cache.put(("c", "full"), 3, 1, turn("three"))
+    # "b" was least recently used
+    assert cache.get(("b", "full")) is None
+    assert cache.stats.evictions == 1
+
+    now[0] += 10
+    assert cache.get(("a", "full")) is None
+    assert cache.stats.expirations == 1
+
+def test_append_needs_previous_version():
+    cache = HistoryCache(max_entries=10, ttl=60)
+    cache.put(("a", "full"), 1, 1, turn("one"))
+    assert not cache.append(("a", "full"), 1, 3, turn("three"))
+    assert cache.append(("a", "full"), 1, 2, turn("two"))
+    entry = cache.get(("a", "full"))
+    assert entry.version == 2
+    assert len(entry.messages) == 4
+
+    # Callers get a copy
+    entry.messages.clear()
+    assert len(cache.get(("a", "full")).messages) == 4
+
+def test_turns_write_through(agent, client, database):
+    seen = []
+
+    async def model(messages, info):
+        seen.append(len(messages))
+        return await echo(messages, info)
+
+    agent.agent.model = FunctionModel(model)
+    for prompt in ("one", "two"):
+        client.post("/chat/message", json={"content": prompt, "agent_id": "full", "user_id": "cached"})
+    # The second turn's history came from the cache, with the first turn in it
+    assert seen == [1, 3]
+    assert history_cache.stats.hits >= 1
+    assert len(history_cache.get(("cached", "full")).messages) == 4
+
+def test_stale_after_another_write(agent, client, database):
+    prompts = []
+
+    async def model(messages, info):
+        prompts.append([part.content for message in messages for part in message.parts if isinstance(part, UserPromptPart)])
+        return await echo(messages, info)
+
+    agent.agent.model = FunctionModel(model)
+    client.post("/chat/message", json={"content": "one", "agent_id": "full", "user_id": "shared"})
+    stale = history_cache.stats.stale
+
+    # Another process saves a turn to the thread
+    with Session(database) as session:
+        thread = get_thread(session, "shared", "full")
+        save_messages(session, thread.id, turn("elsewhere"))
+        session.commit()
+
+    client.post("/chat/message", json={"content": "two", "agent_id": "full", "user_id": "shared"})
+    assert prompts[-1] == ["one", "elsewhere", "two"]
+    assert history_cache.stats.stale == stale + 1
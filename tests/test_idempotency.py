@@ -0,0 +1,89 @@
+import asyncio
+import pytest
+from app.agents.chat import ChatRequest, ChatResponse
+from app.agents.idempotency import ChatResults, IdempotencyConflict
+
+def request(content: str = "roll a d20", key: str | None = "key-1") -> ChatRequest:
+    return ChatRequest(content=content, agent_id="full", user_id="user", idempotency_key=key)
+
+class Turn:
+    """A compute callback counting its runs, answering once `release` is set."""
+
+    def __init__(self, error: str | None = None):
+        self.runs = 0
+        self.error = error
+        self.release = asyncio.Event()
+
+    async def __call__(self) -> ChatResponse:
+        self.runs += 1
+        await self.release.wait()
+        return ChatResponse(content=f"run {self.runs}", error=self.error)
+
+def test_single_flight():
+    async def main():
+        results = ChatResults(max_entries=10, ttl=60, persist=False)
+        turn = Turn()
+        calls = [asyncio.create_task(results.run(request(), turn)) for _ in range(3)]
+        await asyncio.sleep(0)
+        turn.release.set()
+        responses = await asyncio.gather(*calls)
+        assert turn.runs == 1
+        assert [response.content for response in responses] == ["run 1"] * 3
+        assert results.stats.misses == 1
+        assert results.stats.coalesced == 2
+
+        # A late retry is answered from memory
+        assert (await results.run(request(), turn)).content == "run 1"
+        assert turn.runs == 1
+        assert results.stats.hits == 1
+    asyncio.run(main())
+
+def test_cancelled_caller_keeps_turn():
+    async def main():
+        results = ChatResults(max_entries=10, ttl=60, persist=False)
+        turn = Turn()
+        first = asyncio.create_task(results.run(request(), turn))
+        second = asyncio.create_task(results.run(request(), turn))
+        await asyncio.sleep(0)
+        first.cancel()
+        turn.release.set()
+        assert (await second).content == "run 1"
+        assert turn.runs == 1
+    asyncio.run(main())
+
+def test_fingerprint_conflict():
+    async def main():
+        results = ChatResults(max_entries=10, ttl=60, persist=False)
+        turn = Turn()
+        first = asyncio.create_task(results.run(request(), turn))
+        await asyncio.sleep(0)
+        # In flight, then completed
+        with pytest.raises(IdempotencyConflict):
+            await results.run(request("roll a d6"), turn)
+        turn.release.set()
+        await first
+        with pytest.raises(IdempotencyConflict):
+            await results.run(request("roll a d6"), turn)
+        assert turn.runs == 1
+    asyncio.run(main())
+
+def test_errors_are_not_kept():
+    async def main():
+        results = ChatResults(max_entries=10, ttl=60, persist=False)
+        turn = Turn(error="model failed")
+        turn.release.set()
+        await results.run(request(), turn)
+        await results.run(request(), turn)
+        assert turn.runs == 2
+        assert len(results) == 0
+    asyncio.run(main())
+
+def test_without_key():
+    async def main():
+        results = ChatResults(max_entries=10, ttl=60, persist=False)
+        turn = Turn()
+        turn.release.set()
+        await results.run(request(key=None), turn)
+        await results.run(request(key=None), turn)
+        assert turn.runs == 2
+    asyncio.run(main())
@@ -0,0 +1,43 @@
+import pytest
+from app import logs
+from app.config import get_settings
+from app.logs import LEVELS, get_logger, lazy, parse_levels, set_levels
+
+@pytest.fixture
+def emitted(monkeypatch):
+    """Lines sent to logfire, with the configured levels restored afterwards."""
+    lines = []
+    monkeypatch.setattr(logs.logfire, "log", lambda level, msg, attributes: lines.append((level, msg, attributes)))
+    yield lines
+    settings = get_settings()
+    set_levels(settings.LOG_LEVEL, settings.LOG_LEVELS)
+
+def test_parse_levels():
+    assert parse_levels("app.agents=debug, app.db = WARN,") == {"app.agents": LEVELS["debug"], "app.db": LEVELS["warn"]}
+    with pytest.raises(ValueError):
+        parse_levels("app=loud")
+
+def test_longest_prefix_wins(emitted):
+    set_levels("warn", "app.agents=debug,app.agents.chat=error")
+    assert get_logger("app.agents.batch").enabled("debug")
+    assert not get_logger("app.agents.chat").enabled("warn")
+    assert not get_logger("app.agentsx").enabled("info")
+    assert get_logger("app.db").enabled("warn")
+
+def test_existing_loggers_follow_new_levels(emitted):
+    logger = get_logger("tests.existing")
+    set_levels("error")
+    logger.info("dropped")
+    set_levels("info", "tests=debug")
+    logger.debug("kept", count=1)
+    assert emitted == [("debug", "kept", {"count": 1})]
+
+def test_lazy_attributes_only_computed_when_emitted(emitted):
+    calls = []
+    logger = get_logger("tests.lazy")
+    set_levels("info")
+    logger.debug("dropped", value=lazy(lambda: calls.append(1) or "expensive"))
+    assert calls == []
+    logger.info("kept", value=lazy(lambda: calls.append(1) or "expensive"))
+    assert calls == [1]
+    assert emitted == [("info", "kept", {"value": "expensive"})]
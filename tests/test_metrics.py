@@ -0,0 +1,73 @@
+import asyncio
+import pytest
+from pydantic_ai.models.function import FunctionModel
+from app.metrics import Counter, Gauge, Histogram, MetricsRegistry
+
+def sample(text: str, prefix: str) -> float:
+    """The value of the first sample line starting with `prefix`."""
+    return float(next(line for line in text.splitlines() if line.startswith(prefix)).rsplit(" ", 1)[1])
+
+def test_render():
+    registry = MetricsRegistry()
+    requests = Counter("requests_total", "Requests", ["route"], registry=registry)
+    depth = Gauge("queue_depth", "Queued items", registry=registry)
+    Gauge("open_files", "Open files", callback=lambda: 3, registry=registry)
+    latency = Histogram("latency_seconds", "Latency", buckets=(0.1, 1), registry=registry)
+
+    requests.inc(route="/chat")
+    requests.inc(2, route="/chat")
+    requests.inc(route='a "quoted"\nroute')
+    depth.set(5)
+    depth.dec()
+    for value in (0.05, 0.5, 5):
+        latency.observe(value)
+
+    assert registry.render().splitlines() == [
+        "# HELP requests_total Requests",
+        "# TYPE requests_total counter",
+        'requests_total{route="/chat"} 3',
+        'requests_total{route="a \\"quoted\\"\\nroute"} 1',
+        "# HELP queue_depth Queued items",
+        "# TYPE queue_depth gauge",
+        "queue_depth 4",
+        "# HELP open_files Open files",
+        "# TYPE open_files gauge",
+        "open_files 3",
+        "# HELP latency_seconds Latency",
+        "# TYPE latency_seconds histogram",
+        'latency_seconds_bucket{le="0.1"} 1',
+        'latency_seconds_bucket{le="1"} 2',
+        'latency_seconds_bucket{le="+Inf"} 3',
+        "latency_seconds_sum 5.55",
+        "latency_seconds_count 3",
+    ]
+
+def test_duplicate_name():
+    registry = MetricsRegistry()
+    Counter("requests_total", "Requests", registry=registry)
+    with pytest.raises(ValueError):
+        Counter("requests_total", "Requests", registry=registry)
+
+def test_endpoint_counts_turns(client):
+    before = client.get("/metrics").text
+    response = client.post("/chat/message", json={"content": "hi", "agent_id": "full", "user_id": "metrics"})
+    assert response.json()["response"]["content"] == "echo: hi"
+
+    after = client.get("/metrics")
+    assert after.headers["content-type"].startswith("text/plain; version=0.0.4")
+    turns = 'chat_turn_seconds_count{agent="full",mode="chat",outcome="ok"}'
+    assert sample(after.text, turns) == (sample(before, turns) if turns in before else 0) + 1
+    assert 'chat_stage_seconds_count{agent="full",stage="history"}' in after.text
+    assert sample(after.text, 'chat_model_requests_total{agent="full"}') >= 1
+
+def test_model_stage_includes_first_token(agent, client):
+    async def stream(messages, info):
+        await asyncio.sleep(0.2)
+        yield "hello"
+
+    agent.agent.model = FunctionModel(stream_function=stream)
+    model = 'chat_stage_seconds_sum{agent="full",stage="model"}'
+    text = client.get("/metrics").text
+    before = sample(text, model) if model in text else 0
+    client.post("/chat/stream", json={"content": "hi", "agent_id": "full", "user_id": "first-token"})
+    assert sample(client.get("/metrics").text, model) - before >= 0.2
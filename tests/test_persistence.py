@@ -0,0 +1,78 @@
+import pytest
+from pydantic_ai.messages import (
+    ModelRequest, ModelResponse, SystemPromptPart, TextPart, ToolCallPart, ToolReturnPart, UserPromptPart
+)
+from app.config import get_settings
+from app.agents.context import SUMMARY_PREFIX
+from app.agents.history import load_history
+from app.agents.persistence import save_checkpoint, save_turns
+from app.models.thread import Thread
+
+FIRST_TURN = [
+    ModelRequest(parts=[
+        SystemPromptPart(content="You are a game master."),
+        UserPromptPart(content="Roll a d20"),
+    ]),
+    ModelResponse(parts=[ToolCallPart.from_raw_args("roll_dice", {"sides": 20}, "call-1")]),
+    ModelRequest(parts=[ToolReturnPart(tool_name="roll_dice", content="17", tool_call_id="call-1")]),
+    ModelResponse(parts=[TextPart(content="You rolled a 17.")]),
+]
+SECOND_TURN = [
+    ModelRequest(parts=[UserPromptPart(content="Again")]),
+    ModelResponse(parts=[TextPart(content="You rolled a 4.")]),
+]
+
+def contents(messages) -> list[tuple]:
+    """What a history sends to the model, without timestamps."""
+    rows = []
+    for message in messages:
+        for part in message.parts:
+            if isinstance(part, ToolCallPart):
+                rows.append((part.part_kind, part.tool_name, part.args_as_dict(), part.tool_call_id))
+            elif isinstance(part, ToolReturnPart):
+                rows.append((part.part_kind, part.tool_name, part.content, part.tool_call_id))
+            else:
+                rows.append((part.part_kind, part.content))
+    return rows
+
+@pytest.fixture(params=["parts", "payload"])
+def storage(request, monkeypatch):
+    monkeypatch.setattr(get_settings(), "MESSAGE_STORAGE", request.param)
+    return request.param
+
+def test_round_trip(session, storage):
+    save_turns(session, [(1, FIRST_TURN)])
+    session.commit()
+    ids = save_turns(session, [(1, SECOND_TURN)])
+    session.commit()
+    assert len(ids[0]) == 2
+
+    messages = load_history(session, 1)
+    assert [type(message) for message in messages] == [type(message) for message in FIRST_TURN + SECOND_TURN]
+    assert contents(messages) == contents(FIRST_TURN + SECOND_TURN)
+    assert session.get(Thread, 1).version == 2
+
+def test_checkpoint_replaces_covered_messages(session, storage):
+    save_turns(session, [(1, FIRST_TURN), (1, SECOND_TURN)])
+    session.commit()
+    version = session.get(Thread, 1).version
+    checkpoint = save_checkpoint(
+        session, 1, version, len(FIRST_TURN), "You are a game master.", "They rolled a 17.", None
+    )
+    session.commit()
+    assert checkpoint is not None
+
+    messages = load_history(session, 1)
+    assert contents(messages) == [
+        ("system-prompt", "You are a game master."),
+        ("system-prompt", SUMMARY_PREFIX + "They rolled a 17."),
+    ] + contents(SECOND_TURN)
+
+def test_stale_checkpoint_is_discarded(session):
+    save_turns(session, [(1, FIRST_TURN), (1, SECOND_TURN)])
+    session.commit()
+    version = session.get(Thread, 1).version
+    assert save_checkpoint(session, 1, version, 2, None, "First.", None) is not None
+    session.commit()
+    # Built on the history from before that checkpoint
+    assert save_checkpoint(session, 1, version, 4, None, "Second.", None) is None
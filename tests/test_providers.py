@@ -0,0 +1,71 @@
+import asyncio
+import httpx
+from app.config import get_settings
+from app.agents import providers
+from app.agents.providers import ModelClients, ProcessTransport
+
+class Recorder(httpx.AsyncBaseTransport):
+    """Stands in for httpx's transport, answering every request with 200."""
+    created = 0
+    requests: list[httpx.Request] = []
+
+    def __init__(self, **options):
+        Recorder.created += 1
+        self.options = options
+        self.closed = False
+
+    async def handle_async_request(self, request):
+        Recorder.requests.append(request)
+        return httpx.Response(200, json={"pool": id(self)})
+
+    async def aclose(self):
+        self.closed = True
+
+def test_one_client_per_provider():
+    clients = ModelClients()
+    first = clients.groq_model("llama-3.3-70b-versatile")
+    second = clients.groq_model("llama-3.1-8b-instant")
+    assert first.client._client is second.client._client is clients.http_client("groq")
+
+    # A closed client is replaced on next use
+    asyncio.run(clients.close())
+    assert clients.http_client("groq") is not first.client._client
+
+def test_warm_up(monkeypatch):
+    monkeypatch.setattr(providers.httpx, "AsyncHTTPTransport", Recorder)
+    monkeypatch.setattr(Recorder, "requests", [])
+    settings = get_settings()
+    monkeypatch.setattr(settings, "MODEL_WARMUP_CONNECTIONS", 3)
+    monkeypatch.setattr(settings, "GROQ_BASE_URL", "http://groq.test/")
+    clients = ModelClients()
+
+    async def main():
+        await clients.warm_up()
+        await clients.close()
+
+    asyncio.run(main())
+    assert [str(request.url) for request in Recorder.requests] == ["http://groq.test/openai/v1/models"] * 3
+
+def test_pool_per_process(monkeypatch):
+    monkeypatch.setattr(providers.httpx, "AsyncHTTPTransport", Recorder)
+    Recorder.created = 0
+    pid = [100]
+    monkeypatch.setattr(providers.os, "getpid", lambda: pid[0])
+    client = httpx.AsyncClient(transport=ProcessTransport(http2=False))
+
+    async def pool() -> int:
+        return (await client.get("http://provider/models")).json()["pool"]
+
+    async def main():
+        parent = await pool()
+        assert await pool() == parent
+        # A forked worker gets a pool of its own, and doesn't close the parent's
+        pid[0] = 101
+        worker = await pool()
+        assert worker != parent
+        worker_transport = client._transport._transport
+        await client.aclose()
+        assert worker_transport.closed
+
+    asyncio.run(main())
+    assert Recorder.created == 2
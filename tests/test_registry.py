@@ -0,0 +1,100 @@
+import os
+import threading
+import time
+import pytest
+from app.config import get_settings
+from app.agents.chat import ChatAgent
+from app.agents.concurrency import AdmissionLimiter
+from app.agents.registry import AgentRegistry
+
+class CountingAgent(ChatAgent):
+    """An agent counting how many times it was built."""
+    built = 0
+
+    def __init__(self):
+        CountingAgent.built += 1
+        time.sleep(0.01)  # Long enough for racing gets to overlap
+
+    def configure(self, config: dict) -> None:
+        super().configure(config)
+        self.config = config
+
+CONFIG = """
+agents:
+  - id: first
+    package: test_registry.CountingAgent
+    description: {description}
+  - id: second
+    package: test_registry.CountingAgent
+"""
+
+@pytest.fixture
+def registry(tmp_path, monkeypatch):
+    """An empty registry reading the config at tmp_path / "agents.yaml"."""
+    for name in ("_agents", "_metadata", "_pinned", "_build_locks"):
+        monkeypatch.setattr(AgentRegistry, name, type(getattr(AgentRegistry, name))())
+    monkeypatch.setattr(AgentRegistry, "_config_mtime", None)
+    CountingAgent.built = 0
+    path = tmp_path / "agents.yaml"
+    write_config(path, CONFIG.format(description="one"))
+    AgentRegistry.load_from_config(path)
+    return path
+
+def write_config(path, text: str) -> None:
+    previous = path.stat().st_mtime_ns if path.exists() else 0
+    path.write_text(text)
+    # Some filesystems only keep whole seconds, make sure the change shows
+    stamp = max(path.stat().st_mtime_ns, previous + 10**9)
+    os.utime(path, ns=(stamp, stamp))
+
+def test_built_once_on_first_use(registry):
+    assert CountingAgent.built == 0
+    assert [agent["id"] for agent in AgentRegistry.list()] == ["first", "second"]
+
+    agents = []
+    threads = [threading.Thread(target=lambda: agents.append(AgentRegistry.get("first"))) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert CountingAgent.built == 1
+    assert all(agent is agents[0] for agent in agents)
+
+    with pytest.raises(ValueError):
+        AgentRegistry.get("missing")
+
+def test_reload(registry):
+    first, second = AgentRegistry.get("first"), AgentRegistry.get("second")
+    assert not AgentRegistry.reload()
+
+    write_config(registry, CONFIG.format(description="two"))
+    assert AgentRegistry.reload()
+    # Only the changed entry is rebuilt
+    assert AgentRegistry.get("second") is second
+    changed = AgentRegistry.get("first")
+    assert changed is not first
+    assert changed.config["description"] == "two"
+
+    # A broken file keeps the last good config
+    write_config(registry, "agents: [")
+    assert not AgentRegistry.reload()
+    assert AgentRegistry.get("first") is changed
+
+    write_config(registry, "agents: []")
+    assert AgentRegistry.reload()
+    with pytest.raises(ValueError):
+        AgentRegistry.get("first")
+
+def test_evicts_idle_agents(registry, monkeypatch):
+    monkeypatch.setattr(get_settings(), "AGENTS_MAX_LOADED", 1)
+    first = AgentRegistry.get("first")
+    AgentRegistry.get("second")
+    assert list(AgentRegistry._agents) == ["second"]
+    assert AgentRegistry.get("first") is not first
+
+    # An agent with calls in flight is kept
+    busy = AgentRegistry.get("first")
+    busy.limiter = AdmissionLimiter("first", max_concurrent=1, max_queue=1, queue_timeout=1)
+    busy.limiter.in_flight = 1
+    AgentRegistry.get("second")
+    assert AgentRegistry.get("first") is busy
@@ -0,0 +1,41 @@
+import time
+from app.db.replicas import Replica, ReplicaRouter
+
+def router(window: float = 60) -> ReplicaRouter:
+    # Stand-in engines, engine_for only hands them out
+    router = ReplicaRouter(["sqlite://", "sqlite://"], window=window, check_interval=0, max_lag=5, slots=1024)
+    router.replicas = [Replica("first"), Replica("second")]
+    return router
+
+def test_round_robin():
+    replicas = router()
+    assert [replicas.engine_for("user", 1) for _ in range(3)] == ["first", "second", "first"]
+
+def test_skips_unhealthy():
+    replicas = router()
+    replicas.replicas[0].healthy = False
+    assert {replicas.engine_for("user", 1) for _ in range(3)} == {"second"}
+    replicas.replicas[1].healthy = False
+    assert replicas.engine_for("user", 1) is None
+
+def test_reads_own_writes():
+    replicas = router()
+    replicas.wrote(user_id="writer", thread_id=1)
+    assert replicas.engine_for("writer") is None
+    assert replicas.engine_for(thread_id=1) is None
+    assert replicas.engine_for("writer", 2) is None
+    # Other users and threads still read from the replicas
+    assert replicas.engine_for("reader", 2) is not None
+
+def test_pin_expires():
+    replicas = router(window=0.05)
+    replicas.wrote(user_id="writer")
+    assert replicas.engine_for("writer") is None
+    time.sleep(0.1)
+    assert replicas.engine_for("writer") is not None
+
+def test_disabled():
+    replicas = ReplicaRouter([], window=60, check_interval=0, max_lag=5, slots=16)
+    replicas.wrote(user_id="writer")
+    assert not replicas.enabled
+    assert replicas.engine_for("reader") is None
@@ -0,0 +1,62 @@
+import asyncio
+from pydantic_ai import Agent
+from pydantic_ai.messages import ModelResponse
+from pydantic_ai.models.function import FunctionModel
+from app.agents.response_cache import CachedModel, ResponseCache, ResponseCacheConfig
+from impl.full.agent import FullAgent
+from conftest import echo
+
+def counting_model() -> tuple[FunctionModel, list]:
+    calls = []
+
+    async def model(messages, info):
+        calls.append(messages)
+        return await echo(messages, info)
+    return FunctionModel(model), calls
+
+def test_identical_requests_hit():
+    model, calls = counting_model()
+    agent = Agent(CachedModel(model, ResponseCache("test", ResponseCacheConfig())), system_prompt="Be brief.")
+
+    async def main():
+        first = await agent.run("What is 2 + 2?")
+        # Surrounding whitespace and timestamps don't matter
+        again = await agent.run("  What is 2 + 2?\n")
+        assert again.data == first.data == "echo: What is 2 + 2?"
+        assert len(calls) == 1
+
+        # Another prompt, or the same one after other history, goes to the model
+        await agent.run("What is 3 + 3?")
+        await agent.run("What is 2 + 2?", message_history=first.new_messages())
+        assert len(calls) == 3
+    asyncio.run(main())
+
+def test_bounded_by_bytes():
+    cache = ResponseCache("test", ResponseCacheConfig(max_entries=10, max_bytes=600))
+
+    async def main():
+        for i in range(5):
+            await cache.put(f"key-{i}", ModelResponse.from_text("x" * 100))
+        assert cache.bytes <= 600
+        assert cache.stats.evictions > 0
+        # The oldest went first
+        assert await cache.get("key-0") is None
+        assert (await cache.get("key-4")).parts[0].content == "x" * 100
+    asyncio.run(main())
+
+def test_persisted_across_processes(run):
+    config = ResponseCacheConfig(persist=True)
+
+    async def main():
+        await ResponseCache("test", config).put("key", ModelResponse.from_text("stored"))
+        # A new process starts with nothing in memory
+        restarted = ResponseCache("test", config)
+        assert (await restarted.get("key")).parts[0].content == "stored"
+        assert len(restarted) == 1
+    run(main())
+
+def test_disabled_with_nondeterministic_tools():
+    agent = FullAgent()
+    agent.configure({"id": "full", "response_cache": {}})
+    # roll_dice isn't pure
+    assert not isinstance(agent.agent.model, CachedModel)
@@ -0,0 +1,82 @@
+import json
+from datetime import datetime, timedelta
+from pydantic_ai.messages import ModelRequest, ModelResponse, TextPart, UserPromptPart
+from sqlalchemy import update
+from sqlmodel import select
+from app.agents.context import SUMMARY_PREFIX
+from app.agents.history import load_history
+from app.agents.persistence import save_turns
+from app.agents.retention import ARCHIVED_SUMMARY, Retention, RetentionConfig
+from app.models.archive import ArchivedMessage
+from app.models.message import Message
+
+def seed(session, turns: int) -> list[list[int]]:
+    ids = save_turns(session, [
+        (1, [ModelRequest(parts=[UserPromptPart(content=f"q{i}")]), ModelResponse(parts=[TextPart(content=f"a{i}")])])
+        for i in range(turns)
+    ])
+    session.commit()
+    return ids
+
+def retention(session, tmp_path, dry_run: bool = False) -> Retention:
+    return Retention(session.get_bind(), batch_size=3, duty_cycle=1, archive_dir=str(tmp_path / "archive"),
+                     payload_format="json", dry_run=dry_run)
+
+def contents(messages) -> list[str]:
+    return [part.content for message in messages for part in message.parts]
+
+def test_dry_run_only_measures(session, tmp_path):
+    seed(session, 5)
+    report = retention(session, tmp_path, dry_run=True).run_agent("full", RetentionConfig(keep_messages=4))
+    assert report.threads == 1
+    # Six messages go, the one the checkpoint points at is emptied instead
+    assert report.messages == 5
+    assert report.parts == 6
+    assert report.bytes > 0
+    assert len(session.exec(select(Message)).all()) == 10
+    assert load_history(session, 1)[0].parts[0].content == "q0"
+
+def test_archive_to_table(session, tmp_path):
+    seed(session, 5)
+    report = retention(session, tmp_path).run_agent("full", RetentionConfig(keep_messages=4))
+    assert report.messages == 5
+    archived = session.exec(select(ArchivedMessage).order_by(ArchivedMessage.id)).all()
+    assert [row.id for row in archived] == [1, 2, 3, 4, 5, 6]
+
+    history = load_history(session, 1)
+    assert contents(history) == [SUMMARY_PREFIX + ARCHIVED_SUMMARY, "q3", "a3", "q4", "a4"]
+
+    # A second run has nothing more to do
+    assert retention(session, tmp_path).run_agent("full", RetentionConfig(keep_messages=4)).messages == 0
+    assert contents(load_history(session, 1)) == contents(history)
+
+def test_archive_to_file(session, tmp_path):
+    seed(session, 3)
+    retention(session, tmp_path).run_agent("full", RetentionConfig(keep_messages=2, archive="file"))
+    files = list((tmp_path / "archive" / "full").glob("*.jsonl"))
+    assert len(files) == 1
+    lines = [json.loads(line) for line in files[0].read_text().splitlines()]
+    assert [line["id"] for line in lines] == [1, 2, 3, 4]
+    assert lines[0]["message"]["parts"][0]["content"] == "q0"
+
+def test_keep_days(session, tmp_path):
+    seed(session, 3)
+    old = datetime.utcnow() - timedelta(days=10)
+    session.execute(update(Message).where(Message.id <= 2).values(timestamp=old))
+    session.commit()
+    report = retention(session, tmp_path).run_agent("full", RetentionConfig(keep_days=1))
+    assert report.messages == 1
+    assert contents(load_history(session, 1))[1:] == ["q1", "a1", "q2", "a2"]
+
+def test_timestamp_order_differs_from_ids(session, tmp_path):
+    seed(session, 5)
+    # The first turn's messages carry timestamps newer than every other one
+    newest = session.exec(select(Message.timestamp).order_by(Message.timestamp.desc())).first()
+    session.execute(update(Message).where(Message.id <= 2).values(timestamp=newest + timedelta(seconds=1)))
+    session.commit()
+
+    retention(session, tmp_path).run_agent("full", RetentionConfig(keep_messages=4))
+    archived = session.exec(select(ArchivedMessage.id).order_by(ArchivedMessage.id)).all()
+    assert archived == [3, 4, 5, 6, 7, 8]
+    # Kept messages are read in timestamp order, none hidden behind the checkpoint
+    assert contents(load_history(session, 1))[1:] == ["q4", "a4", "q0", "a0"]
@@ -0,0 +1,154 @@
+import asyncio
+import time
+import pytest
+from pydantic_ai import Agent
+from pydantic_ai.messages import ModelResponse
+from pydantic_ai.models.function import FunctionModel
+from app.agents.concurrency import Overloaded
+from app.agents.routing import (
+    BreakerConfig, HedgeConfig, ModelHealth, Route, RouteConfig, RoutedModel, RoutingConfig
+)
+
+class Model:
+    """A FunctionModel answering with its name after `delay` seconds, or failing."""
+
+    def __init__(self, name: str, delay: float = 0, fail: bool = False):
+        self.name = name
+        self.delay = delay
+        self.fail = fail
+        self.calls = 0
+        self.cancelled = 0
+
+    async def respond(self, messages, info) -> ModelResponse:
+        self.calls += 1
+        try:
+            await asyncio.sleep(self.delay)
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        if self.fail:
+            raise RuntimeError(f"{self.name} is down")
+        return ModelResponse.from_text(self.name)
+
+    def route(self, breaker: BreakerConfig = BreakerConfig()) -> Route:
+        return Route(self.name, FunctionModel(self.respond, stream_function=self.stream), ModelHealth("full", self.name, breaker))
+
+    async def stream(self, messages, info):
+        yield (await self.respond(messages, info)).parts[0].content
+
+def run(model: RoutedModel) -> str:
+    return asyncio.run(Agent(model=model).run("hi")).data
+
+def test_name():
+    assert RoutedModel("full", []).name() == "routed:full"
+
+def test_from_config():
+    config = RoutingConfig(chain=[
+        "groq:llama-3.3-70b-versatile",
+        RouteConfig(model="groq:llama-3.1-8b-instant", base_url="http://localhost:8001/openai/v1")
+    ])
+    model = RoutedModel.from_config("full", config)
+    assert model.name() == "routed:full"
+    assert [route.name for route in model.routes] == [
+        "groq:llama-3.3-70b-versatile", "groq:llama-3.1-8b-instant@http://localhost:8001/openai/v1"
+    ]
+
+def test_breakers_per_agent():
+    def config(failures: int) -> RoutingConfig:
+        return RoutingConfig(chain=["groq:llama-3.1-8b-instant"], breaker=BreakerConfig(failures=failures))
+
+    full = RoutedModel.from_config("full", config(5)).routes[0].health
+    basic = RoutedModel.from_config("basic", config(1)).routes[0].health
+    assert full is not basic
+    assert (full.config.failures, basic.config.failures) == (5, 1)
+
+    # A rebuilt agent keeps its breaker's state, with the new settings
+    full.failed()
+    reloaded = RoutedModel.from_config("full", config(2)).routes[0].health
+    assert reloaded is full
+    assert reloaded.config.failures == 2
+    reloaded.failed()
+    assert reloaded.is_open
+
+def test_streamed_latencies_kept_apart():
+    primary = Model("primary")
+    model = RoutedModel("full", [primary.route()])
+
+    async def main():
+        agent = Agent(model=model)
+        await agent.run("hi")
+        async with agent.run_stream("hi") as result:
+            assert await result.get_data() == "primary"
+        async with agent.run_stream("hi") as result:
+            await result.get_data()
+
+    asyncio.run(main())
+    health = model.routes[0].health
+    assert len(health.latencies) == 1
+    assert len(health.stream_latencies) == 2
+
+def test_fallback():
+    primary, secondary = Model("primary", fail=True), Model("secondary")
+    model = RoutedModel("full", [primary.route(), secondary.route()])
+    assert run(model) == "secondary"
+    assert model.routes[0].health.failures == 1
+    assert model.routes[1].health.failures == 0
+
+def test_all_failing_raises_last_error():
+    model = RoutedModel("full", [Model("primary", fail=True).route(), Model("secondary", fail=True).route()])
+    with pytest.raises(RuntimeError, match="secondary is down"):
+        run(model)
+
+def test_breaker_skips_model_until_reset():
+    breaker = BreakerConfig(failures=2, reset_after=60)
+    primary, secondary = Model("primary", fail=True), Model("secondary")
+    model = RoutedModel("full", [primary.route(breaker), secondary.route(breaker)])
+    for _ in range(3):
+        assert run(model) == "secondary"
+    assert primary.calls == 2
+    assert model.routes[0].health.is_open
+
+    # Once reset_after passes a single trial goes through, and closes it
+    primary.fail = False
+    model.routes[0].health.opened_at -= 60
+    assert run(model) == "primary"
+    assert not model.routes[0].health.is_open
+
+def test_no_healthy_model():
+    primary = Model("primary", fail=True)
+    model = RoutedModel("full", [primary.route(BreakerConfig(failures=1, reset_after=60))])
+    with pytest.raises(RuntimeError):
+        run(model)
+    with pytest.raises(Overloaded) as raised:
+        run(model)
+    assert raised.value.status_code == 503
+    assert primary.calls == 1
+
+def test_hedge_to_faster_model():
+    hedge = HedgeConfig(min_delay=0.01, max_delay=0.01, default_delay=0.01)
+    slow, fast = Model("slow", delay=5), Model("fast")
+    model = RoutedModel("full", [slow.route(), fast.route()], hedge)
+    started = time.monotonic()
+    assert run(model) == "fast"
+    assert time.monotonic() - started < 1
+    assert slow.cancelled == 1
+    assert fast.calls == 1
+
+def test_no_hedge_without_config():
+    slow, fast = Model("slow", delay=0.05), Model("fast")
+    model = RoutedModel("full", [slow.route(), fast.route()])
+    assert run(model) == "slow"
+    assert fast.calls == 0
+
+def test_hedge_delay_follows_percentile():
+    hedge = HedgeConfig(percentile=50, min_delay=0.1, max_delay=5, default_delay=2, min_samples=4)
+    route = Model("primary").route()
+    model = RoutedModel("full", [route], hedge)
+    assert model.hedge_delay(route) == 2
+    for seconds in [0.5, 1, 1.5, 20]:
+        route.health.succeeded(seconds)
+    assert model.hedge_delay(route) == 1
+    route.health.latencies.extend([0.01] * 10)
+    assert model.hedge_delay(route) == 0.1
+    # Streams have a window of their own, still empty
+    assert model.hedge_delay(route, streamed=True) == 2
@@ -0,0 +1,64 @@
+from pydantic_ai.messages import ModelRequest, ModelResponse, SystemPromptPart, TextPart, UserPromptPart
+from sqlmodel import Session
+from app.config import get_settings
+from app.agents.history import get_or_create_thread
+from app.agents.persistence import save_messages
+from app.agents.search import backfill_batch, create_search_index
+
+def save_turn(session: Session, user_id: str, prompt: str, reply: str) -> None:
+    thread = get_or_create_thread(session, user_id, "full")
+    save_messages(session, thread.id, [
+        ModelRequest(parts=[SystemPromptPart(content="You are a dragon expert."), UserPromptPart(content=prompt)]),
+        ModelResponse(parts=[TextPart(content=reply)]),
+    ])
+
+def search(client, **params) -> dict:
+    response = client.get("/search", params=params)
+    assert response.status_code == 200
+    return response.json()
+
+def test_search(client, database):
+    create_search_index(database)
+    with Session(database) as session:
+        save_turn(session, "alice", "Tell me about red dragons", "Red dragons hoard gold.")
+        save_turn(session, "bob", "What do dragons eat?", "Mostly sheep.")
+        save_turn(session, "bob", "Roll for initiative", "You rolled a 12.")
+        session.commit()
+
+    hits = search(client, q="dragons")["hits"]
+    # Prompts and replies are indexed, system prompts aren't
+    assert {hit["content"] for hit in hits} == {"Tell me about red dragons", "Red dragons hoard gold.", "What do dragons eat?"}
+    assert [hit["content"] for hit in search(client, q="red dragons gold")["hits"]] == ["Red dragons hoard gold."]
+    assert [hit["user_id"] for hit in search(client, q="dragons", user_id="bob")["hits"]] == ["bob"]
+    assert [hit["part_kind"] for hit in search(client, q="dragons", part_kind="text")["hits"]] == ["text"]
+    # Words are stemmed, and query syntax is taken as text
+    assert {hit["content"] for hit in search(client, q="rolling")["hits"]} == {"Roll for initiative", "You rolled a 12."}
+    assert search(client, q='dragons" OR (')["hits"] == []
+
+def test_search_pages(client, database):
+    create_search_index(database)
+    with Session(database) as session:
+        for i in range(5):
+            save_turn(session, f"user-{i}", f"dragon question {i}", f"dragon answer {i}")
+        session.commit()
+
+    found, cursor = [], None
+    while True:
+        page = search(client, q="dragon", limit=3, **({"cursor": cursor} if cursor else {}))
+        found.extend(hit["content"] for hit in page["hits"])
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+    assert sorted(found) == sorted([f"dragon question {i}" for i in range(5)] + [f"dragon answer {i}" for i in range(5)])
+
+def test_backfill(database, monkeypatch):
+    create_search_index(database)
+    monkeypatch.setattr(get_settings(), "SEARCH_INDEX", False)
+    with Session(database) as session:
+        save_turn(session, "alice", "Tell me about dragons", "They fly.")
+        session.commit()
+        assert backfill_batch(session, 0, 1) == [1]
+        assert backfill_batch(session, 1, 10) == [2]
+        session.commit()
+        # Indexed messages are skipped
+        assert backfill_batch(session, 0, 10) == []
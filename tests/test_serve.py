@@ -0,0 +1,54 @@
+import multiprocessing
+import time
+from pathlib import Path
+from app import serve
+from app.serve import Supervisor, worker_outbox
+from app.workers import WorkerTable
+
+def wait_for(condition, timeout: float = 5) -> None:
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "Timed out"
+        time.sleep(0.01)
+
+def test_table_shared_with_workers():
+    table = WorkerTable(2)
+    table.started(1, 1234)
+    time.sleep(0.2)
+    # The worker's heartbeat reaches the parent
+    worker = multiprocessing.get_context("fork").Process(target=table.beat, args=(1,))
+    worker.start()
+    worker.join()
+    assert table.snapshot()[1]["heartbeat_age"] < 0.2 <= table.snapshot()[1]["uptime"]
+    assert table.snapshot()[1]["pid"] == 1234
+    assert table.snapshot()[0]["pid"] == 0
+
+def test_worker_outbox():
+    assert worker_outbox(Path("data/outbox.jsonl"), 2) == Path("data/outbox.2.jsonl")
+
+def test_restarts_dead_and_silent_workers(monkeypatch):
+    monkeypatch.setattr(serve, "RESTART_DELAY", 0)
+    supervisor = Supervisor(config=None, sock=None, table=WorkerTable(1))
+    supervisor.heartbeat_timeout = 0.2
+    pid = lambda: supervisor.table.snapshot()[0]["pid"]
+    try:
+        # A worker that exits is forked again
+        supervisor._serve = lambda slot: None
+        supervisor._spawn(0)
+        first = pid()
+        wait_for(lambda: supervisor._reap() or 0 in supervisor._restarts)
+        supervisor._serve = lambda slot: time.sleep(30)  # Never beats
+        supervisor._restart()
+        second = pid()
+        assert second != first
+
+        # So is one that stops sending heartbeats, once it's been killed
+        time.sleep(0.3)
+        supervisor._check_heartbeats()
+        wait_for(lambda: supervisor._reap() or 0 in supervisor._restarts)
+        assert second not in supervisor._pids
+    finally:
+        supervisor.stopping = True
+        supervisor.drain_timeout = 0
+        supervisor._drain()
+    assert not supervisor._pids
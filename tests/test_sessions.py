@@ -0,0 +1,97 @@
+import time
+import pytest
+from fastapi import WebSocketDisconnect
+from pydantic_ai.messages import ModelRequest, ModelResponse, TextPart, UserPromptPart
+from pydantic_ai.models.function import FunctionModel
+from sqlmodel import Session
+from app.config import get_settings
+from app.agents.persistence import save_messages
+from app.agents.sessions import chat_sessions
+from conftest import last_prompt
+
+@pytest.fixture
+def prompts(agent) -> list[list[str]]:
+    """The user prompts the model was sent, one list per turn."""
+    sent = []
+
+    async def stream(messages, info):
+        sent.append([part.content for message in messages for part in message.parts if isinstance(part, UserPromptPart)])
+        yield f"echo: {last_prompt(messages)}"
+
+    agent.agent.model = FunctionModel(stream_function=stream)
+    return sent
+
+@pytest.fixture(autouse=True)
+def closed_sessions():
+    """Wait for the server to close the sessions a test's connections opened."""
+    yield
+    deadline = time.monotonic() + 5
+    while chat_sessions.open and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert chat_sessions.open == 0
+
+def turn(websocket, content: str) -> list[dict]:
+    websocket.send_json({"content": content})
+    events = [websocket.receive_json()]
+    while events[-1]["event"] not in ("done", "error"):
+        events.append(websocket.receive_json())
+    return events
+
+def test_session(client, prompts, database):
+    with client.websocket_connect("/chat/ws?agent_id=full&user_id=socket") as websocket:
+        ready = websocket.receive_json()
+        assert ready["event"] == "ready"
+        assert turn(websocket, "one") == [{"event": "text", "content": "echo: one"}, {"event": "done"}]
+
+        # Bad messages are answered, the session stays open
+        websocket.send_text("not json")
+        assert websocket.receive_json()["event"] == "error"
+
+        # A turn saved by another connection is seen by the next one here
+        with Session(database) as session:
+            save_messages(session, ready["thread_id"], [
+                ModelRequest(parts=[UserPromptPart(content="elsewhere")]),
+                ModelResponse(parts=[TextPart(content="ok")]),
+            ])
+            session.commit()
+        turn(websocket, "two")
+        turn(websocket, "three")
+        assert chat_sessions.open == 1
+    assert prompts == [["one"], ["one", "elsewhere", "two"], ["one", "elsewhere", "two", "three"]]
+
+def test_history_over_the_cap(client, prompts, monkeypatch):
+    monkeypatch.setattr(chat_sessions, "max_history_bytes", 1)
+    with client.websocket_connect("/chat/ws?agent_id=full&user_id=large") as websocket:
+        websocket.receive_json()
+        turn(websocket, "one")
+        turn(websocket, "two")
+    # Loaded each turn instead of kept
+    assert prompts == [["one"], ["one", "two"]]
+
+def test_connection_limit(client, prompts, monkeypatch):
+    monkeypatch.setattr(chat_sessions, "max_sessions", 1)
+    with client.websocket_connect("/chat/ws?agent_id=full&user_id=first") as websocket:
+        websocket.receive_json()
+        with pytest.raises(WebSocketDisconnect) as rejected:
+            with client.websocket_connect("/chat/ws?agent_id=full&user_id=second") as second:
+                second.receive_json()
+        assert rejected.value.code == 1013
+
+    with pytest.raises(WebSocketDisconnect) as unknown:
+        with client.websocket_connect("/chat/ws?agent_id=missing") as websocket:
+            websocket.receive_json()
+    assert unknown.value.code == 1008
+
+def test_idle_connection_closed(client, prompts, monkeypatch):
+    settings = get_settings()
+    monkeypatch.setattr(settings, "WS_HEARTBEAT_INTERVAL", 0.05)
+    monkeypatch.setattr(settings, "WS_IDLE_TIMEOUT", 0.2)
+    with client.websocket_connect("/chat/ws?agent_id=full&user_id=idle") as websocket:
+        websocket.receive_json()
+        assert websocket.receive_json() == {"event": "ping"}
+        # Pongs don't count as activity
+        websocket.send_json({"event": "pong"})
+        with pytest.raises(WebSocketDisconnect) as closed:
+            while True:
+                websocket.receive_json()
+        assert closed.value.code == 1000
@@ -0,0 +1,45 @@
+import json
+from pydantic_ai.messages import TextPart
+from pydantic_ai.models.function import FunctionModel
+from sqlmodel import Session
+from app.agents.history import get_thread, load_history
+
+def events(response) -> list[dict]:
+    return [json.loads(line) for line in response.text.splitlines()]
+
+def test_stream_events(agent, client, database):
+    async def stream(messages, info):
+        for chunk in ("You rolled", " a 17."):
+            yield chunk
+
+    agent.agent.model = FunctionModel(stream_function=stream)
+    response = client.post("/chat/stream", json={"content": "Roll a d20", "agent_id": "full", "user_id": "stream"})
+    assert response.headers["content-type"] == "application/x-ndjson"
+    received = events(response)
+    assert received[-1] == {"event": "done"}
+    assert "".join(event["content"] for event in received[:-1]) == "You rolled a 17."
+    assert all(event["event"] == "text" for event in received[:-1])
+
+    # The whole turn is saved once the stream completes
+    with Session(database) as session:
+        thread = get_thread(session, "stream", "full")
+        history = load_history(session, thread.id)
+    assert [part.content for part in history[-1].parts if isinstance(part, TextPart)] == ["You rolled a 17."]
+
+def test_stream_failure(agent, client, database):
+    async def stream(messages, info):
+        yield "You rolled"
+        raise RuntimeError("connection reset")
+
+    agent.agent.model = FunctionModel(stream_function=stream)
+    received = events(client.post("/chat/stream", json={"content": "Roll a d20", "agent_id": "full", "user_id": "broken"}))
+    assert received[-1] == {"event": "error", "error": "connection reset"}
+
+    # Nothing of a failed turn is saved
+    with Session(database) as session:
+        thread = get_thread(session, "broken", "full")
+        assert load_history(session, thread.id) == []
+
+def test_stream_unknown_agent(client):
+    received = events(client.post("/chat/stream", json={"content": "hi", "agent_id": "missing"}))
+    assert [event["event"] for event in received] == ["error"]
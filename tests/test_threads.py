@@ -0,0 +1,51 @@
+from datetime import datetime
+from pydantic_ai.messages import ModelRequest, ModelResponse, TextPart, UserPromptPart
+from sqlalchemy import update
+from sqlmodel import Session
+from app.agents.history import get_or_create_thread
+from app.agents.persistence import save_messages
+from app.models.message import Message
+
+def pages(client, path: str, key: str, limit: int) -> list[list]:
+    """Follow a listing's cursors to the end."""
+    found, cursor = [], None
+    while True:
+        params = {"limit": limit} | ({"cursor": cursor} if cursor else {})
+        page = client.get(path, params=params).json()
+        found.append(page[key])
+        cursor = page["next_cursor"]
+        if cursor is None:
+            return found
+
+def test_thread_pages(client, database):
+    with Session(database) as session:
+        ids = [get_or_create_thread(session, f"user-{i}", "full").id for i in range(5)]
+        session.commit()
+
+    found = pages(client, "/threads", "threads", limit=2)
+    assert [len(page) for page in found] == [2, 2, 1]
+    assert [thread["id"] for page in found for thread in page] == ids[::-1]
+
+def test_message_pages(client, database):
+    with Session(database) as session:
+        thread = get_or_create_thread(session, "user", "full")
+        for i in range(5):
+            save_messages(session, thread.id, [
+                ModelRequest(parts=[UserPromptPart(content=f"prompt {i}")]),
+                ModelResponse(parts=[TextPart(content=f"reply {i}")]),
+            ])
+        # Same timestamp throughout, pages have to go by id to keep their place
+        session.execute(update(Message).values(timestamp=datetime(2026, 1, 1)))
+        session.commit()
+        thread_id = thread.id
+
+    found = pages(client, f"/threads/{thread_id}/messages", "messages", limit=3)
+    assert [len(page) for page in found] == [3, 3, 3, 1]
+    # Pages go backwards from the latest, each page oldest first
+    contents = [message["parts"][0]["content"] for page in reversed(found) for message in page]
+    assert contents == [text for i in range(5) for text in (f"prompt {i}", f"reply {i}")]
+
+def test_bad_requests(client, database):
+    assert client.get("/threads/999/messages").status_code == 404
+    assert client.get("/threads", params={"cursor": "not a cursor"}).status_code == 400
+    assert client.get("/threads", params={"limit": 0}).status_code == 422
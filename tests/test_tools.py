@@ -0,0 +1,75 @@
+import asyncio
+import time
+from pydantic_ai import Agent
+from pydantic_ai.messages import ModelResponse, RetryPromptPart, ToolCallPart, ToolReturnPart
+from pydantic_ai.models.function import FunctionModel
+from app.tools import ToolCache, ToolRegistry, ToolSpec
+
+def call_tools(*calls: tuple[str, dict]):
+    """A model calling the tools once, all in one response, then answering with what they returned."""
+    async def model(messages, info):
+        returns = [part for part in messages[-1].parts if isinstance(part, (ToolReturnPart, RetryPromptPart))]
+        if not returns:
+            return ModelResponse(parts=[
+                ToolCallPart.from_raw_args(name, args, f"call-{i}") for i, (name, args) in enumerate(calls)
+            ])
+        return ModelResponse.from_text(" | ".join(
+            str(part.content) if isinstance(part, ToolReturnPart) else "retry" for part in returns
+        ))
+    return FunctionModel(model)
+
+def new_registry(timeout: float = 5) -> ToolRegistry:
+    return ToolRegistry(cache=ToolCache(max_entries=10, ttl=60), threads=4, timeout=timeout)
+
+def test_blocking_tools_run_side_by_side():
+    registry = new_registry()
+
+    def lookup(city: str) -> str:
+        time.sleep(0.3)
+        return city.upper()
+
+    registry.register(ToolSpec("lookup", lookup))
+    agent = Agent(call_tools(("lookup", {"city": "oslo"}), ("lookup", {"city": "rome"})), tools=registry.tools(["lookup"]))
+    start = time.perf_counter()
+    result = asyncio.run(agent.run("weather?"))
+    elapsed = time.perf_counter() - start
+    registry.shutdown()
+    assert result.data == "OSLO | ROME"
+    assert elapsed < 0.5
+
+def test_timeout_asks_the_model_to_retry():
+    registry = new_registry(timeout=0.05)
+
+    async def slow() -> str:
+        await asyncio.sleep(1)
+        return "late"
+
+    registry.register(ToolSpec("slow", slow, max_retries=1))
+    agent = Agent(call_tools(("slow", {})), tools=registry.tools(["slow"]))
+    assert asyncio.run(agent.run("go")).data == "retry"
+
+def test_pure_tools_are_memoized():
+    registry = new_registry()
+    runs = {"square": 0, "roll": 0}
+
+    def square(n: int) -> int:
+        runs["square"] += 1
+        return n * n
+
+    def roll(n: int) -> int:
+        runs["roll"] += 1
+        return n
+
+    registry.register(ToolSpec("square", square, pure=True))
+    registry.register(ToolSpec("roll", roll))
+
+    async def main():
+        for _ in range(3):
+            assert await registry.call(registry.get("square"), (), {"n": 4}) == 16
+            await registry.call(registry.get("roll"), (), {"n": 4})
+        await registry.call(registry.get("square"), (), {"n": 5})
+
+    asyncio.run(main())
+    registry.shutdown()
+    assert runs == {"square": 2, "roll": 3}
+    assert registry.cache.stats.hits == 2
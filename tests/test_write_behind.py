@@ -0,0 +1,65 @@
+import asyncio
+from pydantic_ai.messages import ModelRequest, ModelResponse, TextPart, UserPromptPart
+from sqlmodel import Session
+from app.agents.history import get_or_create_thread, load_history
+from app.agents.write_behind import WriteBehindQueue
+
+KEY = ("user", "full")
+
+def turn(prompt: str) -> list:
+    return [ModelRequest(parts=[UserPromptPart(content=prompt)]), ModelResponse(parts=[TextPart(content=f"re: {prompt}")])]
+
+def prompts(database, thread_id: int) -> list[str]:
+    with Session(database) as session:
+        return [part.content for message in load_history(session, thread_id) for part in message.parts if isinstance(part, UserPromptPart)]
+
+def new_thread(database) -> int:
+    with Session(database) as session:
+        thread = get_or_create_thread(session, *KEY)
+        session.commit()
+        return thread.id
+
+def test_wait_for_written(database, run, tmp_path):
+    thread_id = new_thread(database)
+
+    async def main():
+        queue = WriteBehindQueue(str(tmp_path / "outbox.jsonl"), max_size=10, batch_size=5, fsync=False)
+        await queue.start()
+        for prompt in ("one", "two", "three"):
+            await queue.put(KEY, thread_id, turn(prompt))
+        await queue.wait_for(KEY)
+        assert prompts(database, thread_id) == ["one", "two", "three"]
+        await queue.stop()
+        # Everything was acknowledged, so the outbox starts over
+        assert queue.outbox_path.read_text() == ""
+    run(main())
+
+def test_replay_after_crash(database, run, tmp_path):
+    thread_id = new_thread(database)
+    outbox = tmp_path / "outbox.jsonl"
+
+    async def main():
+        crashed = WriteBehindQueue(str(outbox), max_size=10, batch_size=5, fsync=False)
+        await crashed.start()
+        await crashed.put(KEY, thread_id, turn("one"))
+        await crashed.wait_for(KEY)
+
+        # The database stops answering, and the process dies with turns queued
+        async def hang(batch):
+            await asyncio.Event().wait()
+        crashed._write = hang
+        await crashed.put(KEY, thread_id, turn("two"))
+        await crashed.put(KEY, thread_id, turn("three"))
+        crashed._worker.cancel()
+        with outbox.open("a") as f:
+            f.write('{"seq": 4, "key": ["user", "fu')  # Torn mid-write
+        assert prompts(database, thread_id) == ["one"]
+
+        queue = WriteBehindQueue(str(outbox), max_size=10, batch_size=5, fsync=False)
+        await queue.start()
+        await queue.wait_for(KEY)
+        await queue.stop()
+        # Replayed in order, without writing the acknowledged turn again
+        assert prompts(database, thread_id) == ["one", "two", "three"]
+        assert queue._seq == 3
+    run(main())